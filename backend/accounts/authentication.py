@@ -0,0 +1,109 @@
+"""
+JWT authentication with per-process caches.
+
+CachedJWTAuthentication behaves like simplejwt's JWTAuthentication, but:
+
+- it keeps a bounded LRU of raw access token -> validated token, so a
+  token's signature is checked once per process rather than per request.
+  Entries are not used past the token's expiry;
+- it builds request.user from a per-process snapshot of the user's row.
+  Snapshots live for settings.JWT_USER_CACHE_TTL seconds. The User signal
+  handlers in accounts/signals.py drop them as soon as a user is saved or
+  deleted in this process; other processes see the change within the TTL.
+
+Every request gets its own User instance built from the snapshot, so state
+pinned on request.user (such as the permission table) is never shared.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import User
+
+# Upper bounds on the entries kept per process
+MAX_TOKENS = 10000
+MAX_USERS = 10000
+
+USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+
+_lock = threading.Lock()
+_tokens = OrderedDict()
+# user id -> (expires_at, values)
+_users = {}
+# Bumped by invalidate_cached_user so a load racing with a save is not kept.
+# One counter for every user keeps this O(1); a load that overlaps any
+# user's save is just not cached.
+_generation = 0
+
+
+def user_cache_ttl():
+    return getattr(settings, 'JWT_USER_CACHE_TTL', 30)
+
+
+def invalidate_cached_user(user_id):
+    global _generation
+    with _lock:
+        _users.pop(user_id, None)
+        _generation += 1
+
+
+def get_cached_user(user_id):
+    """A fresh User instance for the id, from the snapshot cache; None if there is no such user"""
+    entry = _users.get(user_id)
+    if entry is None or entry[0] < time.monotonic():
+        generation = _generation
+        values = User.objects.filter(pk=user_id).values_list(*USER_FIELDS).first()
+        if values is None:
+            return None
+        entry = (time.monotonic() + user_cache_ttl(), values)
+        with _lock:
+            if _generation == generation:
+                if len(_users) >= MAX_USERS:
+                    _users.clear()
+                _users[user_id] = entry
+    return User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, entry[1])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_validated_token(self, raw_token):
+        with _lock:
+            token = _tokens.get(raw_token)
+            if token is not None:
+                if token['exp'] > time.time():
+                    _tokens.move_to_end(raw_token)
+                    return token
+                del _tokens[raw_token]
+
+        token = super().get_validated_token(raw_token)
+        with _lock:
+            _tokens[raw_token] = token
+            while len(_tokens) > MAX_TOKENS:
+                _tokens.popitem(last=False)
+        return token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,157 @@
+"""
+Cold archive for soft-deleted comments.
+
+archive_deleted_comments moves comments that were soft-deleted (is_deleted,
+with modified_at as the deletion time) before a cutoff into ArchivedComment,
+together with their CommentHistory rows, in bounded batches of one
+transaction each. Ids are preserved, so delta-stored history chains stay
+valid and a restored comment keeps its id.
+
+History reads go through comment_pages(), history_entries() and
+latest_history_entries(), which look in the archive for comments no longer
+in the hot table.
+"""
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .comment_stats import comment_restored, forget_comments
+from .models import ArchivedComment, ArchivedCommentHistory, Comment, CommentHistory
+
+COMMENT_FIELDS = ('id', 'user_id', 'page_name', 'content', 'created_at', 'modified_at', 'modified_by_id')
+HISTORY_FIELDS = (
+    'id', 'comment_id', 'user_id', 'action', 'old_content', 'new_content', 'timestamp',
+    'storage', 'delta_base_id', 'old_delta', 'new_delta',
+)
+
+
+def archive_batch(cutoff, batch_size):
+    """Archive up to batch_size comments deleted before cutoff; returns (comments, history rows)"""
+    with transaction.atomic():
+        rows = list(
+            Comment.objects.filter(is_deleted=True, modified_at__lt=cutoff)
+            .order_by('modified_at', 'id')
+            .values(*COMMENT_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0, 0
+        ids = [row['id'] for row in rows]
+        ArchivedComment.objects.bulk_create(ArchivedComment(**row) for row in rows)
+
+        history = CommentHistory.objects.filter(comment_id__in=ids).order_by('id').values(*HISTORY_FIELDS)
+        archived_history = ArchivedCommentHistory.objects.bulk_create(
+            (ArchivedCommentHistory(**row) for row in history), batch_size=500
+        )
+
+        hot = Comment.objects.filter(id__in=ids)
+        forget_comments(hot)
+        hot.delete()
+    return len(rows), len(archived_history)
+
+
+def archive_deleted_comments(cutoff, batch_size=500, max_batches=None):
+    """Archive in batches until nothing is left (or max_batches ran); yields per-batch counts"""
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        comments, history = archive_batch(cutoff, batch_size)
+        if not comments:
+            return
+        batches += 1
+        yield comments, history
+
+
+def comment_pages(comment_ids):
+    """
+    Map comment ids to page names, looking in the archive for ids not in the
+    hot table. Returns (pages, archived_ids).
+    """
+    comment_ids = set(comment_ids)
+    pages = dict(Comment.objects.filter(id__in=comment_ids).values_list('id', 'page_name'))
+    missing = comment_ids - set(pages)
+    archived = {}
+    if missing:
+        archived = dict(ArchivedComment.objects.filter(id__in=missing).values_list('id', 'page_name'))
+        pages.update(archived)
+    return pages, set(archived)
+
+
+def history_entries(comment_id, archived=False):
+    """History of one comment from the table that holds it"""
+    model = ArchivedCommentHistory if archived else CommentHistory
+    return model.objects.filter(comment_id=comment_id).select_related('user')
+
+
+def latest_history_entries(comment_ids, limit, archived_ids=()):
+    """The newest `limit` history entries of each comment, ordered by comment, newest first"""
+    entries = []
+    hot_ids = set(comment_ids) - set(archived_ids)
+    archived_ids = set(comment_ids) & set(archived_ids)
+    for model, ids in ((CommentHistory, hot_ids), (ArchivedCommentHistory, archived_ids)):
+        if not ids:
+            continue
+        entries += list(
+            model.objects.filter(comment_id__in=ids)
+            .select_related('user')
+            .annotate(position=Window(
+                RowNumber(),
+                partition_by=[F('comment_id')],
+                order_by=[F('timestamp').desc(), F('id').desc()],
+            ))
+            .filter(position__lte=limit)
+            .order_by('comment_id', '-timestamp', '-id')
+        )
+    if archived_ids and hot_ids:
+        entries.sort(key=lambda entry: entry.comment_id)
+    return entries
+
+
+def restore_comment(comment_id, user):
+    """
+    Bring a deleted comment back as a live comment, from the hot table or
+    the archive. Returns the comment, or None when it does not exist.
+    """
+    with transaction.atomic():
+        comment = Comment.objects.filter(id=comment_id).first()
+        if comment is not None:
+            if not comment.is_deleted:
+                return comment
+            comment.is_deleted = False
+            comment.save()
+            was_archived = False
+        else:
+            archived = ArchivedComment.objects.filter(id=comment_id).first()
+            if archived is None:
+                return None
+            comment = _unarchive(archived)
+            was_archived = True
+
+        CommentHistory.objects.create(
+            comment=comment,
+            user=user,
+            action='RESTORE',
+            new_content=comment.content,
+        )
+        comment_restored(comment, was_archived)
+    return comment
+
+
+def _unarchive(archived):
+    fields = {field: getattr(archived, field) for field in COMMENT_FIELDS}
+    comment = Comment.objects.create(**fields, is_deleted=False)
+    # auto_now/auto_now_add overwrote the original timestamps on insert
+    Comment.objects.filter(id=comment.id).update(created_at=archived.created_at, modified_at=timezone.now())
+    comment.refresh_from_db(fields=['created_at', 'modified_at'])
+
+    history = [
+        CommentHistory(**{field: getattr(row, field) for field in HISTORY_FIELDS})
+        for row in ArchivedCommentHistory.objects.filter(comment_id=archived.id).order_by('id')
+    ]
+    timestamps = {row.id: row.timestamp for row in history}
+    CommentHistory.objects.bulk_create(history, batch_size=500)
+    for row in history:
+        row.timestamp = timestamps[row.id]
+    CommentHistory.objects.bulk_update(history, ['timestamp'], batch_size=500)
+
+    archived.delete()
+    return comment
@@ -0,0 +1,378 @@
+"""
+Live comment events for the server-sent event stream.
+
+Every comment write path records a CommentEvent row in the same transaction
+as the write (through the helpers in accounts/comment_stats.py) and, once
+the transaction commits, publishes it to the process's broker. The table
+is the source of truth: streams replay it after a Last-Event-ID cursor
+when a client reconnects, and after a subscriber's queue overflows.
+
+Event ids are handed out when the row is inserted, not when it commits, so
+an event can become visible after events with higher ids. A stream's
+position is therefore an EventCursor: the newest id it has handled plus
+the lower ids it has not seen yet. Those are still delivered when they
+arrive, whether published live, polled or replayed, and the cursor is
+sent as the SSE id so a reconnecting client resumes with them.
+
+Two brokers are available through settings.COMMENT_EVENTS_BROKER:
+
+- 'local' (default) fans events out in memory to the streams served by
+  this process. This is enough for a single ASGI worker.
+- 'database' is a stand-in for a shared broker when several workers serve
+  streams: every subscription polls the CommentEvent table, so events
+  written by any worker reach every stream within
+  settings.COMMENT_EVENTS_POLL_INTERVAL seconds.
+
+Old events are removed by the prune_comment_events command.
+"""
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Comment, CommentEvent
+from .page_registry import get_page_registry
+from .permission_cache import get_permission_snapshot
+from .serializers import comment_list_values, serialize_comment_rows
+
+CREATED = 'created'
+EDITED = 'edited'
+DELETED = 'deleted'
+
+# Events, on any page, a reconnecting client may replay before it is told
+# to refetch
+REPLAY_LIMIT = 500
+
+# A cursor waits for at most MAX_GAPS missing ids, none more than
+# GAP_WINDOW ids below its newest one; older gaps are taken as rolled back
+GAP_WINDOW = 1000
+MAX_GAPS = 100
+
+# Events buffered per subscriber before it falls back to replaying the table
+QUEUE_SIZE = 1000
+
+# Seconds between keep-alive comments, which also re-check the user's pages
+HEARTBEAT_INTERVAL = 15
+
+# Streams are closed after this many seconds and the client reconnects with
+# Last-Event-ID, so a connection the server never saw close cannot linger
+STREAM_MAX_AGE = 300
+
+# Milliseconds a client waits before reconnecting
+RETRY_MS = 3000
+
+
+def broker_mode():
+    return getattr(settings, 'COMMENT_EVENTS_BROKER', 'local')
+
+
+def poll_interval():
+    return getattr(settings, 'COMMENT_EVENTS_POLL_INTERVAL', 2)
+
+
+def event_message(event):
+    """The dict streamed to clients; CommentEvent rows and published events share it"""
+    return {
+        'id': event.id,
+        'type': event.event_type,
+        'page_name': event.page_name,
+        'comment_id': event.comment_id,
+        **event.payload,
+    }
+
+
+def _payloads(comment_ids, event_type):
+    if event_type == DELETED:
+        return {comment_id: {} for comment_id in comment_ids}
+    rows = serialize_comment_rows(comment_list_values(Comment.objects.filter(id__in=comment_ids)))
+    return {row['id']: {'comment': row} for row in rows}
+
+
+def record_comment_events(comments, event_type):
+    """Write one event per comment and publish them after commit"""
+    comments = list(comments)
+    if not comments:
+        return []
+    payloads = _payloads([comment.id for comment in comments], event_type)
+    events = CommentEvent.objects.bulk_create(
+        CommentEvent(
+            comment_id=comment.id,
+            page_name=comment.page_name,
+            event_type=event_type,
+            payload=payloads.get(comment.id, {}),
+        )
+        for comment in comments
+    )
+    messages = [event_message(event) for event in events]
+    transaction.on_commit(lambda: get_broker().publish_many(messages))
+    return events
+
+
+def record_comment_event(comment, event_type):
+    return record_comment_events([comment], event_type)[0]
+
+
+class EventCursor:
+    """
+    A stream's position in the event table: the newest event id it has
+    handled and the ids below that it has not seen yet (gaps).
+    """
+
+    def __init__(self, last_id=0, gaps=()):
+        self.move_to(last_id, gaps)
+
+    @classmethod
+    def parse(cls, value):
+        """Read a cursor sent back as Last-Event-ID; raises ValueError"""
+        ids = [int(part) for part in value.split('.')]
+        return cls(ids[0], ids[1:])
+
+    def __str__(self):
+        return '.'.join(str(event_id) for event_id in [self.last_id, *sorted(self.gaps)])
+
+    def move_to(self, last_id, gaps=()):
+        self.last_id = last_id
+        self.gaps = set(gaps)
+        self._trim()
+
+    def advance(self, event_id):
+        """Record an event; returns False if the stream already handled it"""
+        if event_id > self.last_id:
+            self.gaps.update(range(max(self.last_id + 1, event_id - GAP_WINDOW), event_id))
+            self.last_id = event_id
+            self._trim()
+            return True
+        if event_id in self.gaps:
+            self.gaps.discard(event_id)
+            return True
+        return False
+
+    def _trim(self):
+        gaps = sorted(gap for gap in self.gaps if self.last_id - GAP_WINDOW < gap < self.last_id)
+        self.gaps = set(gaps[-MAX_GAPS:])
+
+
+def events_after(cursor, limit=REPLAY_LIMIT):
+    """Messages for events on any page that the cursor has not seen, oldest first"""
+    events = CommentEvent.objects.filter(Q(id__gt=cursor.last_id) | Q(id__in=set(cursor.gaps))).order_by('id')
+    return [event_message(event) for event in events[:limit]]
+
+
+def current_position():
+    """
+    (last_id, gaps) at the newest event. The gaps are the ids missing among
+    the latest events, which may belong to transactions still in flight.
+    """
+    ids = list(CommentEvent.objects.order_by('-id').values_list('id', flat=True)[:GAP_WINDOW])
+    if not ids:
+        return 0, set()
+    return ids[0], set(range(ids[-1], ids[0])) - set(ids)
+
+
+class Subscription:
+    """A bounded queue of messages for one stream, fed from any thread"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, message):
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Return the next message, or None when nothing arrived within timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self, cursor):
+        subscription = Subscription(self)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish_many(self, messages):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            for message in messages:
+                subscription.put(message)
+
+
+class PollingSubscription:
+    """Reads the events its stream's cursor has not seen straight from the CommentEvent table"""
+
+    def __init__(self, broker, cursor):
+        self.broker = broker
+        self.cursor = cursor
+        self.overflowed = False
+        self._pending = []
+
+    async def get(self, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self._pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(poll_interval(), remaining))
+            self._pending = await sync_to_async(self._fetch)()
+        # The stream advances the cursor as it handles each message
+        return self._pending.pop(0)
+
+    def _fetch(self):
+        return events_after(self.cursor, QUEUE_SIZE)
+
+    def close(self):
+        pass
+
+
+class DatabaseBroker:
+    def subscribe(self, cursor):
+        return PollingSubscription(self, cursor)
+
+    def publish_many(self, messages):
+        # The rows are already committed; subscriptions find them by polling
+        pass
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    mode = broker_mode()
+    broker = _brokers.get(mode)
+    if broker is None:
+        with _brokers_lock:
+            broker = _brokers.get(mode)
+            if broker is None:
+                broker = DatabaseBroker() if mode == 'database' else LocalBroker()
+                _brokers[mode] = broker
+    return broker
+
+
+def viewable_page_names(user_id, requested=None):
+    """Names of the pages whose comments the user may see, optionally narrowed"""
+    snapshot = get_permission_snapshot(user_id)
+    if snapshot is None or not snapshot['is_active']:
+        return set()
+    if snapshot['is_superuser']:
+        names = {name for name, _ in Comment.PAGE_CHOICES}
+    else:
+        registry = get_page_registry()
+        names = set()
+        for page_id, can_view, *_ in snapshot['permissions']:
+            page = registry.get_by_id(page_id)
+            if can_view and page is not None:
+                names.add(page.name)
+    if requested:
+        names &= set(requested)
+    return names
+
+
+def format_event(message, cursor):
+    # The SSE id is the cursor to resume from; the event's own id is in the data
+    data = json.dumps(message, separators=(',', ':'))
+    return f"id: {cursor}\nevent: {message['type']}\ndata: {data}\n\n"
+
+
+def _reset_event(cursor):
+    # Tells the client its cursor is too old to replay and it should refetch
+    return f'id: {cursor}\nevent: reset\ndata: {{}}\n\n'
+
+
+def _replay(cursor, page_names):
+    """Return the chunks bringing a client up to date, advancing the cursor"""
+    # The cursor's newest id was an event the client handled; if that event
+    # is gone it was pruned, along with whatever the client missed after it
+    if cursor.last_id and not CommentEvent.objects.filter(id=cursor.last_id).exists():
+        cursor.move_to(*current_position())
+        return [_reset_event(cursor)]
+    messages = events_after(cursor, REPLAY_LIMIT + 1)
+    if len(messages) > REPLAY_LIMIT:
+        cursor.move_to(*current_position())
+        return [_reset_event(cursor)]
+    return [
+        format_event(message, cursor)
+        for message in messages
+        if cursor.advance(message['id']) and message['page_name'] in page_names
+    ]
+
+
+async def stream_comment_events(user_id, requested_pages=None, cursor=None):
+    """
+    Yield server-sent event chunks for comments on the pages the user can view.
+
+    Without a cursor the stream starts at the newest event; with one (an
+    EventCursor), missed events are replayed first. The stream ends after
+    STREAM_MAX_AGE seconds or as soon as the user can no longer view any page.
+    """
+    loop = asyncio.get_running_loop()
+    closes_at = loop.time() + STREAM_MAX_AGE
+    if cursor is None:
+        cursor = EventCursor(*await sync_to_async(current_position)())
+    # Subscribe before replaying so nothing committed in between is missed
+    subscription = get_broker().subscribe(cursor)
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        page_names = await sync_to_async(viewable_page_names)(user_id, requested_pages)
+        if not page_names:
+            return
+        for chunk in await sync_to_async(_replay)(cursor, page_names):
+            yield chunk
+
+        while loop.time() < closes_at:
+            message = await subscription.get(min(HEARTBEAT_INTERVAL, closes_at - loop.time()))
+            if subscription.overflowed:
+                # Dropped messages are still in the table
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.overflowed = False
+                for chunk in await sync_to_async(_replay)(cursor, page_names):
+                    yield chunk
+                continue
+            if message is None:
+                page_names = await sync_to_async(viewable_page_names)(user_id, requested_pages)
+                if not page_names:
+                    return
+                yield ': keep-alive\n\n'
+                continue
+            if not cursor.advance(message['id']):
+                continue
+            if message['page_name'] in page_names:
+                yield format_event(message, cursor)
+    finally:
+        subscription.close()
+
+
+def prune_events(older_than):
+    """Delete events created before `older_than`; clients behind them get a reset"""
+    deleted, _ = CommentEvent.objects.filter(created_at__lt=older_than).delete()
+    return deleted
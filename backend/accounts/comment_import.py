@@ -0,0 +1,287 @@
+"""
+Streaming import of comments (and their history) from another system.
+
+Input is read lazily, one record at a time, from JSONL or CSV:
+
+- JSONL: one object per line with user_email, page_name, content and
+  optionally created_at, modified_at, modified_by_email, is_deleted and a
+  "history" list of {user_email, action, old_content, new_content,
+  timestamp} objects, oldest first.
+- CSV: a header row with the same column names; "history" holds the list
+  as a JSON string.
+
+Records are inserted with bulk_create in chunks, several chunks per
+transaction. bulk_create stamps the auto_now/auto_now_add fields with the
+current time, so the source timestamps are written back with one
+bulk_update per chunk. Each transaction also advances a CommentImportCheckpoint
+row, so an interrupted run resumes after the last committed record.
+Memory use is bounded by the chunk size and the email -> id map of users.
+"""
+import csv
+import json
+from datetime import timezone as dt_timezone
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .conditional import bump_comment_list_version
+from .history_storage import DELTA, plan_storage, snapshot_interval, storage_mode
+from .models import Comment, CommentHistory, CommentImportCheckpoint, User
+
+PAGE_NAMES = {name for name, _ in Comment.PAGE_CHOICES}
+ACTIONS = {action for action, _ in CommentHistory.ACTION_CHOICES}
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def read_records(path, input_format=None):
+    """Yield raw records (JSONL lines or CSV row dicts) from the file"""
+    input_format = input_format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    if input_format == 'csv':
+        return read_csv(path)
+    return read_jsonl(path)
+
+
+def load_user_map():
+    """Lower-cased email -> user id for every user"""
+    return {email.lower(): user_id for email, user_id in User.objects.values_list('email', 'id')}
+
+
+def _string(value, field):
+    """A text field as given, or None; JSON may hold any type there"""
+    if value is not None and not isinstance(value, str):
+        raise InvalidRecord(f'{field} must be a string')
+    return value
+
+
+def _user_id(users, email, field, required=True):
+    email = _string(email, field)
+    if not email:
+        if required:
+            raise InvalidRecord(f'{field} is required')
+        return None
+    user_id = users.get(email.strip().lower())
+    if user_id is None:
+        raise InvalidRecord(f'Unknown {field} {email!r}')
+    return user_id
+
+
+def _datetime(value, field, default):
+    value = _string(value, field)
+    if not value:
+        return default
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise InvalidRecord(f'Invalid {field} {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def _bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def parse_record(raw, users):
+    """Turn a raw record into (Comment, [CommentHistory]) or raise InvalidRecord"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raise InvalidRecord('Invalid JSON')
+    if not isinstance(raw, dict):
+        raise InvalidRecord('Record must be an object')
+
+    page_name = _string(raw.get('page_name'), 'page_name')
+    if page_name not in PAGE_NAMES:
+        raise InvalidRecord(f'Unknown page_name {page_name!r}')
+    content = _string(raw.get('content'), 'content')
+    if not content:
+        raise InvalidRecord('content is required')
+
+    now = timezone.now()
+    created_at = _datetime(raw.get('created_at'), 'created_at', now)
+    comment = Comment(
+        user_id=_user_id(users, raw.get('user_email'), 'user_email'),
+        page_name=page_name,
+        content=content,
+        created_at=created_at,
+        modified_at=_datetime(raw.get('modified_at'), 'modified_at', created_at),
+        modified_by_id=_user_id(users, raw.get('modified_by_email'), 'modified_by_email', required=False),
+        is_deleted=_bool(raw.get('is_deleted', False)),
+    )
+
+    history = raw.get('history') or []
+    if isinstance(history, str):
+        try:
+            history = json.loads(history)
+        except ValueError:
+            raise InvalidRecord('Invalid history JSON')
+    if not isinstance(history, list):
+        raise InvalidRecord('history must be a list')
+    entries = []
+    for item in history:
+        if not isinstance(item, dict):
+            raise InvalidRecord('history entries must be objects')
+        action = _string(item.get('action'), 'history action')
+        if action not in ACTIONS:
+            raise InvalidRecord(f'Unknown history action {action!r}')
+        entries.append(CommentHistory(
+            user_id=_user_id(users, item.get('user_email'), 'history user_email'),
+            action=action,
+            old_content=_string(item.get('old_content'), 'history old_content'),
+            new_content=_string(item.get('new_content'), 'history new_content'),
+            timestamp=_datetime(item.get('timestamp'), 'history timestamp', created_at),
+        ))
+    return comment, entries
+
+
+# Fields bulk_create overwrites with the current time
+COMMENT_TIMESTAMPS = ['created_at', 'modified_at']
+HISTORY_TIMESTAMPS = ['timestamp']
+
+
+def _read_timestamps(objs, fields):
+    return [[getattr(obj, field) for field in fields] for obj in objs]
+
+
+def _write_timestamps(model, objs, fields, values):
+    """Put the source timestamps back on inserted rows"""
+    for obj, row in zip(objs, values):
+        for field, value in zip(fields, row):
+            setattr(obj, field, value)
+    model.objects.bulk_update(objs, fields, batch_size=500)
+
+
+def _insert_history(chains):
+    """
+    bulk_create history chains (lists of CommentHistory, oldest first).
+
+    In delta mode the rows are inserted one chain position at a time, so
+    each row's base already has an id and its storage is planned before
+    the insert, without rewriting anything afterwards.
+    """
+    if storage_mode() != DELTA:
+        history = [entry for chain in chains for entry in chain]
+        CommentHistory.objects.bulk_create(history, batch_size=500)
+        return len(history)
+
+    interval = snapshot_interval()
+    previous = [(None, None, 0)] * len(chains)
+    inserted = 0
+    position = 0
+    while True:
+        level = [(index, chain[position]) for index, chain in enumerate(chains) if len(chain) > position]
+        if not level:
+            return inserted
+        texts = []
+        for index, entry in level:
+            previous_id, previous_texts, depth = previous[index]
+            entry.storage, entry.delta_base_id, entry.old_delta, entry.new_delta = plan_storage(
+                previous_id, previous_texts, depth, entry.old_content, entry.new_content, interval,
+            )
+            texts.append((entry.old_content, entry.new_content))
+            if entry.storage == DELTA:
+                entry.old_content = entry.new_content = None
+        CommentHistory.objects.bulk_create([entry for _, entry in level], batch_size=500)
+        for (index, entry), entry_texts in zip(level, texts):
+            depth = 1 if entry.storage != DELTA else previous[index][2] + 1
+            previous[index] = (entry.id, entry_texts, depth)
+        inserted += len(level)
+        position += 1
+
+
+def insert_chunk(parsed):
+    """bulk_create one chunk of (Comment, [CommentHistory]) pairs; returns (comments, history rows)"""
+    comments = [comment for comment, _ in parsed]
+    history = [entry for _, entries in parsed for entry in entries]
+    comment_timestamps = _read_timestamps(comments, COMMENT_TIMESTAMPS)
+    history_timestamps = _read_timestamps(history, HISTORY_TIMESTAMPS)
+
+    Comment.objects.bulk_create(comments)
+    chains = []
+    for comment, (_, entries) in zip(comments, parsed):
+        for entry in entries:
+            entry.comment_id = comment.id
+        if entries:
+            chains.append(entries)
+    history_created = _insert_history(chains)
+
+    _write_timestamps(Comment, comments, COMMENT_TIMESTAMPS, comment_timestamps)
+    _write_timestamps(CommentHistory, history, HISTORY_TIMESTAMPS, history_timestamps)
+    return len(comments), history_created
+
+
+def get_checkpoint(name, restart=False):
+    checkpoint, _ = CommentImportCheckpoint.objects.get_or_create(name=name)
+    if restart:
+        checkpoint.records_read = checkpoint.comments_created = 0
+        checkpoint.history_created = checkpoint.skipped = 0
+        checkpoint.completed = False
+        checkpoint.save()
+    return checkpoint
+
+
+def import_comments(records, checkpoint, chunk_size=1000, chunks_per_transaction=10, on_error=None):
+    """
+    Import raw records, skipping the ones the checkpoint already covers.
+
+    Yields the checkpoint after every committed transaction. Invalid records
+    are counted as skipped and passed to on_error(position, error).
+    """
+    users = load_user_map()
+    records = islice(records, checkpoint.records_read, None)
+    position = checkpoint.records_read
+    pages = set()
+
+    while True:
+        batch = list(islice(records, chunk_size * chunks_per_transaction))
+        if not batch:
+            break
+        comments_created = history_created = skipped = 0
+        with transaction.atomic():
+            for start in range(0, len(batch), chunk_size):
+                parsed = []
+                for raw in batch[start:start + chunk_size]:
+                    position += 1
+                    try:
+                        parsed.append(parse_record(raw, users))
+                    except InvalidRecord as e:
+                        skipped += 1
+                        if on_error is not None:
+                            on_error(position, e)
+                if parsed:
+                    pages.update(comment.page_name for comment, _ in parsed)
+                    created, history = insert_chunk(parsed)
+                    comments_created += created
+                    history_created += history
+
+            checkpoint.records_read = position
+            checkpoint.comments_created += comments_created
+            checkpoint.history_created += history_created
+            checkpoint.skipped += skipped
+            checkpoint.save()
+        yield checkpoint
+
+    checkpoint.completed = True
+    checkpoint.save(update_fields=['completed', 'updated_at'])
+    for page_name in pages:
+        bump_comment_list_version(page_name)
@@ -0,0 +1,107 @@
+"""
+Maintenance of the PageCommentStats counters.
+
+Every comment write path calls one of these helpers inside the same
+transaction as the write, so the counters move together with the rows.
+The rebuild_comment_stats command recomputes them from scratch when they
+have drifted (for example after raw SQL or bulk imports). The same helpers
+bump the page's comment list version used for ETags and record the live
+comment events streamed to clients.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from . import comment_events
+from .conditional import bump_comment_list_version
+from .models import Comment, PageCommentStats
+
+
+def record_comment_activity(page_name, live=0, deleted=0, at=None):
+    """Adjust a page's counters and bump its last activity time"""
+    at = at or timezone.now()
+    bump_comment_list_version(page_name)
+    updated = PageCommentStats.objects.filter(page_name=page_name).update(
+        live_count=F('live_count') + live,
+        deleted_count=F('deleted_count') + deleted,
+        last_activity_at=at,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            PageCommentStats.objects.create(
+                page_name=page_name,
+                live_count=max(live, 0),
+                deleted_count=max(deleted, 0),
+                last_activity_at=at,
+            )
+    except IntegrityError:
+        # Another request created the row first
+        record_comment_activity(page_name, live, deleted, at)
+
+
+def comment_created(comment):
+    record_comment_activity(comment.page_name, live=1, at=comment.created_at)
+    comment_events.record_comment_event(comment, comment_events.CREATED)
+
+
+def comment_edited(comment):
+    record_comment_activity(comment.page_name, at=comment.modified_at)
+    comment_events.record_comment_event(comment, comment_events.EDITED)
+
+
+def comment_deleted(comment):
+    record_comment_activity(comment.page_name, live=-1, deleted=1)
+    comment_events.record_comment_event(comment, comment_events.DELETED)
+
+
+def comment_restored(comment, was_archived=False):
+    # Archived comments were already taken out of deleted_count
+    record_comment_activity(comment.page_name, live=1, deleted=0 if was_archived else -1)
+    comment_events.record_comment_event(comment, comment_events.CREATED)
+
+
+def comments_deleted(comments):
+    """Bulk counterpart of comment_deleted for comments soft-deleted with one UPDATE"""
+    comments = list(comments)
+    for page_name, count in Counter(comment.page_name for comment in comments).items():
+        record_comment_activity(page_name, live=-count, deleted=count)
+    comment_events.record_comment_events(comments, comment_events.DELETED)
+
+
+def forget_comments(queryset):
+    """Take comments that are about to be hard-deleted out of the counters"""
+    totals = queryset.values('page_name').annotate(
+        live=Count('id', filter=Q(is_deleted=False)),
+        deleted=Count('id', filter=Q(is_deleted=True)),
+    )
+    for row in totals:
+        bump_comment_list_version(row['page_name'])
+        PageCommentStats.objects.filter(page_name=row['page_name']).update(
+            live_count=F('live_count') - row['live'],
+            deleted_count=F('deleted_count') - row['deleted'],
+        )
+
+
+def rebuild_comment_stats(comment_model=Comment, stats_model=PageCommentStats):
+    """Recompute every page's counters with one GROUP BY over the comment table"""
+    totals = comment_model.objects.order_by().values('page_name').annotate(
+        live=Count('id', filter=Q(is_deleted=False)),
+        deleted=Count('id', filter=Q(is_deleted=True)),
+        last_activity=Max('modified_at'),
+    )
+    with transaction.atomic():
+        stats_model.objects.all().delete()
+        stats_model.objects.bulk_create(
+            stats_model(
+                page_name=row['page_name'],
+                live_count=row['live'],
+                deleted_count=row['deleted'],
+                last_activity_at=row['last_activity'],
+            )
+            for row in totals
+        )
+    return len(totals)
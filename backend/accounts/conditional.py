@@ -0,0 +1,112 @@
+"""
+Conditional GET for the comment list and page listing endpoints.
+
+A response is tagged with the versions (see accounts/versioning.py) of
+everything its body is built from: the page's comment list, the comment
+authors' display fields, the page registry and the user's permissions.
+The ETag is a hash of those versions plus the request parameters, so it
+can be computed, and a matching If-None-Match answered with 304, before
+any comment query or serialization runs. Last-Modified is the time of the
+newest of those versions.
+
+Versions are read before the data they describe and bumped again after
+commit, so a tag can be older than its body but never newer. They are kept
+in the cache shared by every worker (see CACHES in config/settings.py), so
+a change made through one worker stops the others answering 304.
+"""
+import hashlib
+
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .permission_cache import VERSION_KEY as PERMISSION_VERSION_KEY, get_permission_version
+from .permission_table import get_permission_table
+from .versioning import bump_version, get_versions, version_datetime
+
+COMMENT_LIST_VERSION_KEY = 'comment_list_version_{page_name}'
+COMMENT_AUTHORS_VERSION_KEY = 'comment_authors_version'
+
+
+def _bump_now_and_on_commit(key):
+    bump_version(key)
+    transaction.on_commit(lambda: bump_version(key))
+
+
+def bump_comment_list_version(page_name):
+    """Called from every comment write path through accounts/comment_stats.py"""
+    _bump_now_and_on_commit(COMMENT_LIST_VERSION_KEY.format(page_name=page_name))
+
+
+def bump_comment_authors_version():
+    """Author names and emails are embedded in every comment list"""
+    _bump_now_and_on_commit(COMMENT_AUTHORS_VERSION_KEY)
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return '"%s"' % digest
+
+
+def _last_modified(*versions):
+    return version_datetime(max(versions))
+
+
+def comment_list_validators(request, page_name, page_size):
+    """
+    Return (etag, last_modified) for one page of a comment list.
+
+    The user's permission version is read in the same cache round trip and
+    used to pin their permission table, so the permission check that
+    follows does not need another lookup.
+    """
+    permission_key = PERMISSION_VERSION_KEY.format(user_id=request.user.pk)
+    list_key = COMMENT_LIST_VERSION_KEY.format(page_name=page_name)
+    versions = get_versions([permission_key, list_key, COMMENT_AUTHORS_VERSION_KEY])
+    get_permission_table(request.user, versions[permission_key])
+
+    list_version = versions[list_key]
+    authors_version = versions[COMMENT_AUTHORS_VERSION_KEY]
+    etag = make_etag(
+        'comments', page_name, list_version, authors_version,
+        request.query_params.get('cursor', ''), page_size,
+    )
+    return etag, _last_modified(list_version, authors_version)
+
+
+def accessible_pages_validators(user, registry):
+    """Return (etag, last_modified, permission_version) for a user's page list"""
+    permission_version = get_permission_version(user.pk)
+    etag = make_etag('accessible-pages', user.pk, user.role, permission_version, registry.version)
+    return etag, _last_modified(permission_version, registry.version), permission_version
+
+
+def pages_validators(registry):
+    """Return (etag, last_modified) for the full page list"""
+    return make_etag('pages', registry.version), _last_modified(registry.version)
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    # If-None-Match uses the weak comparison
+    return '*' in etags or etag in etags or 'W/' + etag in etags
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Responses differ per user, and clients must revalidate before reuse
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """Return a 304 response when the client's copy is current, else None"""
+    if etag_matches(request, etag):
+        return set_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+    return None
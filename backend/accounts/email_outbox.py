@@ -0,0 +1,124 @@
+"""
+Outbox for email sent on behalf of requests (OTP codes, notifications).
+
+Views call enqueue_email(), which only inserts an OutboxEmail row, so a
+slow or unreachable mail server never holds up a request. The
+send_outbox_email command delivers the queue:
+
+- each batch of due messages is claimed by pushing its next_attempt_at
+  past the time a send may take, so several workers can run, and messages
+  held by a worker that died are picked up again;
+- a batch is sent over one connection of the configured EMAIL_BACKEND;
+- a message that fails is retried after a delay that doubles with each
+  attempt, up to EMAIL_OUTBOX_MAX_ATTEMPTS, and is then marked failed.
+  The last error is kept on the row.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+# Seconds a claimed batch stays with its worker before others may retry it
+CLAIM_TIMEOUT = 300
+
+
+def max_attempts():
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+
+def retry_delay():
+    return getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 30)
+
+
+def max_retry_delay():
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_RETRY_DELAY', 3600)
+
+
+def enqueue_email(subject, body, recipients, from_email=None):
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before the next try of a message that failed `attempts` times"""
+    return min(retry_delay() * 2 ** (attempts - 1), max_retry_delay())
+
+
+def claim_batch(limit):
+    """Take up to `limit` due messages for this worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:limit]
+        )
+        if messages:
+            OutboxEmail.objects.filter(id__in=[message.id for message in messages]).update(
+                next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT)
+            )
+    return messages
+
+
+def _failed(message, error, now):
+    message.attempts += 1
+    message.last_error = f'{type(error).__name__}: {error}'
+    if message.attempts >= max_attempts():
+        message.status = OutboxEmail.FAILED
+    else:
+        message.next_attempt_at = now + timedelta(seconds=backoff(message.attempts))
+
+
+def deliver(messages):
+    """Send claimed messages over one connection and record the outcome; returns (sent, failed)"""
+    sent = failed = 0
+    try:
+        connection = get_connection()
+        connection.open()
+    except Exception as e:
+        # Nothing could be sent; every message is retried later
+        now = timezone.now()
+        for message in messages:
+            _failed(message, e, now)
+        failed = len(messages)
+    else:
+        try:
+            for message in messages:
+                email = EmailMessage(
+                    message.subject, message.body, message.from_email, message.recipients,
+                    connection=connection,
+                )
+                try:
+                    email.send()
+                except Exception as e:
+                    _failed(message, e, timezone.now())
+                    failed += 1
+                else:
+                    message.status = OutboxEmail.SENT
+                    message.sent_at = timezone.now()
+                    message.attempts += 1
+                    message.last_error = ''
+                    sent += 1
+        finally:
+            connection.close()
+
+    OutboxEmail.objects.bulk_update(
+        messages, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+    )
+    return sent, failed
+
+
+def process_outbox(batch_size=100):
+    """Claim and send one batch; returns (sent, failed), (0, 0) when nothing is due"""
+    messages = claim_batch(batch_size)
+    if not messages:
+        return 0, 0
+    return deliver(messages)
@@ -0,0 +1,85 @@
+"""
+Password hashers whose cost is read from settings.
+
+They keep the algorithm names of Django's built-in hashers, so existing
+hashes stay valid, but take their parameters from PASSWORD_SCRYPT_*,
+PASSWORD_PBKDF2_ITERATIONS and PASSWORD_ARGON2_* (see config/settings.py).
+The first entry of PASSWORD_HASHERS is used for new hashes. When a user
+logs in with a hash made by another hasher, or with other parameters, the
+password is hashed again with the current ones, in the hashing pool, when
+needs_rehash() says so (see hashing_pool.verify_password and
+async_login_view). Changing the preferred hasher therefore costs every
+existing account one extra hash on its next login; see PASSWORD_HASHERS
+in config/settings.py. Measure the cost of a setting with
+`manage.py bench_login`.
+"""
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+def needs_rehash(encoded):
+    """Whether a hash was made by another hasher, or with other parameters, than the preferred one"""
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+class TunedScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', 2**14)
+
+    @property
+    def block_size(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_BLOCK_SIZE', 8)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_PARALLELISM', 1)
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(),
+            salt=salt.encode(),
+            n=n,
+            r=r,
+            p=p,
+            # OpenSSL refuses more than 32 MB unless told otherwise, which
+            # rules out n = 2**15 with r = 8; allow what these parameters need
+            maxmem=128 * r * (n + p + 2) + 2**16,
+            dklen=64,
+        )
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
+
+
+class TunedPBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
+
+
+class TunedArgon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Needs the argon2-cffi package"""
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_TIME_COST', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_ARGON2_PARALLELISM', hashers.Argon2PasswordHasher.parallelism)
@@ -0,0 +1,134 @@
+"""
+Bounded pool for password hashing.
+
+Hashing a password is deliberately slow, so it is kept off the threads
+that serve requests. The async login and password change views await
+run() and the sync views that set passwords call run_sync(); both hand
+the work to one process-wide thread pool of PASSWORD_HASHING_WORKERS
+threads. PBKDF2 and scrypt run in hashlib without holding the GIL, so the
+threads hash in parallel. The sync login views check passwords with
+verify_password(), which also upgrades outdated hashes through the pool.
+
+At most PASSWORD_HASHING_QUEUE_LIMIT jobs may be running or waiting at
+once. Beyond that, run() and run_sync() raise HashingPoolSaturated, which
+the views answer with 503 straight away, so a burst of logins waits in a
+short queue instead of taking every worker from the cheap endpoints.
+
+Jobs should only hash: call django.contrib.auth.hashers functions with
+the raw and encoded passwords, not methods that also save the user.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .hashers import needs_rehash
+
+# Seconds clients are asked to wait after a 503
+RETRY_AFTER = 1
+
+
+class HashingPoolSaturated(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The server is busy, please retry shortly.'
+    default_code = 'hashing_pool_saturated'
+    # Sent as Retry-After by DRF's exception handler
+    wait = RETRY_AFTER
+
+
+def pool_size():
+    return getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or min(4, os.cpu_count() or 1)
+
+
+def queue_limit():
+    return getattr(settings, 'PASSWORD_HASHING_QUEUE_LIMIT', None) or 4 * pool_size()
+
+
+_lock = threading.Lock()
+_executor = None
+_in_flight = 0
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix='password-hashing')
+    return _executor
+
+
+def _release():
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+
+
+def _job(fn, args):
+    # The slot is held until the job itself finishes, even if its caller
+    # gave up, and is given back before the caller sees the result, so it
+    # can submit again at once
+    try:
+        return fn(*args)
+    finally:
+        _release()
+
+
+def submit(fn, *args):
+    """Queue fn(*args) on the pool and return its future, or raise HashingPoolSaturated"""
+    global _in_flight
+    executor = _get_executor()
+    with _lock:
+        if _in_flight >= queue_limit():
+            raise HashingPoolSaturated()
+        _in_flight += 1
+    try:
+        return executor.submit(_job, fn, args)
+    except BaseException:
+        _release()
+        raise
+
+
+async def run(fn, *args):
+    return await asyncio.wrap_future(submit(fn, *args))
+
+
+def run_sync(fn, *args):
+    return submit(fn, *args).result()
+
+
+def verify_password(user, password):
+    """
+    Whether `password` is the user's, checked in the pool. With no user a
+    password is hashed anyway, so unknown emails take as long as wrong
+    passwords. A hash made with other settings is upgraded and saved, unless
+    the pool is full. Raises HashingPoolSaturated, which the views answer
+    with 503.
+
+    Used by the sync login views (login_view, login_superadmin, login_user).
+    The pool bounds how many hashes run at once, but the calling request
+    thread still waits for its result; async_login_view awaits run()
+    instead and is the supported path when logins must not hold workers.
+    """
+    if user is None:
+        run_sync(make_password, password)
+        return False
+    if not run_sync(check_password, password, user.password):
+        return False
+    if needs_rehash(user.password):
+        try:
+            user.password = run_sync(make_password, password)
+        except HashingPoolSaturated:
+            # The hash is upgraded on a later login instead
+            return True
+        user.save(update_fields=['password'])
+    return True
+
+
+def in_flight():
+    return _in_flight
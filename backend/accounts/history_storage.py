@@ -0,0 +1,344 @@
+"""
+Delta storage for CommentHistory.
+
+In 'delta' mode (settings.COMMENT_HISTORY_STORAGE) a history row stores its
+old and new text as compact diffs against the row it follows, pointed to by
+delta_base_id. Every COMMENT_HISTORY_SNAPSHOT_INTERVAL rows, or whenever a
+diff would not be smaller, the row is stored as a full snapshot instead, so
+rebuilding any row never walks more than one interval of diffs.
+
+History rows are deleted with their user; snapshot_dependents() first stores
+in full the rows of other users whose diffs are taken against them.
+
+A diff is a JSON list of operations against the base text: a positive int
+copies that many characters, a negative int skips that many, and a string
+is inserted as-is.
+"""
+import json
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+FULL = 'full'
+DELTA = 'delta'
+
+STORAGE_FIELDS = ('id', 'delta_base_id', 'storage', 'old_content', 'new_content', 'old_delta', 'new_delta')
+
+# Columns rewritten when converting existing rows between storage modes
+STORAGE_UPDATE_FIELDS = ['storage', 'delta_base_id', 'old_delta', 'new_delta', 'old_content', 'new_content']
+
+
+def storage_mode():
+    return getattr(settings, 'COMMENT_HISTORY_STORAGE', FULL)
+
+
+def snapshot_interval():
+    return getattr(settings, 'COMMENT_HISTORY_SNAPSHOT_INTERVAL', 10)
+
+
+def encode_delta(base, text):
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, base, text, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(text[j1:j2])
+    return json.dumps(ops, separators=(',', ':'), ensure_ascii=False)
+
+
+def apply_delta(base, delta):
+    out = []
+    pos = 0
+    for op in json.loads(delta):
+        if isinstance(op, str):
+            out.append(op)
+        elif op >= 0:
+            out.append(base[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+    return ''.join(out)
+
+
+def _reference_text(old_content, new_content):
+    """The text a following row's diffs are taken against"""
+    if new_content is not None:
+        return new_content
+    return old_content or ''
+
+
+class _Row:
+    __slots__ = STORAGE_FIELDS
+
+    def __init__(self, values):
+        for field, value in zip(STORAGE_FIELDS, values):
+            setattr(self, field, value)
+
+
+def _rebuild(rows_by_id, row_id, texts):
+    """Return (old_content, new_content) for row_id, filling the texts memo"""
+    target = row_id
+    chain = []
+    while row_id not in texts:
+        row = rows_by_id.get(row_id)
+        if row is None:
+            # The base was deleted without its dependents being stored in
+            # full first (see snapshot_dependents), so their text is lost
+            for lost in [row_id] + [row.id for row in chain]:
+                texts[lost] = (None, None)
+            return texts[target]
+        if row.storage != DELTA:
+            texts[row_id] = (row.old_content, row.new_content)
+            break
+        chain.append(row)
+        row_id = row.delta_base_id
+    for row in reversed(chain):
+        ref = _reference_text(*texts[row.delta_base_id])
+        old_content = apply_delta(ref, row.old_delta) if row.old_delta is not None else None
+        base = old_content if old_content is not None else ref
+        new_content = apply_delta(base, row.new_delta) if row.new_delta is not None else None
+        texts[row.id] = (old_content, new_content)
+    return texts[target]
+
+
+def _missing_base(rows_by_id, row):
+    """Id of the first base in row's chain that is not loaded, or None"""
+    while row.storage == DELTA:
+        base = rows_by_id.get(row.delta_base_id)
+        if base is None:
+            return row.delta_base_id
+        row = base
+    return None
+
+
+def _chain_is_loaded(rows_by_id, row):
+    return _missing_base(rows_by_id, row) is None
+
+
+def _load_missing_bases(model, pending, rows_by_id):
+    """
+    Fetch the bases of `pending` rows of one table that are not loaded. The
+    rows just before each comment's oldest pending row, up to one snapshot
+    interval of them, are read with one query; chains still open after that
+    (pending rows that are not consecutive) are followed by delta_base_id.
+    """
+    oldest = {}
+    for row in pending:
+        oldest[row.comment_id] = min(row.id, oldest.get(row.comment_id, row.id))
+    before_oldest = Q()
+    for comment_id, row_id in oldest.items():
+        before_oldest |= Q(comment_id=comment_id, id__lt=row_id)
+    values = (
+        model.objects.filter(before_oldest)
+        .annotate(position=Window(RowNumber(), partition_by=[F('comment_id')], order_by=F('id').desc()))
+        .filter(position__lt=snapshot_interval())
+        .values_list(*STORAGE_FIELDS)
+    )
+    for value in values:
+        rows_by_id.setdefault(value[0], _Row(value))
+
+    rows = pending
+    while rows:
+        ids = {_missing_base(rows_by_id, rows_by_id[row.id]) for row in rows} - {None}
+        if not ids:
+            return
+        rows = [_Row(value) for value in model.objects.filter(id__in=ids).values_list(*STORAGE_FIELDS)]
+        for row in rows:
+            rows_by_id.setdefault(row.id, row)
+
+
+def expand_history(entries):
+    """
+    Fill in old_content/new_content on CommentHistory (or
+    ArchivedCommentHistory) instances stored as diffs. Rows already in
+    `entries` are used as bases; missing bases are fetched back to their
+    full snapshot only, usually with a single query per table.
+    """
+    pending = [entry for entry in entries if entry.storage == DELTA]
+    if not pending:
+        return entries
+
+    rows_by_id = {}
+    for entry in entries:
+        rows_by_id[entry.id] = _Row([getattr(entry, field) for field in STORAGE_FIELDS])
+
+    # Entries may mix live and archived history, which live in separate tables
+    missing = {}
+    for entry in pending:
+        if not _chain_is_loaded(rows_by_id, rows_by_id[entry.id]):
+            missing.setdefault(type(entry), []).append(entry)
+    for model, rows in missing.items():
+        _load_missing_bases(model, rows, rows_by_id)
+
+    texts = {}
+    for entry in pending:
+        entry.old_content, entry.new_content = _rebuild(rows_by_id, entry.id, texts)
+    return entries
+
+
+def snapshot_dependents(doomed):
+    """
+    Store in full the rows whose diffs are taken against a row of `doomed`,
+    a queryset of history rows about to be deleted, so they can still be
+    rebuilt afterwards. Returns the number of rows rewritten.
+    """
+    model = doomed.model
+    doomed_ids = doomed.order_by().values('id')
+    dependents = list(
+        model.objects.filter(storage=DELTA, delta_base_id__in=doomed_ids).exclude(id__in=doomed_ids)
+    )
+    if not dependents:
+        return 0
+    expand_history(dependents)
+    for entry in dependents:
+        entry.storage, entry.delta_base_id = FULL, None
+        entry.old_delta = entry.new_delta = None
+    model.objects.bulk_update(dependents, STORAGE_UPDATE_FIELDS, batch_size=500)
+    return len(dependents)
+
+
+def plan_storage(previous_id, previous_texts, depth, old_content, new_content, interval=None):
+    """
+    Choose how to store a row that follows `previous_id`.
+
+    `previous_texts` is the (old, new) pair of that row and `depth` the number
+    of rows from the last full snapshot up to and including it. Returns
+    (storage, delta_base_id, old_delta, new_delta).
+    """
+    interval = interval or snapshot_interval()
+    if previous_id is None or depth >= interval:
+        return FULL, None, None, None
+
+    ref = _reference_text(*previous_texts)
+    old_delta = encode_delta(ref, old_content) if old_content is not None else None
+    base = old_content if old_content is not None else ref
+    new_delta = encode_delta(base, new_content) if new_content is not None else None
+
+    full_size = len(old_content or '') + len(new_content or '')
+    delta_size = len(old_delta or '') + len(new_delta or '')
+    if delta_size >= full_size:
+        return FULL, None, None, None
+    return DELTA, previous_id, old_delta, new_delta
+
+
+def _encode_after(entry, recent, interval):
+    """
+    Set the storage fields of a new row given the latest rows of its comment,
+    as STORAGE_FIELDS tuples newest first.
+    """
+    entry.storage = FULL
+    entry.delta_base_id = None
+    entry.old_delta = entry.new_delta = None
+    rows_by_id = {value[0]: _Row(value) for value in recent}
+    if not recent or not _chain_is_loaded(rows_by_id, rows_by_id[recent[0][0]]):
+        return entry
+
+    previous = rows_by_id[recent[0][0]]
+    depth = 1
+    row = previous
+    while row.storage == DELTA:
+        row = rows_by_id[row.delta_base_id]
+        depth += 1
+
+    entry.storage, entry.delta_base_id, entry.old_delta, entry.new_delta = plan_storage(
+        previous.id, _rebuild(rows_by_id, previous.id, {}), depth,
+        entry.old_content, entry.new_content, interval,
+    )
+    return entry
+
+
+def encode_history_entry(entry):
+    """
+    Decide how a new CommentHistory row is stored and set its storage fields.
+
+    The full text stays on entry.old_content/new_content; the caller is
+    responsible for not writing it to the database for delta rows.
+    """
+    if storage_mode() != DELTA:
+        return _encode_after(entry, [], None)
+
+    interval = snapshot_interval()
+    model = type(entry)
+    recent = list(
+        model.objects.filter(comment_id=entry.comment_id)
+        .order_by('-id')
+        .values_list(*STORAGE_FIELDS)[:interval]
+    )
+    return _encode_after(entry, recent, interval)
+
+
+def encode_history_entries(entries):
+    """
+    Storage for many new CommentHistory rows about to be bulk_create()d,
+    reading the chains they extend with a single query.
+
+    bulk_create() bypasses CommentHistory.save(), so the text columns of
+    delta rows are cleared here. Only the first new row of each comment can
+    be a delta; any further ones are stored in full.
+    """
+    entries = list(entries)
+    if not entries or storage_mode() != DELTA:
+        for entry in entries:
+            _encode_after(entry, [], None)
+        return entries
+
+    interval = snapshot_interval()
+    model = type(entries[0])
+    recent = {}
+    values = (
+        model.objects.filter(comment_id__in={entry.comment_id for entry in entries})
+        .annotate(position=Window(RowNumber(), partition_by=[F('comment_id')], order_by=F('id').desc()))
+        .filter(position__lte=interval)
+        .order_by('comment_id', '-id')
+        .values_list('comment_id', *STORAGE_FIELDS)
+    )
+    for comment_id, *value in values:
+        recent.setdefault(comment_id, []).append(tuple(value))
+
+    for entry in entries:
+        _encode_after(entry, recent.pop(entry.comment_id, []), interval)
+        if entry.storage == DELTA:
+            entry.old_content = entry.new_content = None
+    return entries
+
+
+def compress_chain(rows):
+    """
+    Re-plan the storage of one comment's full history, given as (old, new)
+    text pairs with ids in insertion order. Yields
+    (id, storage, delta_base_id, old_delta, new_delta) per row.
+    """
+    interval = snapshot_interval()
+    previous_id = previous_texts = None
+    depth = 0
+    for row_id, old_content, new_content in rows:
+        plan = plan_storage(previous_id, previous_texts, depth, old_content, new_content, interval)
+        depth = 1 if plan[0] == FULL else depth + 1
+        previous_id, previous_texts = row_id, (old_content, new_content)
+        yield (row_id, *plan)
+
+
+def compress_entries(entries):
+    """
+    Set delta storage fields on expanded CommentHistory instances, one chain
+    per comment in id order. Delta rows get their text columns cleared so the
+    instances can be written back with bulk_update(STORAGE_UPDATE_FIELDS).
+    """
+    chains = {}
+    for entry in sorted(entries, key=lambda entry: entry.id):
+        chains.setdefault(entry.comment_id, []).append(entry)
+    for chain in chains.values():
+        by_id = {entry.id: entry for entry in chain}
+        plans = compress_chain((entry.id, entry.old_content, entry.new_content) for entry in chain)
+        for row_id, storage, delta_base_id, old_delta, new_delta in plans:
+            entry = by_id[row_id]
+            entry.storage, entry.delta_base_id = storage, delta_base_id
+            entry.old_delta, entry.new_delta = old_delta, new_delta
+            if storage != FULL:
+                entry.old_content = entry.new_content = None
+    return entries
@@ -0,0 +1,230 @@
+"""
+Login throttling shared by every worker.
+
+Each login endpoint calls check_login() before it looks at the password,
+so an attempt over the limits is turned away without paying for a hash:
+
+- every attempt counts against the client's IP address
+  (LOGIN_THROTTLE_IP_LIMIT per LOGIN_THROTTLE_IP_WINDOW seconds);
+- failed attempts count against the account's email
+  (LOGIN_THROTTLE_ACCOUNT_LIMIT per LOGIN_THROTTLE_ACCOUNT_WINDOW seconds),
+  and a successful login clears them.
+
+Limits use sliding-window counters: a key keeps a count for the current
+and the previous fixed window, and its rate is the current count plus the
+previous one weighted by how much of the previous window still overlaps
+the sliding one. That takes two rows per key, however many attempts.
+
+Counters live in a SQLite file of their own (settings.LOGIN_THROTTLE_STORE)
+so all workers on a host share them without touching the main database;
+it runs in WAL mode and each update is one short write transaction.
+The same file keeps running totals (attempts, failures, throttled
+attempts) for monitoring, see login_throttle_stats_view.
+"""
+import math
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+IP = 'ip'
+ACCOUNT = 'account'
+
+# One in this many writes also deletes every expired counter
+PRUNE_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (key, bucket)
+);
+CREATE INDEX IF NOT EXISTS counters_expires_idx ON counters (expires_at);
+CREATE TABLE IF NOT EXISTS totals (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Too many login attempts, retry in {retry_after} seconds')
+        self.retry_after = retry_after
+
+
+def _limits(scope):
+    if scope == IP:
+        return (
+            getattr(settings, 'LOGIN_THROTTLE_IP_LIMIT', 30),
+            getattr(settings, 'LOGIN_THROTTLE_IP_WINDOW', 60),
+        )
+    return (
+        getattr(settings, 'LOGIN_THROTTLE_ACCOUNT_LIMIT', 10),
+        getattr(settings, 'LOGIN_THROTTLE_ACCOUNT_WINDOW', 900),
+    )
+
+
+def _retry_after(previous, current, limit, window, now):
+    """Seconds until the sliding rate of a key drops below limit"""
+    start = now - now % window
+    if current >= limit:
+        # Wait for the next window, then for enough of this one to slide out
+        until = start + window + window * (1 - limit / current)
+    else:
+        until = start + window * (1 - (limit - current) / previous)
+    return max(1, math.ceil(until - now))
+
+
+class ThrottleStore:
+    """Sliding-window counters and totals in a SQLite file"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        if random.randrange(PRUNE_EVERY) == 0:
+            connection.execute('DELETE FROM counters WHERE expires_at < ?', (time.time(),))
+
+    def _counts(self, connection, key, window, now):
+        bucket = int(now // window)
+        rows = dict(connection.execute(
+            'SELECT bucket, count FROM counters WHERE key = ? AND bucket IN (?, ?)', (key, bucket - 1, bucket),
+        ).fetchall())
+        return rows.get(bucket - 1, 0), rows.get(bucket, 0)
+
+    def rate(self, connection, key, window, now):
+        """Return (previous, current, rate) for a key"""
+        previous, current = self._counts(connection, key, window, now)
+        overlap = 1 - (now % window) / window
+        return previous, current, previous * overlap + current
+
+    def hit(self, connection, key, window, now):
+        bucket = int(now // window)
+        connection.execute(
+            'INSERT INTO counters (key, bucket, count, expires_at) VALUES (?, ?, 1, ?) '
+            'ON CONFLICT (key, bucket) DO UPDATE SET count = count + 1',
+            (key, bucket, (bucket + 2) * window),
+        )
+        return self.rate(connection, key, window, now)
+
+    def clear(self, connection, key):
+        connection.execute('DELETE FROM counters WHERE key = ?', (key,))
+
+    def add_total(self, connection, name, amount=1):
+        connection.execute(
+            'INSERT INTO totals (name, value) VALUES (?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+            (name, amount),
+        )
+
+    def totals(self):
+        return dict(self._connection().execute('SELECT name, value FROM totals').fetchall())
+
+    def active_keys(self, now):
+        """Number of keys with a count in the last two windows, per scope"""
+        rows = self._connection().execute(
+            "SELECT substr(key, 1, instr(key, ':') - 1), count(DISTINCT key) FROM counters "
+            "WHERE expires_at >= ? GROUP BY 1",
+            (now,),
+        ).fetchall()
+        return dict(rows)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    path = str(getattr(settings, 'LOGIN_THROTTLE_STORE', settings.BASE_DIR / 'login_throttle.sqlite3'))
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(path, ThrottleStore(path))
+    return store
+
+
+def _key(scope, value):
+    return f'{scope}:{str(value or "").strip().lower()}'
+
+
+def check_login(email, ip):
+    """
+    Count a login attempt against the IP address and check both limits.
+    Raises LoginThrottled when the attempt must not be tried.
+    """
+    now = time.time()
+    ip_limit, ip_window = _limits(IP)
+    account_limit, account_window = _limits(ACCOUNT)
+    store = get_store()
+    with store.transaction() as connection:
+        # Every attempt counts against the IP, refused ones included. Like
+        # the account check, the limit applies to the attempts before this one.
+        previous, current, rate = store.hit(connection, _key(IP, ip), ip_window, now)
+        if rate - 1 >= ip_limit:
+            store.add_total(connection, 'throttled_ip')
+            retry_after = _retry_after(previous, current, ip_limit, ip_window, now)
+        else:
+            previous, current, rate = store.rate(connection, _key(ACCOUNT, email), account_window, now)
+            if rate >= account_limit:
+                store.add_total(connection, 'throttled_account')
+                retry_after = _retry_after(previous, current, account_limit, account_window, now)
+            else:
+                store.add_total(connection, 'attempts')
+                return
+    raise LoginThrottled(retry_after)
+
+
+def login_failed(email):
+    store = get_store()
+    with store.transaction() as connection:
+        store.hit(connection, _key(ACCOUNT, email), _limits(ACCOUNT)[1], time.time())
+        store.add_total(connection, 'failures')
+
+
+def login_succeeded(email):
+    store = get_store()
+    with store.transaction() as connection:
+        store.clear(connection, _key(ACCOUNT, email))
+        store.add_total(connection, 'successes')
+
+
+def throttle_stats():
+    """Totals since the store was created, and the keys currently counted per scope"""
+    store = get_store()
+    totals = store.totals()
+    active = store.active_keys(time.time())
+    return {
+        'attempts': totals.get('attempts', 0),
+        'successes': totals.get('successes', 0),
+        'failures': totals.get('failures', 0),
+        'throttled_ip': totals.get('throttled_ip', 0),
+        'throttled_account': totals.get('throttled_account', 0),
+        'active_ips': active.get(IP, 0),
+        'active_accounts': active.get(ACCOUNT, 0),
+    }
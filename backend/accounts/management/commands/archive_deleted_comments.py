@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.comment_archive import archive_deleted_comments
+
+
+class Command(BaseCommand):
+    help = 'Move comments soft-deleted more than N days ago, with their history, to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Archive comments deleted more than N days ago')
+        parser.add_argument('--batch-size', type=int, default=500, help='Comments moved per transaction')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        comments_moved = history_moved = 0
+        for comments, history in archive_deleted_comments(cutoff, options['batch_size'], options['max_batches']):
+            comments_moved += comments
+            history_moved += history
+            self.stdout.write(f'{comments_moved} comments, {history_moved} history rows archived')
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {comments_moved} comment(s) and {history_moved} history row(s)'
+        ))
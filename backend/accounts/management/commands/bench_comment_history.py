@@ -0,0 +1,91 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce, Length
+
+from accounts.history_storage import FULL, STORAGE_UPDATE_FIELDS, compress_entries
+from accounts.models import User, Comment, CommentHistory
+from accounts.serializers import CommentHistorySerializer
+
+
+class Command(BaseCommand):
+    help = 'Report comment history storage size and read latency for full vs delta storage (all data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=50, help='Number of comments')
+        parser.add_argument('--edits', type=int, default=100, help='History rows per comment')
+        parser.add_argument('--length', type=int, default=2000, help='Approximate comment length in characters')
+        parser.add_argument('--repeat', type=int, default=5, help='Read runs per mode; the best run is reported')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            comment_ids = self.seed(options['comments'], options['edits'], options['length'])
+            full_bytes = self.storage_bytes()
+            full_read, full_data = self.read(comment_ids, options['repeat'])
+
+            self.compress(comment_ids)
+            delta_bytes = self.storage_bytes()
+            delta_read, delta_data = self.read(comment_ids, options['repeat'])
+            transaction.set_rollback(True)
+
+        if full_data != delta_data:
+            raise CommandError('Delta storage rebuilt different history text')
+
+        rows = options['comments'] * options['edits']
+        self.stdout.write(f"{rows} history rows over {options['comments']} comments")
+        self.stdout.write(f'Full text: {full_bytes / 1024:10.1f} KiB  read all: {full_read * 1000:8.2f} ms')
+        self.stdout.write(f'Delta:     {delta_bytes / 1024:10.1f} KiB  read all: {delta_read * 1000:8.2f} ms')
+        self.stdout.write(self.style.SUCCESS(f'Storage reduced {full_bytes / delta_bytes:.1f}x'))
+
+    def seed(self, comments, edits, length):
+        user = User.objects.create(email='bench-history@example.com', username='bench-history')
+        rng = random.Random(0)
+        comment_ids = []
+        history = []
+        for _ in range(comments):
+            text = ''.join(rng.choices(string.ascii_lowercase + ' ', k=length))
+            comment = Comment.objects.create(user=user, page_name='order_list', content=text)
+            comment_ids.append(comment.id)
+            for _ in range(edits):
+                pos = rng.randrange(len(text))
+                edited = text[:pos] + ''.join(rng.choices(string.ascii_lowercase, k=20)) + text[pos + 10:]
+                history.append(CommentHistory(
+                    comment=comment, user=user, action='EDIT', old_content=text, new_content=edited, storage=FULL,
+                ))
+                text = edited
+        CommentHistory.objects.bulk_create(history, batch_size=500)
+        return comment_ids
+
+    def storage_bytes(self):
+        totals = CommentHistory.objects.aggregate(
+            old=Coalesce(Sum(Length('old_content')), 0),
+            new=Coalesce(Sum(Length('new_content')), 0),
+            old_delta=Coalesce(Sum(Length('old_delta')), 0),
+            new_delta=Coalesce(Sum(Length('new_delta')), 0),
+        )
+        return sum(totals.values())
+
+    def compress(self, comment_ids):
+        entries = list(CommentHistory.objects.filter(comment_id__in=comment_ids))
+        compress_entries(entries)
+        CommentHistory.objects.bulk_update(entries, STORAGE_UPDATE_FIELDS, batch_size=500)
+
+    def read(self, comment_ids, repeat):
+        best = None
+        data = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = [
+                [(row['old_content'], row['new_content']) for row in CommentHistorySerializer(
+                    CommentHistory.objects.filter(comment_id=comment_id).select_related('user'), many=True
+                ).data]
+                for comment_id in comment_ids
+            ]
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best, data
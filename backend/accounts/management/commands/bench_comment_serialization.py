@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import User, Comment
+from accounts.serializers import CommentSerializer, comment_list_values, serialize_comment_rows
+
+
+class Command(BaseCommand):
+    help = 'Compare CommentSerializer(many=True) with the fast comment list path (all data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=500, help='Number of comments on the page')
+        parser.add_argument('--authors', type=int, default=50, help='Number of distinct comment authors')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path; the best run is reported')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['comments'], options['authors'])
+            comments = Comment.objects.filter(page_name='order_list', is_deleted=False)
+
+            drf_time, drf_queries, drf_body = self.measure(
+                lambda: CommentSerializer(comments.all(), many=True).data, options['repeat']
+            )
+            fast_time, fast_queries, fast_body = self.measure(
+                lambda: serialize_comment_rows(comment_list_values(comments.all())), options['repeat']
+            )
+            transaction.set_rollback(True)
+
+        if drf_body != fast_body:
+            raise CommandError('Fast path output differs from CommentSerializer')
+
+        self.stdout.write(f"{options['comments']} comments, output identical ({len(drf_body)} bytes)")
+        self.stdout.write(f'CommentSerializer: {drf_time * 1000:8.2f} ms  {drf_queries:5d} queries')
+        self.stdout.write(f'Fast path:         {fast_time * 1000:8.2f} ms  {fast_queries:5d} queries')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {drf_time / fast_time:.1f}x'))
+
+    def seed(self, count, authors):
+        users = [
+            User.objects.create(email=f'bench{i}@example.com', username=f'bench{i}')
+            for i in range(authors)
+        ]
+        Comment.objects.bulk_create(
+            Comment(
+                user=users[i % authors],
+                modified_by=users[(i + 1) % authors] if i % 3 == 0 else None,
+                page_name='order_list',
+                content=f'Benchmark comment {i}',
+            )
+            for i in range(count)
+        )
+
+    def measure(self, serialize, repeat):
+        best = None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                data = serialize()
+                body = JSONRenderer().render(data)
+                elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best, len(queries), body
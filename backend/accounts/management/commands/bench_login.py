@@ -0,0 +1,107 @@
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from accounts import views
+from accounts.models import User
+
+HASHERS = {
+    'scrypt': ('accounts.hashers.TunedScryptPasswordHasher', 'PASSWORD_SCRYPT_WORK_FACTOR', '16384,32768,65536'),
+    'pbkdf2': ('accounts.hashers.TunedPBKDF2PasswordHasher', 'PASSWORD_PBKDF2_ITERATIONS', '150000,300000,600000'),
+    'argon2': ('accounts.hashers.TunedArgon2PasswordHasher', 'PASSWORD_ARGON2_TIME_COST', '1,2,4'),
+}
+
+PATHS = (
+    ('login_view', views.login_view, 'user'),
+    ('login_superadmin', views.login_superadmin, 'superadmin'),
+    ('login_user', views.login_user, 'user'),
+)
+
+PASSWORD = 'Bench-password-1'
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))]
+
+
+class Command(BaseCommand):
+    help = 'Measure login latency and throughput of the three login views at several hashing costs (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasher', choices=sorted(HASHERS), default='scrypt', help='Hasher to measure')
+        parser.add_argument(
+            '--work-factors', default=None,
+            help='Comma-separated costs: scrypt N, PBKDF2 iterations or Argon2 time cost',
+        )
+        parser.add_argument('--logins', type=int, default=30, help='Timed logins per view and cost')
+
+    def handle(self, *args, **options):
+        hasher, setting, default_factors = HASHERS[options['hasher']]
+        if options['hasher'] == 'argon2':
+            try:
+                import argon2  # noqa: F401
+            except ImportError:
+                raise CommandError('Benchmarking Argon2 needs the argon2-cffi package')
+        try:
+            factors = [int(factor) for factor in (options['work_factors'] or default_factors).split(',')]
+        except ValueError:
+            raise CommandError('--work-factors must be comma-separated integers')
+
+        self.stdout.write(
+            f"{'view':<18}{'cost':>10}{'p50 ms':>10}{'p99 ms':>10}{'logins/CPU-s':>15}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for factor in factors:
+                with override_settings(**{
+                    'PASSWORD_HASHERS': [hasher],
+                    setting: factor,
+                    # Keep the throttle in the measured path without tripping it
+                    'LOGIN_THROTTLE_STORE': Path(directory) / f'throttle-{factor}.sqlite3',
+                    'LOGIN_THROTTLE_IP_LIMIT': 10**9,
+                    'LOGIN_THROTTLE_ACCOUNT_LIMIT': 10**9,
+                }):
+                    for name, view, role in PATHS:
+                        p50, p99, per_cpu_second = self.measure(view, role, options['logins'])
+                        self.stdout.write(
+                            f'{name:<18}{factor:>10}{p50 * 1000:>10.1f}{p99 * 1000:>10.1f}{per_cpu_second:>15.1f}'
+                        )
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def measure(self, view, role, logins):
+        """
+        Return (p50 seconds, p99 seconds, logins per CPU-second) for one view.
+
+        CPU time is process_time() over every thread of the process, the
+        hashing pool's included, so the last figure is logins per second of
+        CPU used. It is not per worker or per core when the pool hashes in
+        parallel.
+        """
+        factory = APIRequestFactory()
+        with transaction.atomic():
+            email = f'bench-login-{role}@example.com'
+            User.objects.create_user(username=f'bench-login-{role}', email=email, password=PASSWORD, role=role)
+
+            def login():
+                request = factory.post('/', {'email': email, 'password': PASSWORD}, format='json')
+                response = view(request)
+                if response.status_code != 200:
+                    raise CommandError(f'{view.__name__} answered {response.status_code}: {response.data}')
+
+            login()
+            latencies = []
+            cpu_start = time.process_time()
+            for _ in range(logins):
+                start = time.perf_counter()
+                login()
+                latencies.append(time.perf_counter() - start)
+            cpu = time.process_time() - cpu_start
+            transaction.set_rollback(True)
+        return statistics.median(latencies), percentile(latencies, 0.99), logins / cpu
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.history_storage import FULL, STORAGE_UPDATE_FIELDS, compress_entries, expand_history
+from accounts.models import CommentHistory
+
+
+class Command(BaseCommand):
+    help = 'Convert existing comment history rows to delta storage (or back with --decompress)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Comments converted per transaction')
+        parser.add_argument('--decompress', action='store_true', help='Rewrite every row as full text')
+
+    def handle(self, *args, **options):
+        comment_ids = list(
+            CommentHistory.objects.order_by('comment_id').values_list('comment_id', flat=True).distinct()
+        )
+        batch_size = options['batch_size']
+        rows_written = 0
+        for start in range(0, len(comment_ids), batch_size):
+            batch = comment_ids[start:start + batch_size]
+            with transaction.atomic():
+                rows_written += self.convert(batch, options['decompress'])
+            self.stdout.write(f'{min(start + batch_size, len(comment_ids))}/{len(comment_ids)} comments')
+
+        action = 'Decompressed' if options['decompress'] else 'Compressed'
+        self.stdout.write(self.style.SUCCESS(f'{action} {rows_written} history row(s)'))
+
+    def convert(self, comment_ids, decompress):
+        entries = list(
+            CommentHistory.objects.filter(comment_id__in=comment_ids).order_by('comment_id', 'id')
+        )
+        expand_history(entries)
+
+        if decompress:
+            for entry in entries:
+                entry.storage = FULL
+                entry.delta_base_id = entry.old_delta = entry.new_delta = None
+        else:
+            compress_entries(entries)
+
+        CommentHistory.objects.bulk_update(
+            entries,
+            STORAGE_UPDATE_FIELDS,
+            batch_size=500,
+        )
+        return len(entries)
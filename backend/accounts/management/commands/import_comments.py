@@ -0,0 +1,56 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.comment_import import get_checkpoint, import_comments, read_records
+from accounts.comment_stats import rebuild_comment_stats
+
+
+class Command(BaseCommand):
+    help = 'Stream comments and their history from a JSONL or CSV file into the database (resumable)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL or CSV file')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Records per bulk_create')
+        parser.add_argument('--chunks-per-transaction', type=int, default=10, help='Chunks committed together')
+        parser.add_argument('--checkpoint', help='Checkpoint name (defaults to the file name)')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start over')
+        parser.add_argument('--strict', action='store_true', help='Stop at the first invalid record')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+
+        checkpoint = get_checkpoint(options['checkpoint'] or os.path.basename(path), options['restart'])
+        if checkpoint.completed:
+            self.stdout.write(f'{checkpoint.name} was already imported; use --restart to import it again')
+            return
+        if checkpoint.records_read:
+            self.stdout.write(f'Resuming {checkpoint.name} after record {checkpoint.records_read}')
+
+        def on_error(position, error):
+            if options['strict']:
+                raise CommandError(f'Record {position}: {error} (progress up to the last batch is saved)')
+            self.stderr.write(f'Skipping record {position}: {error}')
+
+        progress = import_comments(
+            read_records(path, options['format']),
+            checkpoint,
+            chunk_size=options['chunk_size'],
+            chunks_per_transaction=options['chunks_per_transaction'],
+            on_error=on_error,
+        )
+        for checkpoint in progress:
+            self.stdout.write(
+                f'{checkpoint.records_read} records read, {checkpoint.comments_created} comments, '
+                f'{checkpoint.history_created} history rows, {checkpoint.skipped} skipped'
+            )
+
+        # Bulk inserts bypass the per-write counter updates
+        rebuild_comment_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {checkpoint.comments_created} comment(s) and {checkpoint.history_created} '
+            f'history row(s); skipped {checkpoint.skipped} record(s)'
+        ))
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.comment_events import prune_events
+
+
+class Command(BaseCommand):
+    help = 'Delete live comment events older than the replay window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Keep events from the last N hours')
+
+    def handle(self, *args, **options):
+        deleted = prune_events(timezone.now() - timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} comment event(s)'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from accounts.token_revocation import prune_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete revoked refresh tokens that have expired'
+
+    def handle(self, *args, **options):
+        deleted = prune_revoked_tokens()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} revoked token(s)'))
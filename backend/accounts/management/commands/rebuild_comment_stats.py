@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from accounts.comment_stats import rebuild_comment_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-page comment counters from the comment table'
+
+    def handle(self, *args, **options):
+        pages = rebuild_comment_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt comment counters for {pages} page(s)'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.email_outbox import process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox email, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages sent per connection')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is due instead of waiting')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = process_outbox(options['batch_size'])
+                if sent or failed:
+                    total_sent += sent
+                    total_failed += failed
+                    self.stdout.write(f'{sent} sent, {failed} failed')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} email(s), {total_failed} failed attempt(s)'))
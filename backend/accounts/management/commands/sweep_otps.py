@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.otp_store import sweep_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired password reset codes and rate limit counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement')
+
+    def handle(self, *args, **options):
+        codes, counters = sweep_expired(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {codes} expired code(s) and {counters} counter(s)'))
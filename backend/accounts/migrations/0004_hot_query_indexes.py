@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_comment_page_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commenthistory',
+            index=models.Index(fields=['comment', '-timestamp'], name='commenthistory_comment_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpagepermission',
+            index=models.Index(fields=['user', 'page', 'can_view', 'can_edit', 'can_create', 'can_delete'], name='permission_user_covering_idx'),
+        ),
+    ]
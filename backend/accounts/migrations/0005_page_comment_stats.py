@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:43
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def backfill_comment_stats(apps, schema_editor):
+    Comment = apps.get_model('accounts', 'Comment')
+    PageCommentStats = apps.get_model('accounts', 'PageCommentStats')
+    totals = Comment.objects.order_by().values('page_name').annotate(
+        live=Count('id', filter=Q(is_deleted=False)),
+        deleted=Count('id', filter=Q(is_deleted=True)),
+        last_activity=Max('modified_at'),
+    )
+    PageCommentStats.objects.bulk_create(
+        PageCommentStats(
+            page_name=row['page_name'],
+            live_count=row['live'],
+            deleted_count=row['deleted'],
+            last_activity_at=row['last_activity'],
+        )
+        for row in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageCommentStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_name', models.CharField(choices=[('products_list', 'Products List'), ('marketing_list', 'Marketing List'), ('order_list', 'Order List'), ('media_plans', 'Media Plans'), ('offer_pricing_skus', 'Offer Pricing SKUs'), ('clients', 'Clients'), ('suppliers', 'Suppliers'), ('customer_support', 'Customer Support'), ('sales_reports', 'Sales Reports'), ('finance_accounting', 'Finance & Accounting')], max_length=50, unique=True)),
+                ('live_count', models.PositiveIntegerField(default=0)),
+                ('deleted_count', models.PositiveIntegerField(default=0)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['page_name'],
+            },
+        ),
+        migrations.RunPython(backfill_comment_stats, migrations.RunPython.noop),
+    ]
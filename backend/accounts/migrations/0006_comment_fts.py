@@ -0,0 +1,72 @@
+from django.db import migrations
+
+# External-content FTS5 index over live comments. page_name is stored
+# UNINDEXED so search results can be filtered by page without a join.
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE accounts_comment_fts USING fts5(
+        content,
+        page_name UNINDEXED,
+        content='accounts_comment',
+        content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER accounts_comment_fts_insert AFTER INSERT ON accounts_comment
+    WHEN new.is_deleted = 0 BEGIN
+        INSERT INTO accounts_comment_fts(rowid, content, page_name)
+        VALUES (new.id, new.content, new.page_name);
+    END
+    """,
+    """
+    CREATE TRIGGER accounts_comment_fts_delete AFTER DELETE ON accounts_comment
+    WHEN old.is_deleted = 0 BEGIN
+        INSERT INTO accounts_comment_fts(accounts_comment_fts, rowid, content, page_name)
+        VALUES ('delete', old.id, old.content, old.page_name);
+    END
+    """,
+    # Edits and soft deletes: drop the old entry if it was indexed, then
+    # index the new row if it is still live. Both steps live in one trigger
+    # because SQLite gives no ordering guarantee between separate triggers.
+    """
+    CREATE TRIGGER accounts_comment_fts_update AFTER UPDATE OF content, page_name, is_deleted ON accounts_comment
+    BEGIN
+        INSERT INTO accounts_comment_fts(accounts_comment_fts, rowid, content, page_name)
+        SELECT 'delete', old.id, old.content, old.page_name WHERE old.is_deleted = 0;
+        INSERT INTO accounts_comment_fts(rowid, content, page_name)
+        SELECT new.id, new.content, new.page_name WHERE new.is_deleted = 0;
+    END
+    """,
+    """
+    INSERT INTO accounts_comment_fts(rowid, content, page_name)
+    SELECT id, content, page_name FROM accounts_comment WHERE is_deleted = 0
+    """,
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS accounts_comment_fts_update",
+    "DROP TRIGGER IF EXISTS accounts_comment_fts_delete",
+    "DROP TRIGGER IF EXISTS accounts_comment_fts_insert",
+    "DROP TABLE IF EXISTS accounts_comment_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other backends fall back to no search index
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_page_comment_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(FORWARD_SQL), run_on_sqlite(REVERSE_SQL)),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_comment_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commenthistory',
+            name='delta_base_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='commenthistory',
+            name='new_delta',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='commenthistory',
+            name='old_delta',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='commenthistory',
+            name='storage',
+            field=models.CharField(choices=[('full', 'Full text'), ('delta', 'Delta')], default='full', max_length=5),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_comment_history_delta_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comment_id', models.BigIntegerField()),
+                ('page_name', models.CharField(choices=[('products_list', 'Products List'), ('marketing_list', 'Marketing List'), ('order_list', 'Order List'), ('media_plans', 'Media Plans'), ('offer_pricing_skus', 'Offer Pricing SKUs'), ('clients', 'Clients'), ('suppliers', 'Suppliers'), ('customer_support', 'Customer Support'), ('sales_reports', 'Sales Reports'), ('finance_accounting', 'Finance & Accounting')], max_length=50)),
+                ('event_type', models.CharField(choices=[('created', 'Created'), ('edited', 'Edited'), ('deleted', 'Deleted')], max_length=10)),
+                ('payload', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['page_name', 'id'], name='commentevent_page_id_idx')],
+            },
+        ),
+    ]
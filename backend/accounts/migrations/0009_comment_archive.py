@@ -0,0 +1,79 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_comment_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('page_name', models.CharField(choices=[('products_list', 'Products List'), ('marketing_list', 'Marketing List'), ('order_list', 'Order List'), ('media_plans', 'Media Plans'), ('offer_pricing_skus', 'Offer Pricing SKUs'), ('clients', 'Clients'), ('suppliers', 'Suppliers'), ('customer_support', 'Customer Support'), ('sales_reports', 'Sales Reports'), ('finance_accounting', 'Finance & Accounting')], max_length=50)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('modified_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedCommentHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('action', models.CharField(choices=[('CREATE', 'Created'), ('EDIT', 'Edited'), ('DELETE', 'Deleted'), ('RESTORE', 'Restored')], max_length=10)),
+                ('old_content', models.TextField(blank=True, null=True)),
+                ('new_content', models.TextField(blank=True, null=True)),
+                ('timestamp', models.DateTimeField()),
+                ('storage', models.CharField(choices=[('full', 'Full text'), ('delta', 'Delta')], default='full', max_length=5)),
+                ('delta_base_id', models.BigIntegerField(blank=True, null=True)),
+                ('old_delta', models.TextField(blank=True, null=True)),
+                ('new_delta', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='commenthistory',
+            name='action',
+            field=models.CharField(choices=[('CREATE', 'Created'), ('EDIT', 'Edited'), ('DELETE', 'Deleted'), ('RESTORE', 'Restored')], max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['modified_at'], name='comment_deleted_modified_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedcommenthistory',
+            name='comment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='accounts.archivedcomment'),
+        ),
+        migrations.AddField(
+            model_name='archivedcommenthistory',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedcomment',
+            name='modified_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_modified_comments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedcomment',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_comments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcommenthistory',
+            index=models.Index(fields=['comment', '-timestamp'], name='archivedhistory_comment_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_email_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OTPCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PasswordResetOTP',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reset_otp', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('code', models.CharField(max_length=6)),
+                ('created_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('verified', models.BooleanField(default=False)),
+                ('failed_attempts', models.PositiveSmallIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='otp',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='otp_code',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='otp_created_at',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='otp_valid_until',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='otp_verified',
+        ),
+    ]
@@ -1,8 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-import random
-import string
 from django.utils import timezone
+from . import history_storage
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -15,17 +14,32 @@ class User(AbstractUser):
     phone = models.CharField(max_length=15, blank=True, null=True)
     date_of_birth = models.DateField(blank=True, null=True)
     
-    # OTP fields for password recovery
-    otp_code = models.CharField(max_length=6, blank=True, null=True)
-    otp_created_at = models.DateTimeField(blank=True, null=True)
-    otp_verified = models.BooleanField(default=False)
-    
-    otp = models.CharField(max_length=6, blank=True, null=True)
-    otp_valid_until = models.DateTimeField(null=True, blank=True)
-    
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
     
+    # Fields that are part of the cached permission snapshot
+    ACCESS_FIELDS = ('role', 'is_active', 'is_superuser')
+    
+    # Fields shown next to every comment the user wrote
+    DISPLAY_FIELDS = ('username', 'email')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_access_state = instance.access_state()
+        instance._loaded_display_state = instance.display_state()
+        return instance
+    
+    def _field_state(self, fields):
+        # Read from __dict__ so deferred fields are not fetched
+        return tuple(self.__dict__.get(field) for field in fields)
+    
+    def access_state(self):
+        return self._field_state(self.ACCESS_FIELDS)
+    
+    def display_state(self):
+        return self._field_state(self.DISPLAY_FIELDS)
+    
     @property
     def is_superadmin(self):
         return self.role == 'superadmin'
@@ -36,30 +50,6 @@ class User(AbstractUser):
     
     def __str__(self):
         return self.email
-    
-    def generate_otp(self):
-        """Generate a 6-digit OTP code"""
-        self.otp_code = ''.join(random.choices(string.digits, k=6))
-        self.otp_created_at = timezone.now()
-        self.otp_verified = False
-        self.save()
-        return self.otp_code
-    
-    def verify_otp(self, otp):
-        """Verify OTP and check if it's still valid (10 minutes)"""
-        if not self.otp_code or not self.otp_created_at:
-            return False
-        
-        # Check if OTP is expired (10 minutes)
-        time_diff = timezone.now() - self.otp_created_at
-        if time_diff.total_seconds() > 600:  # 10 minutes
-            return False
-        
-        if self.otp_code == otp:
-            self.otp_verified = True
-            self.save()
-            return True
-        return False
 
 class Page(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -94,6 +84,13 @@ class UserPagePermission(models.Model):
     class Meta:
         unique_together = ('user', 'page')
         ordering = ['user', 'page']
+        indexes = [
+            # Covers permission snapshots and the matrix stream without touching the table
+            models.Index(
+                fields=['user', 'page', 'can_view', 'can_edit', 'can_create', 'can_delete'],
+                name='permission_user_covering_idx',
+            ),
+        ]
 
     def __str__(self):
         permissions = []
@@ -150,6 +147,20 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of live comments per page, see accounts/pagination.py
+            models.Index(
+                fields=['page_name', '-created_at', '-id'],
+                name='comment_page_keyset_idx',
+                condition=models.Q(is_deleted=False),
+            ),
+            # Finds soft-deleted comments due for the archive, see accounts/comment_archive.py
+            models.Index(
+                fields=['modified_at'],
+                name='comment_deleted_modified_idx',
+                condition=models.Q(is_deleted=True),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.get_page_name_display()} - {self.created_at}"
@@ -159,6 +170,12 @@ class CommentHistory(models.Model):
         ('CREATE', 'Created'),
         ('EDIT', 'Edited'),
         ('DELETE', 'Deleted'),
+        ('RESTORE', 'Restored'),
+    )
+
+    STORAGE_CHOICES = (
+        (history_storage.FULL, 'Full text'),
+        (history_storage.DELTA, 'Delta'),
     )
 
     comment = models.ForeignKey(Comment, related_name='history', on_delete=models.CASCADE)
@@ -167,9 +184,203 @@ class CommentHistory(models.Model):
     old_content = models.TextField(null=True, blank=True)
     new_content = models.TextField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    
+    # Delta storage, see accounts/history_storage.py
+    storage = models.CharField(max_length=5, choices=STORAGE_CHOICES, default=history_storage.FULL)
+    delta_base_id = models.BigIntegerField(null=True, blank=True)
+    old_delta = models.TextField(null=True, blank=True)
+    new_delta = models.TextField(null=True, blank=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['comment', '-timestamp'], name='commenthistory_comment_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} {self.action} comment on {self.timestamp}"
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            history_storage.encode_history_entry(self)
+        if self.storage != history_storage.DELTA:
+            return super().save(*args, **kwargs)
+        # Delta rows keep the full text in memory only
+        old_content, new_content = self.old_content, self.new_content
+        self.old_content = self.new_content = None
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self.old_content, self.new_content = old_content, new_content
+
+class ArchivedComment(models.Model):
+    """
+    A soft-deleted comment moved out of the hot table by the archive job,
+    see accounts/comment_archive.py. Ids and timestamps are kept as they were.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, related_name='archived_comments', on_delete=models.CASCADE)
+    page_name = models.CharField(max_length=50, choices=Comment.PAGE_CHOICES)
+    content = models.TextField()
+    created_at = models.DateTimeField()
+    modified_at = models.DateTimeField()
+    modified_by = models.ForeignKey(User, related_name='archived_modified_comments', on_delete=models.SET_NULL, null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Archived comment {self.id} on {self.page_name}"
+
+class ArchivedCommentHistory(models.Model):
+    """CommentHistory rows of archived comments, delta storage included"""
+    id = models.BigIntegerField(primary_key=True)
+    comment = models.ForeignKey(ArchivedComment, related_name='history', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    action = models.CharField(max_length=10, choices=CommentHistory.ACTION_CHOICES)
+    old_content = models.TextField(null=True, blank=True)
+    new_content = models.TextField(null=True, blank=True)
+    timestamp = models.DateTimeField()
+    storage = models.CharField(max_length=5, choices=CommentHistory.STORAGE_CHOICES, default=history_storage.FULL)
+    delta_base_id = models.BigIntegerField(null=True, blank=True)
+    old_delta = models.TextField(null=True, blank=True)
+    new_delta = models.TextField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['comment', '-timestamp'], name='archivedhistory_comment_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} {self.action} archived comment on {self.timestamp}"
+
+class CommentImportCheckpoint(models.Model):
+    """
+    Progress of an import_comments run. It is updated in the same transaction
+    as each batch of rows, so a rerun resumes exactly where the last commit
+    left off.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    records_read = models.PositiveBigIntegerField(default=0)
+    comments_created = models.PositiveBigIntegerField(default=0)
+    history_created = models.PositiveBigIntegerField(default=0)
+    skipped = models.PositiveBigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.records_read} records read"
+
+class CommentEvent(models.Model):
+    """Log of comment changes streamed to clients, see accounts/comment_events.py"""
+    EVENT_CHOICES = (
+        ('created', 'Created'),
+        ('edited', 'Edited'),
+        ('deleted', 'Deleted'),
+    )
+
+    # Plain ids so events outlive hard-deleted comments
+    comment_id = models.BigIntegerField()
+    page_name = models.CharField(max_length=50, choices=Comment.PAGE_CHOICES)
+    event_type = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Resuming a stream reads the events after a cursor for a set of pages
+            models.Index(fields=['page_name', 'id'], name='commentevent_page_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} comment {self.comment_id} on {self.page_name}"
+
+class PageCommentStats(models.Model):
+    """Denormalized comment counters per page, maintained by accounts/comment_stats.py"""
+    page_name = models.CharField(max_length=50, choices=Comment.PAGE_CHOICES, unique=True)
+    live_count = models.PositiveIntegerField(default=0)
+    deleted_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['page_name']
+
+    def __str__(self):
+        return f"{self.page_name}: {self.live_count} live, {self.deleted_count} deleted"
+
+class RevokedToken(models.Model):
+    """Refresh tokens that may no longer be used, see accounts/token_revocation.py"""
+    # Unique, so a refresh token can be rotated (or revoked) only once
+    jti = models.CharField(max_length=255, unique=True)
+    # Rows are pruned once the token would have expired anyway
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.jti} (expires {self.expires_at})"
+
+class OutboxEmail(models.Model):
+    """Email waiting to be sent by the send_outbox_email worker, see accounts/email_outbox.py"""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When a pending message is next due; also pushed back while a worker holds it
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # The worker's queue: pending messages by due time
+            models.Index(
+                fields=['next_attempt_at'],
+                name='outbox_pending_due_idx',
+                condition=models.Q(status='pending'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"
+
+
+class PasswordResetOTP(models.Model):
+    """A user's current password reset code, see accounts/otp_store.py"""
+    user = models.OneToOneField(User, primary_key=True, related_name='reset_otp', on_delete=models.CASCADE)
+    code = models.CharField(max_length=6)
+    created_at = models.DateTimeField()
+    # Expired rows are removed in batches by the sweep_otps command
+    expires_at = models.DateTimeField(db_index=True)
+    verified = models.BooleanField(default=False)
+    failed_attempts = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return f"OTP for user {self.user_id} (expires {self.expires_at})"
+
+class OTPCounter(models.Model):
+    """Fixed-window counter of OTP requests or checks for one email or IP address"""
+    # "<action>:<email|ip>:<value>:<window>", see accounts/otp_store.py
+    key = models.CharField(max_length=255, unique=True)
+    count = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
 
     def __str__(self):
-        return f"{self.user.email} {self.action} comment on {self.timestamp}"
\ No newline at end of file
+        return f"{self.key}: {self.count}"
@@ -0,0 +1,151 @@
+"""
+Password reset codes and their rate limits.
+
+A user's current code is one PasswordResetOTP row keyed by the user, so
+issuing and checking codes never writes to the user's own row. Rows are
+only ever changed with filtered update() calls or save(update_fields=...).
+
+Requests and checks are counted in OTPCounter rows, one per action, email
+or IP address and fixed window of settings.OTP_RATE_WINDOW seconds:
+
+- issuing a code is limited per email (OTP_MAX_REQUESTS_PER_EMAIL) and per
+  IP address (OTP_MAX_REQUESTS_PER_IP);
+- checking a code is limited per IP address (OTP_MAX_CHECKS_PER_IP), and a
+  code stops working after OTP_MAX_FAILED_ATTEMPTS wrong guesses.
+
+Counters are hit before the user is looked up, so a flood of requests for
+unknown or random emails is limited too. Expired codes and counters are
+deleted in batches by the sweep_otps command.
+"""
+import hmac
+import secrets
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OTPCounter, PasswordResetOTP
+
+REQUEST = 'request'
+CHECK = 'check'
+
+
+class OTPRateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Too many attempts, retry in {retry_after} seconds')
+        self.retry_after = retry_after
+
+
+def otp_ttl():
+    return getattr(settings, 'OTP_TTL', 600)
+
+
+def rate_window():
+    return getattr(settings, 'OTP_RATE_WINDOW', 3600)
+
+
+def max_failed_attempts():
+    return getattr(settings, 'OTP_MAX_FAILED_ATTEMPTS', 5)
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def _hit(action, scope, value, limit):
+    """Count one attempt; raise OTPRateLimited if the window's limit is exceeded"""
+    now = timezone.now()
+    window = rate_window()
+    index = int(now.timestamp()) // window
+    key = f'{action}:{scope}:{value.lower()}:{index}'[:255]
+    counters = OTPCounter.objects.filter(key=key)
+    if not counters.update(count=F('count') + 1):
+        expires_at = datetime.fromtimestamp((index + 1) * window, tz=dt_timezone.utc)
+        try:
+            with transaction.atomic():
+                OTPCounter.objects.create(key=key, count=1, expires_at=expires_at)
+        except IntegrityError:
+            counters.update(count=F('count') + 1)
+    if counters.values_list('count', flat=True).first() > limit:
+        raise OTPRateLimited((index + 1) * window - int(now.timestamp()))
+
+
+def hit_request_limits(email, ip):
+    """Count a request for a code; call before looking the user up"""
+    _hit(REQUEST, 'ip', ip, getattr(settings, 'OTP_MAX_REQUESTS_PER_IP', 20))
+    _hit(REQUEST, 'email', email, getattr(settings, 'OTP_MAX_REQUESTS_PER_EMAIL', 5))
+
+
+def hit_check_limit(ip):
+    """Count a check of a code; call before looking the user up"""
+    _hit(CHECK, 'ip', ip, getattr(settings, 'OTP_MAX_CHECKS_PER_IP', 50))
+
+
+def issue_otp(user):
+    """Replace the user's code with a new one and return it"""
+    now = timezone.now()
+    values = {
+        'code': ''.join(secrets.choice('0123456789') for _ in range(6)),
+        'created_at': now,
+        'expires_at': now + timedelta(seconds=otp_ttl()),
+        'verified': False,
+        'failed_attempts': 0,
+    }
+    if not PasswordResetOTP.objects.filter(user=user).update(**values):
+        try:
+            with transaction.atomic():
+                PasswordResetOTP.objects.create(user=user, **values)
+        except IntegrityError:
+            PasswordResetOTP.objects.filter(user=user).update(**values)
+    return values['code']
+
+
+def _matching_otp(user, code):
+    """The user's live code if `code` matches it; wrong guesses are counted"""
+    otp = PasswordResetOTP.objects.filter(
+        user=user, expires_at__gt=timezone.now(), failed_attempts__lt=max_failed_attempts(),
+    ).first()
+    if otp is None:
+        return None
+    if not hmac.compare_digest(otp.code.encode(), str(code).encode()):
+        PasswordResetOTP.objects.filter(pk=otp.pk).update(failed_attempts=F('failed_attempts') + 1)
+        return None
+    return otp
+
+
+def verify_otp(user, code):
+    """Check a code and mark it verified"""
+    otp = _matching_otp(user, code)
+    if otp is None:
+        return False
+    if not otp.verified:
+        otp.verified = True
+        otp.save(update_fields=['verified'])
+    return True
+
+
+def consume_otp(user, code, require_verified=True):
+    """Check a code for the final reset step and delete it, so it is used at most once"""
+    otp = _matching_otp(user, code)
+    if otp is None or (require_verified and not otp.verified):
+        return False
+    deleted, _ = PasswordResetOTP.objects.filter(pk=otp.pk, code=otp.code).delete()
+    return bool(deleted)
+
+
+def _sweep(model, now, batch_size):
+    deleted = 0
+    while True:
+        batch = list(model.objects.filter(expires_at__lt=now).values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        model.objects.filter(pk__in=batch).delete()
+        deleted += len(batch)
+
+
+def sweep_expired(batch_size=1000):
+    """Delete expired codes and counters in batches; returns (codes, counters) deleted"""
+    now = timezone.now()
+    return _sweep(PasswordResetOTP, now, batch_size), _sweep(OTPCounter, now, batch_size)
@@ -0,0 +1,76 @@
+"""
+In-memory registry of Page rows.
+
+The page set is small and changes only when an admin edits it, so each
+worker loads it once and serves name and id lookups from dicts. Page
+save/delete signals reload the local copy and bump a version key in the
+shared cache (see CACHES in config/settings.py); other workers notice the
+new version within CHECK_INTERVAL seconds.
+"""
+import threading
+import time
+
+from .models import Page
+from .versioning import bump_version, get_version
+
+VERSION_KEY = 'page_registry_version'
+
+# How often (in seconds) a worker compares its copy with the shared version
+CHECK_INTERVAL = 5
+
+
+class PageRegistry:
+    def __init__(self, pages, version=None):
+        # The version is read before the pages, so it never claims to be
+        # newer than the data it describes
+        self.pages = list(pages)
+        self.by_name = {page.name: page for page in self.pages}
+        self.by_id = {page.id: page for page in self.pages}
+        self.version = version
+        self.checked_at = time.monotonic()
+
+    def get(self, page_name):
+        return self.by_name.get(page_name)
+
+    def get_id(self, page_name):
+        page = self.by_name.get(page_name)
+        return page.id if page is not None else None
+
+    def get_by_id(self, page_id):
+        return self.by_id.get(page_id)
+
+
+_lock = threading.Lock()
+_registry = None
+
+
+def _shared_version():
+    return get_version(VERSION_KEY)
+
+
+def load_registry():
+    global _registry
+    registry = PageRegistry(Page.objects.all(), _shared_version())
+    with _lock:
+        _registry = registry
+    return registry
+
+
+def get_page_registry():
+    registry = _registry
+    if registry is None:
+        return load_registry()
+    now = time.monotonic()
+    if now - registry.checked_at > CHECK_INTERVAL:
+        registry.checked_at = now
+        if _shared_version() != registry.version:
+            return load_registry()
+    return registry
+
+
+def invalidate_registry():
+    """Reload on next access here and tell other workers to do the same"""
+    global _registry
+    bump_version(VERSION_KEY)
+    with _lock:
+        _registry = None
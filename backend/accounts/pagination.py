@@ -0,0 +1,100 @@
+"""
+Keyset (cursor) pagination for comment lists.
+
+Comments are ordered newest first on (created_at, id). A cursor encodes the
+position of the last row of a page and the direction to read in, so the next
+page is a range scan on the comment_page_keyset_idx index no matter how deep
+it is, unlike OFFSET which has to skip every earlier row.
+"""
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, comment_id, reverse=False):
+    payload = json.dumps([created_at.isoformat(), comment_id, reverse], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id, reverse) or raise InvalidCursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, comment_id, reverse = json.loads(base64.urlsafe_b64decode(padded))
+        created_at = parse_datetime(created_at)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if created_at is None or not isinstance(comment_id, int):
+        raise InvalidCursor('Invalid cursor')
+    return created_at, comment_id, bool(reverse)
+
+
+def get_page_size(request):
+    try:
+        page_size = int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def _position(comment):
+    # Rows may be model instances or dicts from comment_list_values()
+    if isinstance(comment, dict):
+        return comment['created_at'], comment['id']
+    return comment.created_at, comment.id
+
+
+def paginate_comments(queryset, request):
+    """
+    Slice a comment queryset by the request's ?cursor and ?page_size.
+
+    Returns (comments, next_cursor, previous_cursor). Raises InvalidCursor
+    for a cursor that cannot be decoded.
+    """
+    page_size = get_page_size(request)
+    cursor = request.query_params.get('cursor')
+    reverse = False
+
+    if cursor:
+        created_at, comment_id, reverse = decode_cursor(cursor)
+        if reverse:
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=comment_id)
+            )
+        else:
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=comment_id)
+            )
+
+    if reverse:
+        queryset = queryset.order_by('created_at', 'id')
+    else:
+        queryset = queryset.order_by('-created_at', '-id')
+
+    # Fetch one extra row to know whether there is anything beyond this page
+    comments = list(queryset[:page_size + 1])
+    has_more = len(comments) > page_size
+    comments = comments[:page_size]
+    if reverse:
+        comments.reverse()
+
+    next_cursor = previous_cursor = None
+    if comments:
+        first, last = _position(comments[0]), _position(comments[-1])
+        # Reading backwards always came from an older page, and reading
+        # forwards from a cursor always has a newer page behind it
+        if reverse or has_more:
+            next_cursor = encode_cursor(*last)
+        if (has_more if reverse else bool(cursor)):
+            previous_cursor = encode_cursor(*first, reverse=True)
+    return comments, next_cursor, previous_cursor
@@ -0,0 +1,75 @@
+"""
+Versioned permission snapshots stored in the Django cache.
+
+A snapshot is a plain dict (user flags plus a list of permission rows) so it
+pickles cleanly into LocMem, Memcached or Redis. Snapshots live under a key
+that embeds the user's current permission version; bumping the version makes
+every older snapshot unreachable, so reads after an admin edit never see
+stale data and nothing has to be deleted. The cache must be shared by every
+worker (see check_shared_cache in accounts/versioning.py), or a worker would
+keep serving a snapshot another worker has already replaced.
+
+The version keys are bumped from the signal handlers in accounts/signals.py.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import User
+from .versioning import bump_version, get_version
+
+VERSION_KEY = 'user_permissions_version_{user_id}'
+SNAPSHOT_KEY = 'user_permissions_{user_id}_v{version}'
+
+# Snapshots are immutable per version, so they can stay warm for a long time
+SNAPSHOT_TIMEOUT = getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_permission_version(user_id):
+    # Versions are clock based, so a key that was evicted never comes back
+    # with a value that points at an older snapshot
+    return get_version(VERSION_KEY.format(user_id=user_id))
+
+
+def bump_permission_version(user_id):
+    return bump_version(VERSION_KEY.format(user_id=user_id))
+
+
+def build_permission_snapshot(user_id):
+    """Materialize a user's permissions straight from the database"""
+    # One LEFT JOIN from the user to their permission rows
+    rows = list(User.objects.filter(id=user_id).values_list(
+        'role', 'is_active', 'is_superuser',
+        'page_permissions__page_id',
+        'page_permissions__can_view',
+        'page_permissions__can_edit',
+        'page_permissions__can_create',
+        'page_permissions__can_delete',
+    ))
+    if not rows:
+        return None
+    role, is_active, is_superuser = rows[0][:3]
+    return {
+        'user_id': user_id,
+        'role': role,
+        'is_active': is_active,
+        'is_superuser': is_superuser,
+        'permissions': [list(row[3:]) for row in rows if row[3] is not None],
+    }
+
+
+def get_permission_snapshot(user_id, version=None):
+    """
+    Return the snapshot for the user's current permission version.
+
+    Returns None when the user does not exist.
+    """
+    if version is None:
+        version = get_permission_version(user_id)
+    key = SNAPSHOT_KEY.format(user_id=user_id, version=version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_permission_snapshot(user_id)
+        if snapshot is not None:
+            snapshot['version'] = version
+            cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
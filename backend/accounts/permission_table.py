@@ -0,0 +1,152 @@
+"""
+Compiled page permission tables.
+
+Each user's UserPagePermission rows are folded into a single integer with
+4 bits per page (view, edit, create, delete), shifted by the page id. A
+permission check is then a dict lookup for the page id plus a shift and a
+mask, with no queries once the table has been loaded.
+
+Tables are compiled from the versioned snapshots in permission_cache and
+kept per process. A table is reused while its version matches the user's
+current version, and the signal handlers in accounts/signals.py drop it
+straight away when the user's permissions change in this process. Page
+names are resolved through the page registry.
+"""
+import threading
+
+from .page_registry import get_page_registry
+from .permission_cache import get_permission_snapshot, get_permission_version
+
+BITS_PER_PAGE = 4
+
+PERMISSION_BITS = {
+    'view': 1,
+    'edit': 2,
+    'create': 4,
+    'delete': 8,
+}
+
+PAGE_MASK = (1 << BITS_PER_PAGE) - 1
+
+# Upper bound on the number of user tables kept in memory per process
+MAX_TABLES = 10000
+
+_lock = threading.Lock()
+_tables = {}
+
+
+def pack_flags(can_view, can_edit, can_create, can_delete):
+    """Pack the four boolean columns into a 4-bit page nibble"""
+    return (
+        (PERMISSION_BITS['view'] if can_view else 0)
+        | (PERMISSION_BITS['edit'] if can_edit else 0)
+        | (PERMISSION_BITS['create'] if can_create else 0)
+        | (PERMISSION_BITS['delete'] if can_delete else 0)
+    )
+
+
+def unpack_flags(nibble):
+    """Expand a 4-bit page nibble back into the can_* dict used by the API"""
+    return {
+        'can_view': bool(nibble & PERMISSION_BITS['view']),
+        'can_edit': bool(nibble & PERMISSION_BITS['edit']),
+        'can_create': bool(nibble & PERMISSION_BITS['create']),
+        'can_delete': bool(nibble & PERMISSION_BITS['delete']),
+    }
+
+
+class PermissionTable:
+    """Bitmask of one user's page permissions, indexed by page id"""
+
+    __slots__ = ('user_id', 'mask', 'version', 'stale')
+
+    def __init__(self, user_id, mask=0, version=None):
+        self.user_id = user_id
+        self.mask = mask
+        self.version = version
+        self.stale = False
+
+    @classmethod
+    def compile(cls, user_id, rows, version=None):
+        """Build a table from (page_id, can_view, can_edit, can_create, can_delete) rows"""
+        mask = 0
+        for page_id, can_view, can_edit, can_create, can_delete in rows:
+            nibble = pack_flags(can_view, can_edit, can_create, can_delete)
+            mask |= nibble << (page_id * BITS_PER_PAGE)
+        return cls(user_id, mask, version)
+
+    def nibble(self, page_id):
+        if page_id is None:
+            return 0
+        return (self.mask >> (page_id * BITS_PER_PAGE)) & PAGE_MASK
+
+    def has(self, page_id, permission_type):
+        bit = PERMISSION_BITS.get(permission_type)
+        if bit is None:
+            return False
+        return bool(self.nibble(page_id) & bit)
+
+    def flags(self, page_id):
+        return unpack_flags(self.nibble(page_id))
+
+    def page_ids(self):
+        """Ids of every page with at least one permission bit set"""
+        ids = []
+        mask = self.mask
+        page_id = 0
+        while mask:
+            if mask & PAGE_MASK:
+                ids.append(page_id)
+            mask >>= BITS_PER_PAGE
+            page_id += 1
+        return ids
+
+
+def get_page_id(page_name):
+    """Resolve a page name to its id from the page registry"""
+    return get_page_registry().get_id(page_name)
+
+
+def load_permission_table(user_id, version=None):
+    """Load and compile a user's table, reusing the per-process copy when it is current"""
+    if version is None:
+        version = get_permission_version(user_id)
+    table = _tables.get(user_id)
+    if table is not None and not table.stale and table.version == version:
+        return table
+
+    snapshot = get_permission_snapshot(user_id, version)
+    rows = snapshot['permissions'] if snapshot else ()
+    table = PermissionTable.compile(user_id, rows, version)
+    with _lock:
+        if len(_tables) >= MAX_TABLES:
+            _tables.clear()
+        _tables[user_id] = table
+    return table
+
+
+def get_permission_table(user, version=None):
+    """
+    Return the compiled table for a user.
+
+    The table is pinned on the user instance so that every check made while
+    handling a request reads the same snapshot. Callers that have already
+    read the user's permission version can pass it to skip the lookup.
+    """
+    table = getattr(user, '_permission_table', None)
+    if table is None or table.stale:
+        if user.pk is None:
+            table = PermissionTable(None)
+        else:
+            table = load_permission_table(user.pk, version)
+        user._permission_table = table
+    return table
+
+
+def invalidate_user(user_id):
+    """Drop the compiled table of a single user"""
+    with _lock:
+        table = _tables.pop(user_id, None)
+    if table is not None:
+        table.stale = True
+
@@ -0,0 +1,87 @@
+"""
+Full-text search over live comments using the SQLite FTS5 index created in
+migration 0006_comment_fts. The index is kept in sync by triggers on
+accounts_comment, so every write path (views, bulk imports, raw SQL) is
+covered.
+
+Results are ordered by bm25 rank, then comment id, and paginated with a
+keyset cursor on (rank, id).
+"""
+import base64
+import binascii
+import json
+
+from django.db import connection
+
+FTS_TABLE = 'accounts_comment_fts'
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+class InvalidSearchCursor(ValueError):
+    pass
+
+
+def search_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(query):
+    """Quote every term so user input is never parsed as FTS5 syntax; terms are ANDed"""
+    terms = query.split()
+    return ' '.join('"%s"' % term.replace('"', '""') for term in terms)
+
+
+def encode_search_cursor(rank, comment_id):
+    payload = json.dumps([rank, comment_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, comment_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidSearchCursor('Invalid cursor')
+    if not isinstance(rank, (int, float)) or not isinstance(comment_id, int):
+        raise InvalidSearchCursor('Invalid cursor')
+    return rank, comment_id
+
+
+def search_comment_ids(query, page_names, limit, cursor=None):
+    """
+    Return ([(comment_id, rank), ...], next_cursor) for comments on the given
+    pages that match every term of the query.
+    """
+    if not search_available():
+        raise SearchUnavailable('Full-text search requires SQLite FTS5')
+
+    match = build_match_query(query)
+    page_names = list(page_names)
+    if not match or not page_names:
+        return [], None
+
+    sql = [
+        f'SELECT rowid, bm25({FTS_TABLE}) AS score FROM {FTS_TABLE}',
+        f'WHERE {FTS_TABLE} MATCH %s',
+        'AND page_name IN (%s)' % ', '.join(['%s'] * len(page_names)),
+    ]
+    params = [match, *page_names]
+    if cursor:
+        rank, comment_id = decode_search_cursor(cursor)
+        sql.append(f'AND (bm25({FTS_TABLE}) > %s OR (bm25({FTS_TABLE}) = %s AND rowid > %s))')
+        params += [rank, rank, comment_id]
+    sql.append('ORDER BY score, rowid LIMIT %s')
+    params.append(limit + 1)
+
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(' '.join(sql), params)
+        rows = db_cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_search_cursor(rows[-1][1], rows[-1][0])
+    return rows, next_cursor
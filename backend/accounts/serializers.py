@@ -1,7 +1,15 @@
 from rest_framework import serializers
-from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.password_validation import validate_password
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
 from .models import User, Page, Comment, CommentHistory, UserPagePermission
+from .history_storage import DELTA, expand_history
+from . import hashing_pool
+from .token_revocation import RevocableRefreshToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 import random
 import string
 
@@ -30,14 +38,12 @@ class UserLoginSerializer(serializers.Serializer):
         password = data.get('password')
         
         if email and password:
-            user = authenticate(username=email, password=password)
-            if user:
-                if user.is_active:
-                    data['user'] = user
-                else:
-                    raise serializers.ValidationError('User account is disabled.')
-            else:
+            user = User.objects.filter(email=email).first()
+            if not hashing_pool.verify_password(user, password):
                 raise serializers.ValidationError('Invalid credentials.')
+            if not user.is_active:
+                raise serializers.ValidationError('User account is disabled.')
+            data['user'] = user
         else:
             raise serializers.ValidationError('Email and password are required.')
         
@@ -53,6 +59,10 @@ class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField()
 
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh (and rotate) tokens through the revocation store"""
+    token_class = RevocableRefreshToken
+
 class PasswordResetRequestSerializer(serializers.Serializer):
     email = serializers.EmailField()
     
@@ -113,6 +123,32 @@ class BulkPermissionUpdateSerializer(serializers.Serializer):
             raise serializers.ValidationError("Page does not exist.")
         return value
 
+class BulkPermissionMatrixSerializer(serializers.Serializer):
+    """Applies one set of permission flags to every (user, page) cell of the matrix"""
+    MAX_CELLS = 10000
+    
+    user_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    page_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    can_view = serializers.BooleanField(default=False)
+    can_edit = serializers.BooleanField(default=False)
+    can_create = serializers.BooleanField(default=False)
+    can_delete = serializers.BooleanField(default=False)
+    
+    def validate(self, data):
+        # Existence of the ids is checked by the view in one query per table
+        data['user_ids'] = list(dict.fromkeys(data['user_ids']))
+        data['page_ids'] = list(dict.fromkeys(data['page_ids']))
+        if len(data['user_ids']) * len(data['page_ids']) > self.MAX_CELLS:
+            raise serializers.ValidationError(f"At most {self.MAX_CELLS} cells can be updated at once.")
+        return data
+
+class PermissionCheckSerializer(serializers.Serializer):
+    page = serializers.CharField(max_length=100)
+    action = serializers.ChoiceField(choices=UserPagePermission.PERMISSION_CHOICES)
+
+class BatchPermissionCheckSerializer(serializers.Serializer):
+    checks = PermissionCheckSerializer(many=True, allow_empty=False, max_length=500)
+
 class UserCreationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     
@@ -121,10 +157,10 @@ class UserCreationSerializer(serializers.ModelSerializer):
         fields = ('id', 'email', 'username', 'first_name', 'last_name', 'role', 'password')
     
     def create(self, validated_data):
-        password = validated_data.pop('password')
+        password = hashing_pool.run_sync(make_password, validated_data.pop('password'))
         user = User.objects.create_user(**validated_data)
-        user.set_password(password)
-        user.save()
+        user.password = password
+        user.save(update_fields=['password'])
         return user
 
 class UserTableSerializer(serializers.ModelSerializer):
@@ -152,6 +188,65 @@ class CommentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['user', 'created_at', 'modified_at', 'modified_by']
 
+# Columns needed to render a comment list, fetched with both user joins in one query
+COMMENT_LIST_FIELDS = (
+    'id', 'user_id', 'user__username', 'user__email', 'page_name', 'content',
+    'created_at', 'modified_at', 'modified_by_id', 'modified_by__username', 'is_deleted',
+)
+
+PAGE_DISPLAY_NAMES = dict(Comment.PAGE_CHOICES)
+
+
+def comment_list_values(queryset):
+    """Narrow a Comment queryset to the columns serialize_comment_rows needs"""
+    return queryset.values(*COMMENT_LIST_FIELDS)
+
+
+def _format_datetime(value):
+    # Same output as DRF's DateTimeField with the default ISO 8601 format
+    if settings.USE_TZ and timezone.is_aware(value):
+        value = value.astimezone(timezone.get_current_timezone())
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def serialize_comment_rows(rows):
+    """
+    Fast read-only equivalent of CommentSerializer(comments, many=True).data.
+
+    Takes rows from comment_list_values() and builds the dicts directly.
+    Like the DRF serializer, modified_by_name is left out when there is no
+    modifying user.
+    """
+    data = []
+    for row in rows:
+        item = {
+            'id': row['id'],
+            'user': row['user_id'],
+            'user_name': row['user__username'],
+            'user_email': row['user__email'],
+            'page_name': row['page_name'],
+            'page_display_name': PAGE_DISPLAY_NAMES.get(row['page_name'], row['page_name']),
+            'content': row['content'],
+            'created_at': _format_datetime(row['created_at']),
+            'modified_at': _format_datetime(row['modified_at']),
+            'modified_by': row['modified_by_id'],
+        }
+        if row['modified_by_id'] is not None:
+            item['modified_by_name'] = row['modified_by__username']
+        item['is_deleted'] = row['is_deleted']
+        data.append(item)
+    return data
+
+class CommentHistoryListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Rebuild delta-stored rows in one pass before the per-row fields run
+        entries = list(data.all() if isinstance(data, models.Manager) else data)
+        expand_history(entries)
+        return super().to_representation(entries)
+
 class CommentHistorySerializer(serializers.ModelSerializer):
     """For showing the history of changes to super admin"""
     user_name = serializers.CharField(source='user.username', read_only=True)
@@ -163,10 +258,44 @@ class CommentHistorySerializer(serializers.ModelSerializer):
         model = CommentHistory
         fields = ['id', 'user', 'user_name', 'user_email', 'user_role', 
                  'action', 'old_content', 'new_content', 'timestamp', 'formatted_timestamp']
+        list_serializer_class = CommentHistoryListSerializer
+    
+    def to_representation(self, instance):
+        if instance.storage == DELTA and instance.old_content is None and instance.new_content is None:
+            expand_history([instance])
+        return super().to_representation(instance)
     
     def get_formatted_timestamp(self, obj):
         return obj.timestamp.strftime('%B %d, %Y, %I:%M:%S %p')
 
+class BatchCommentHistorySerializer(serializers.Serializer):
+    MAX_COMMENTS = 200
+    MAX_ENTRIES = 50
+    
+    comment_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=MAX_COMMENTS
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_ENTRIES, default=10)
+
+class BulkCommentModerationSerializer(serializers.Serializer):
+    """Soft-deletes comments picked by id or by a filter (page, author, creation time)"""
+    MAX_COMMENTS = 1000
+    
+    comment_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False, max_length=MAX_COMMENTS
+    )
+    page_name = serializers.ChoiceField(choices=Comment.PAGE_CHOICES, required=False)
+    user_id = serializers.IntegerField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("Provide comment_ids or at least one filter.")
+        if 'created_after' in data and 'created_before' in data and data['created_after'] >= data['created_before']:
+            raise serializers.ValidationError("created_after must be before created_before.")
+        return data
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
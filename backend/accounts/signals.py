@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import ArchivedCommentHistory, CommentHistory, User, Page, UserPagePermission
+from . import authentication, conditional, history_storage, page_registry, permission_cache, permission_table
+
+
+def invalidate_user_permissions(user_id):
+    """
+    Bump the user's snapshot version and drop the compiled table.
+
+    The bump is repeated after commit so a snapshot rebuilt by another
+    request before this transaction committed cannot stay current.
+    """
+    def invalidate():
+        permission_cache.bump_permission_version(user_id)
+        permission_table.invalidate_user(user_id)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=UserPagePermission)
+@receiver(post_delete, sender=UserPagePermission)
+def invalidate_user_permission_table(sender, instance, **kwargs):
+    """Recompile the owner's permission table on the next check"""
+    invalidate_user_permissions(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_access_state(sender, instance, created, update_fields=None, **kwargs):
+    """Role, activation or superuser changes are part of the cached snapshot"""
+    if update_fields is not None and not set(update_fields) & set(User.ACCESS_FIELDS):
+        return
+    state = instance.access_state()
+    if created or state != getattr(instance, '_loaded_access_state', None):
+        invalidate_user_permissions(instance.pk)
+    instance._loaded_access_state = state
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_display_state(sender, instance, created, update_fields=None, **kwargs):
+    """Usernames and emails are embedded in comment lists"""
+    if update_fields is not None and not set(update_fields) & set(User.DISPLAY_FIELDS):
+        return
+    state = instance.display_state()
+    # A new user has no comments yet
+    if not created and state != getattr(instance, '_loaded_display_state', None):
+        conditional.bump_comment_authors_version()
+    instance._loaded_display_state = state
+
+
+@receiver(pre_delete, sender=User)
+def keep_history_readable(sender, instance, **kwargs):
+    """The user's history rows are cascade-deleted; rows diffed against them must not be left dangling"""
+    for model in (CommentHistory, ArchivedCommentHistory):
+        history_storage.snapshot_dependents(model.objects.filter(user=instance))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    invalidate_user_permissions(instance.pk)
+    conditional.bump_comment_authors_version()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_authenticated_user(sender, instance, **kwargs):
+    """Drop the snapshot request.user is built from, again after commit"""
+    authentication.invalidate_cached_user(instance.pk)
+    transaction.on_commit(lambda: authentication.invalidate_cached_user(instance.pk))
+
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def reload_page_registry(sender, instance, **kwargs):
+    """Keep name and id lookups in step with the Page table"""
+    page_registry.invalidate_registry()
+    transaction.on_commit(page_registry.invalidate_registry)
@@ -1,3 +1,1280 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    authentication, comment_events, conditional, hashing_pool, login_throttle, page_registry,
+    permission_cache, permission_table, token_revocation, views,
+)
+from .email_outbox import enqueue_email, process_outbox
+from .history_storage import DELTA, FULL, expand_history
+from .comment_import import get_checkpoint, import_comments
+from .comment_stats import comment_created
+from .models import (
+    ArchivedComment, ArchivedCommentHistory, Comment, CommentEvent, CommentHistory, OutboxEmail, Page,
+    PageCommentStats, RevokedToken, User, UserPagePermission,
+)
+from .permission_cache import VERSION_KEY as PERMISSION_VERSION_KEY
+from .serializers import CommentSerializer, comment_list_values, serialize_comment_rows
+from .versioning import check_shared_cache
+
+
+class ThrottleStoreMixin:
+    """Keep login throttle counters in a temporary file instead of the one next to the database"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store_settings = self.settings(LOGIN_THROTTLE_STORE=Path(directory.name) / 'login_throttle.sqlite3')
+        store_settings.enable()
+        self.addCleanup(store_settings.disable)
+
+
+class SharedCacheMixin:
+    """
+    Give each test an empty cache of its own. Other connections to it,
+    from caches.create_connection(), stand in for other workers.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache_settings = self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': self.id(),
+        }})
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        # Pages created by an earlier test were rolled back, but this
+        # process may still hold a registry that lists them
+        page_registry.load_registry()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked with SQLite EXPLAIN QUERY PLAN')
+class HotQueryIndexTests(TestCase):
+    """The hot read queries must be index searches with no table scan or sort step"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'USING (COVERING )?INDEX {index_name}\b')
+        self.assertNotIn('USE TEMP B-TREE', plan)
+        self.assertNotRegex(plan, r'SCAN accounts_\w+\b(?! USING)')
+
+    def test_comment_list_uses_partial_keyset_index(self):
+        comments = Comment.objects.filter(page_name='order_list', is_deleted=False)
+        self.assertUsesIndex(comments, 'comment_page_keyset_idx')
+        self.assertUsesIndex(comments.order_by('-created_at', '-id'), 'comment_page_keyset_idx')
+
+    def test_comment_history_uses_composite_index(self):
+        history = CommentHistory.objects.filter(comment_id=1)
+        self.assertUsesIndex(history, 'commenthistory_comment_ts_idx')
+
+    def test_permission_snapshot_uses_covering_index(self):
+        permissions = UserPagePermission.objects.filter(user_id=1).order_by('page_id').values_list(
+            'page_id', 'can_view', 'can_edit', 'can_create', 'can_delete'
+        )
+        self.assertUsesIndex(permissions, 'permission_user_covering_idx')
+
+    def test_permission_matrix_uses_covering_index(self):
+        matrix = UserPagePermission.objects.filter(user_id__gt=0).order_by('user_id', 'page_id').values_list(
+            'user_id', 'page_id', 'can_view', 'can_edit', 'can_create', 'can_delete'
+        )
+        self.assertUsesIndex(matrix, 'permission_user_covering_idx')
+
+
+class CountingBackend(LocmemBackend):
+    """The locmem backend, counting connections and refusing @bounce.test recipients"""
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(recipient.endswith('@bounce.test') for recipient in message.recipients()):
+                raise SMTPRecipientsRefused({message.recipients()[0]: (550, b'No such user')})
+        return super().send_messages(messages)
+
+
+class DownBackend(LocmemBackend):
+    def open(self):
+        raise SMTPServerDisconnected('Connection unexpectedly closed')
+
+
+@override_settings(
+    EMAIL_BACKEND='accounts.tests.CountingBackend',
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_RETRY_DELAY=30,
+)
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        CountingBackend.opened = 0
+        self.user = User.objects.create_user(username='reset', email='reset@example.com', password='x')
+
+    def make_due(self):
+        OutboxEmail.objects.filter(status=OutboxEmail.PENDING).update(next_attempt_at=timezone.now())
+
+    def test_password_reset_request_only_enqueues(self):
+        response = APIClient().post('/api/auth/password/reset/request/', {'email': 'reset@example.com'})
+        self.assertEqual(response.status_code, 200)
+        request = APIRequestFactory().post('/', {'email': 'reset@example.com'}, format='json')
+        self.assertEqual(views.request_password_reset(request).status_code, 200)
+
+        self.assertEqual(mail.outbox, [])
+        queued = OutboxEmail.objects.all()
+        self.assertEqual([message.status for message in queued], [OutboxEmail.PENDING] * 2)
+        self.assertEqual(queued[0].recipients, ['reset@example.com'])
+
+    def test_batch_is_sent_over_one_connection(self):
+        for i in range(5):
+            enqueue_email('Subject', f'Body {i}', [f'user{i}@example.com'])
+        self.assertEqual(process_outbox(batch_size=10), (5, 0))
+
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.SENT).exists())
+        self.assertEqual(process_outbox(), (0, 0))
+
+    def test_failed_message_is_retried_with_backoff_then_given_up(self):
+        enqueue_email('Subject', 'Body', ['ok@example.com'])
+        bounced = enqueue_email('Subject', 'Body', ['nobody@bounce.test'])
+
+        self.assertEqual(process_outbox(), (1, 1))
+        bounced.refresh_from_db()
+        self.assertEqual((bounced.status, bounced.attempts), (OutboxEmail.PENDING, 1))
+        self.assertIn('SMTPRecipientsRefused', bounced.last_error)
+        delay = bounced.next_attempt_at - timezone.now()
+        self.assertTrue(timedelta(seconds=25) < delay <= timedelta(seconds=30))
+        # Not due yet
+        self.assertEqual(process_outbox(), (0, 0))
+
+        self.make_due()
+        process_outbox()
+        bounced.refresh_from_db()
+        delay = bounced.next_attempt_at - timezone.now()
+        self.assertTrue(timedelta(seconds=55) < delay <= timedelta(seconds=60))
+
+        self.make_due()
+        process_outbox()
+        bounced.refresh_from_db()
+        self.assertEqual((bounced.status, bounced.attempts), (OutboxEmail.FAILED, 3))
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(EMAIL_BACKEND='accounts.tests.DownBackend')
+    def test_unreachable_server_retries_whole_batch(self):
+        enqueue_email('Subject', 'Body', ['a@example.com'])
+        enqueue_email('Subject', 'Body', ['b@example.com'])
+        self.assertEqual(process_outbox(), (0, 2))
+        self.assertEqual(
+            list(OutboxEmail.objects.values_list('status', 'attempts')),
+            [(OutboxEmail.PENDING, 1)] * 2,
+        )
+
+        with override_settings(EMAIL_BACKEND='accounts.tests.CountingBackend'):
+            self.make_due()
+            self.assertEqual(process_outbox(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class PermissionInvalidationTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='viewer', email='viewer@example.com', password='x')
+        self.page, _ = Page.objects.get_or_create(name='order_list')
+        self.permission = UserPagePermission.objects.create(user=self.user, page=self.page, can_view=True)
+        self.client = self.client_for(self.user)
+        self.url = '/api/auth/pages/order_list/comments/'
+
+    def test_revoked_permission_is_refused_on_next_request(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.permission.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_change_made_by_another_worker_is_seen(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        # Another worker revokes the permission: no signal runs in this
+        # process, only the version in the shared cache moves
+        UserPagePermission.objects.filter(pk=self.permission.pk).update(can_view=False)
+        other_worker = caches.create_connection('default')
+        other_worker.set(PERMISSION_VERSION_KEY.format(user_id=self.user.pk), time.time_ns(), None)
+
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_unshared_cache_is_refused_with_several_workers(self):
+        with self.settings(WEB_CONCURRENCY=2):
+            with self.assertRaises(ImproperlyConfigured):
+                check_shared_cache()
+        check_shared_cache()
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with self.settings(CACHES=redis, WEB_CONCURRENCY=2):
+            check_shared_cache()
+
+
+class PageRegistryTests(SharedCacheMixin, TestCase):
+    def test_page_added_by_another_worker_is_seen_after_check_interval(self):
+        registry = page_registry.get_page_registry()
+        self.assertIsNone(registry.get('invoices'))
+
+        # Another worker adds a page: no signal runs here, only the shared version moves
+        Page.objects.bulk_create([Page(name='invoices')])
+        caches.create_connection('default').set(page_registry.VERSION_KEY, time.time_ns(), None)
+        self.assertIs(page_registry.get_page_registry(), registry)
+
+        registry.checked_at -= page_registry.CHECK_INTERVAL + 1
+        self.assertIsNotNone(page_registry.get_page_registry().get('invoices'))
+
+
+@override_settings(COMMENT_HISTORY_STORAGE=DELTA, COMMENT_HISTORY_SNAPSHOT_INTERVAL=3)
+class CommentHistoryStorageTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='x')
+        self.comment = Comment.objects.create(
+            user=self.author, page_name='order_list', content='The first version of this comment',
+        )
+
+    def edit(self, user, old_content, new_content):
+        return CommentHistory.objects.create(
+            comment=self.comment, user=user, action='EDIT', old_content=old_content, new_content=new_content,
+        )
+
+    def test_delta_round_trip(self):
+        texts = [self.comment.content]
+        for i in range(1, 7):
+            texts.append(f'{texts[-1]}, edit {i}')
+            self.edit(self.author, texts[-2], texts[-1])
+
+        stored = list(CommentHistory.objects.filter(comment=self.comment).order_by('id'))
+        self.assertEqual([row.storage for row in stored], [FULL, DELTA, DELTA, FULL, DELTA, DELTA])
+        self.assertEqual([row.new_content is None for row in stored], [False, True, True, False, True, True])
+
+        expand_history(stored)
+        self.assertEqual([(row.old_content, row.new_content) for row in stored], list(zip(texts, texts[1:])))
+
+        # Bases missing from the entries are fetched
+        last = list(CommentHistory.objects.filter(id=stored[-1].id))
+        expand_history(last)
+        self.assertEqual((last[0].old_content, last[0].new_content), (texts[-2], texts[-1]))
+
+    def test_missing_bases_are_read_with_one_query(self):
+        texts = [self.comment.content]
+        for i in range(1, 22):
+            texts.append(f'{texts[-1]}, edit {i}')
+            self.edit(self.author, texts[-2], texts[-1])
+
+        newest = list(CommentHistory.objects.filter(comment=self.comment).order_by('-id')[:2])
+        self.assertEqual([row.storage for row in newest], [DELTA, DELTA])
+        with self.assertNumQueries(1):
+            expand_history(newest)
+        self.assertEqual([row.new_content for row in newest], [texts[-1], texts[-2]])
+
+    def test_history_survives_deleting_the_user_of_its_base_row(self):
+        moderator = User.objects.create_user(username='moderator', email='moderator@example.com', password='x')
+        admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='superadmin',
+        )
+        page, _ = Page.objects.get_or_create(name='order_list')
+        UserPagePermission.objects.create(user=moderator, page=page, can_view=True, can_delete=True)
+        url = f'/api/auth/comments/{self.comment.id}/'
+        self.assertEqual(self.client_for(moderator).delete(url).status_code, 200)
+        admin_client = self.client_for(admin)
+        self.assertEqual(admin_client.post(url + 'restore/').status_code, 200)
+        restore = CommentHistory.objects.get(comment=self.comment, action='RESTORE')
+        self.assertEqual(restore.storage, DELTA)
+
+        moderator.delete()
+
+        restore.refresh_from_db()
+        self.assertEqual(restore.storage, FULL)
+        response = admin_client.get(url + 'history/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(entry['action'], entry['new_content']) for entry in response.data],
+            [('RESTORE', self.comment.content)],
+        )
+
+    def test_missing_base_is_not_an_error(self):
+        first = self.edit(self.author, self.comment.content, self.comment.content + ', edited')
+        second = self.edit(self.author, self.comment.content + ', edited', self.comment.content + ', edited twice')
+        self.assertEqual(second.storage, DELTA)
+        # Deleted without going through snapshot_dependents
+        CommentHistory.objects.filter(id=first.id).delete()
+
+        entries = expand_history(list(CommentHistory.objects.filter(comment=self.comment)))
+        self.assertEqual([(entry.old_content, entry.new_content) for entry in entries], [(None, None)])
+
+
+class ConditionalGetTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='x')
+        page, _ = Page.objects.get_or_create(name='order_list')
+        UserPagePermission.objects.create(user=self.user, page=page, can_view=True)
+        self.client = self.client_for(self.user)
+        self.url = '/api/auth/pages/order_list/comments/'
+
+    def test_comment_added_by_another_worker_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Another worker adds a comment: only the version in the shared cache moves here
+        Comment.objects.bulk_create([Comment(user=self.user, page_name='order_list', content='New')])
+        list_key = conditional.COMMENT_LIST_VERSION_KEY.format(page_name='order_list')
+        caches.create_connection('default').set(list_key, time.time_ns(), None)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([comment['content'] for comment in response.data['results']], ['New'])
+
+    def test_unchanged_comment_list_is_answered_without_queries(self):
+        Comment.objects.create(user=self.user, page_name='order_list', content='Old')
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+
+    def test_permission_is_checked_before_answering_304(self):
+        etag = self.client.get(self.url)['ETag']
+        UserPagePermission.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 403)
+
+    def test_page_list_route_answers_304(self):
+        self.user.is_staff = True
+        self.user.save()
+        url = '/api/auth/pages/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('order_list', [page['name'] for page in response.data])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Page.objects.create(name='invoices')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('invoices', [page['name'] for page in response.data])
+
+
+class BulkModerationTests(SharedCacheMixin, TestCase):
+    url = '/api/auth/comments/moderate/'
+
+    def setUp(self):
+        super().setUp()
+        self.moderator = User.objects.create_user(username='moderator', email='moderator@example.com', password='x')
+        page, _ = Page.objects.get_or_create(name='order_list')
+        UserPagePermission.objects.create(user=self.moderator, page=page, can_view=True, can_delete=True)
+        self.client = self.client_for(self.moderator)
+
+    def make_comments(self, page_name, count):
+        comments = []
+        for i in range(count):
+            comment = Comment.objects.create(user=self.moderator, page_name=page_name, content=f'Comment {i}')
+            comment_created(comment)
+            comments.append(comment)
+        return comments
+
+    def counters(self, page_name):
+        stats = PageCommentStats.objects.get(page_name=page_name)
+        return stats.live_count, stats.deleted_count
+
+    def test_deletes_on_allowed_pages_only(self):
+        allowed = self.make_comments('order_list', 3)
+        forbidden = self.make_comments('clients', 2)
+        response = self.client.post(
+            self.url, {'comment_ids': [comment.id for comment in allowed + forbidden]}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted'], 3)
+        self.assertEqual(response.data['forbidden'], ['clients'])
+        self.assertEqual(self.counters('order_list'), (0, 3))
+        self.assertEqual(self.counters('clients'), (2, 0))
+        self.assertEqual(CommentHistory.objects.filter(action='DELETE').count(), 3)
+
+        # Already deleted comments are not picked again
+        response = self.client.post(self.url, {'page_name': 'order_list'}, format='json')
+        self.assertEqual(response.data['deleted'], 0)
+        self.assertEqual(self.counters('order_list'), (0, 3))
+
+    def delete_racing_another_request(self):
+        """Run the moderation request while another request deletes the first comment before its UPDATE"""
+        comments = self.make_comments('order_list', 3)
+        soft_delete = views._soft_delete_comments
+
+        def racing_soft_delete(ids, now):
+            Comment.objects.filter(id=comments[0].id).update(is_deleted=True, modified_at=now)
+            return soft_delete(ids, now)
+
+        with mock.patch.object(views, '_soft_delete_comments', racing_soft_delete):
+            response = self.client.post(self.url, {'page_name': 'order_list'}, format='json')
+
+        # Even with the same modified_at, the other request's row is not counted here
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(response.data['pages'], {'order_list': 2})
+        self.assertEqual(self.counters('order_list'), (1, 2))
+        self.assertEqual(
+            set(CommentHistory.objects.filter(action='DELETE').values_list('comment_id', flat=True)),
+            {comments[1].id, comments[2].id},
+        )
+        self.assertEqual(
+            set(CommentEvent.objects.filter(event_type=comment_events.DELETED).values_list('comment_id', flat=True)),
+            {comments[1].id, comments[2].id},
+        )
+
+    def test_comment_deleted_concurrently_is_not_counted_twice(self):
+        self.delete_racing_another_request()
+
+    def test_comment_deleted_concurrently_without_returning(self):
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            self.delete_racing_another_request()
+
+
+class CommentImportTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(username='importer', email='importer@example.com', password='x')
+
+    def run_import(self, records):
+        errors = []
+        checkpoint = get_checkpoint('test')
+        for checkpoint in import_comments(records, checkpoint, on_error=lambda position, e: errors.append(position)):
+            pass
+        return checkpoint, errors
+
+    def test_malformed_records_are_skipped(self):
+        valid = {'user_email': 'importer@example.com', 'page_name': 'order_list', 'content': 'Imported'}
+        records = [
+            json.dumps(valid),
+            'not json',
+            json.dumps([valid]),
+            json.dumps({**valid, 'created_at': 1700000000}),
+            json.dumps({**valid, 'user_email': ['importer@example.com']}),
+            json.dumps({**valid, 'page_name': ['order_list']}),
+            json.dumps({**valid, 'page_name': {'name': 'order_list'}}),
+            json.dumps({**valid, 'content': 42}),
+            json.dumps({**valid, 'history': [{'action': ['EDIT'], 'user_email': 'importer@example.com'}]}),
+            json.dumps({**valid, 'history': [{'action': 'EDIT', 'user_email': 'importer@example.com', 'timestamp': {}}]}),
+            json.dumps({**valid, 'user_email': 'nobody@example.com'}),
+            json.dumps({**valid, 'content': 'Imported too'}),
+        ]
+        checkpoint, errors = self.run_import(records)
+
+        self.assertEqual((checkpoint.records_read, checkpoint.comments_created, checkpoint.skipped), (12, 2, 10))
+        self.assertEqual(errors, list(range(2, 12)))
+        self.assertEqual(
+            sorted(Comment.objects.values_list('content', flat=True)), ['Imported', 'Imported too'],
+        )
+
+    @override_settings(COMMENT_HISTORY_STORAGE=DELTA)
+    def test_source_timestamps_are_kept(self):
+        text = 'The order was shipped to the warehouse on Monday. Version '
+        record = {
+            'user_email': 'importer@example.com', 'page_name': 'order_list', 'content': f'{text}2',
+            'created_at': '2021-03-04T05:06:07Z', 'modified_at': '2021-03-05T00:00:00Z',
+            'history': [
+                {'user_email': 'importer@example.com', 'action': 'EDIT', 'old_content': f'{text}{i}',
+                 'new_content': f'{text}{i + 1}', 'timestamp': f'2021-03-04T1{i}:00:00Z'}
+                for i in range(2)
+            ],
+        }
+        self.run_import([json.dumps(record)])
+
+        comment = Comment.objects.get()
+        self.assertEqual(comment.created_at.isoformat(), '2021-03-04T05:06:07+00:00')
+        self.assertEqual(comment.modified_at.isoformat(), '2021-03-05T00:00:00+00:00')
+        history = list(CommentHistory.objects.filter(comment=comment).order_by('id'))
+        self.assertEqual([entry.storage for entry in history], [FULL, DELTA])
+        self.assertEqual(
+            [entry.timestamp.isoformat() for entry in history],
+            ['2021-03-04T10:00:00+00:00', '2021-03-04T11:00:00+00:00'],
+        )
+
+        # Other writes still get the current time
+        other = Comment.objects.create(user=comment.user, page_name='order_list', content='Live')
+        self.assertGreater(other.created_at, timezone.now() - timedelta(minutes=1))
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='jwt', email='jwt@example.com', password='x')
+        token = RefreshToken.for_user(self.user).access_token
+        self.request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def authenticate(self):
+        return authentication.CachedJWTAuthentication().authenticate(self.request)[0]
+
+    def test_warm_request_makes_no_queries(self):
+        first = self.authenticate()
+        with self.assertNumQueries(0):
+            second = self.authenticate()
+        self.assertEqual(second.pk, self.user.pk)
+        # Each request gets its own instance
+        self.assertIsNot(first, second)
+
+    def test_user_saved_in_this_process_is_reloaded_at_once(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(JWT_USER_CACHE_TTL=30)
+    def test_user_changed_elsewhere_is_reloaded_after_ttl(self):
+        self.authenticate()
+        # Another worker deactivates the user: no signal runs in this process
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertTrue(self.authenticate().is_active)
+
+        later = time.monotonic() + 31
+        with mock.patch('accounts.authentication.time.monotonic', return_value=later):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
+    def test_load_racing_with_a_save_is_not_kept(self):
+        real_first = QuerySet.first
+
+        def first_then_save(queryset):
+            row = real_first(queryset)
+            # The user is saved after the row was read but before it is cached
+            authentication.invalidate_cached_user(self.user.pk)
+            return row
+
+        with mock.patch.object(QuerySet, 'first', first_then_save):
+            self.authenticate()
+        self.assertNotIn(self.user.pk, authentication._users)
+
+        self.authenticate()
+        self.assertIn(self.user.pk, authentication._users)
+
+
+class TokenRevocationTests(SharedCacheMixin, TestCase):
+    refresh_url = '/api/auth/token/refresh/'
+
+    def setUp(self):
+        super().setUp()
+        token_revocation._revoked = None
+        self.user = User.objects.create_user(username='tokens', email='tokens@example.com', password='x')
+        self.refresh = str(RefreshToken.for_user(self.user))
+
+    def refresh_token(self, refresh):
+        return APIClient().post(self.refresh_url, {'refresh': refresh}, format='json')
+
+    def test_logout_revokes_the_refresh_token(self):
+        response = self.client_for(self.user).post('/api/auth/logout/', {'refresh_token': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh_token(self.refresh).status_code, 401)
+
+    def test_rotated_token_cannot_be_reused(self):
+        response = self.refresh_token(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        rotated = response.data['refresh']
+
+        self.assertEqual(self.refresh_token(self.refresh).status_code, 401)
+        self.assertEqual(self.refresh_token(rotated).status_code, 200)
+
+    def test_false_positive_is_checked_against_the_table(self):
+        self.refresh_token(self.refresh)
+        jti = RefreshToken(self.refresh)['jti']
+        with mock.patch.object(token_revocation.BloomFilter, '__contains__', return_value=True):
+            self.assertTrue(token_revocation.is_revoked(jti))
+            with self.assertNumQueries(1):
+                self.assertFalse(token_revocation.is_revoked('never-revoked'))
+
+    def test_revocation_committed_out_of_id_order_is_found(self):
+        expires_at = timezone.now() + timedelta(days=1)
+        for i in range(5):
+            token_revocation.revoke(f'early-{i}', expires_at)
+        RevokedToken.objects.filter(jti='early-1').delete()
+        self.assertFalse(token_revocation.is_revoked('late'))
+
+        # Another worker's transaction took the deleted id and commits only now
+        late_id = RevokedToken.objects.get(jti='early-0').id + 1
+        RevokedToken.objects.create(id=late_id, jti='late', expires_at=expires_at)
+        caches.create_connection('default').set(token_revocation.REVOKED_VERSION_KEY, time.time_ns(), None)
+        token_revocation._revoked.synced_at -= token_revocation.SYNC_INTERVAL
+
+        self.assertIn('late', token_revocation._revoked_set().filter)
+
+
+@override_settings(
+    OTP_MAX_REQUESTS_PER_EMAIL=2, OTP_MAX_REQUESTS_PER_IP=10, OTP_MAX_CHECKS_PER_IP=5, OTP_MAX_FAILED_ATTEMPTS=2,
+)
+class PasswordResetOTPTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='otp', email='otp@example.com', password='Old-password-1')
+        self.client = APIClient()
+
+    def request_code(self, email='otp@example.com'):
+        return self.client.post('/api/auth/password/reset/request/', {'email': email}, format='json')
+
+    def verify(self, otp):
+        return self.client.post('/api/auth/password/reset/verify/', {'email': 'otp@example.com', 'otp': otp}, format='json')
+
+    def confirm(self, otp):
+        return self.client.post(
+            '/api/auth/password/reset/confirm/',
+            {'email': 'otp@example.com', 'otp': otp, 'new_password': 'New-password-1'}, format='json',
+        )
+
+    def test_reset_flow_uses_the_code_once(self):
+        otp = self.request_code().data['otp']
+        self.assertEqual(self.verify(otp).status_code, 200)
+        self.assertEqual(self.confirm(otp).status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('New-password-1'))
+        self.assertEqual(self.confirm(otp).status_code, 400)
+
+    def test_requests_are_limited_per_email(self):
+        self.assertEqual(self.request_code().status_code, 200)
+        self.assertEqual(self.request_code().status_code, 200)
+        response = self.request_code()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        # The limit is per email; this one is unknown, so it is refused as invalid
+        self.assertEqual(self.request_code('other@example.com').status_code, 400)
+
+    def test_checks_are_limited_per_ip(self):
+        otp = self.request_code().data['otp']
+        wrong = '000000' if otp != '000000' else '111111'
+        for _ in range(5):
+            self.assertEqual(self.verify(wrong).status_code, 400)
+        response = self.verify(otp)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_code_stops_working_after_too_many_wrong_guesses(self):
+        otp = self.request_code().data['otp']
+        wrong = '000000' if otp != '000000' else '111111'
+        self.assertEqual(self.verify(wrong).status_code, 400)
+        self.assertEqual(self.verify(wrong).status_code, 400)
+        self.assertEqual(self.verify(otp).status_code, 400)
+
+
+@override_settings(LOGIN_THROTTLE_IP_LIMIT=5, LOGIN_THROTTLE_ACCOUNT_LIMIT=2)
+class LoginThrottleTests(ThrottleStoreMixin, TestCase):
+    url = '/api/auth/login/'
+
+    def setUp(self):
+        super().setUp()
+        User.objects.create_user(username='login', email='login@example.com', password='Right-password-1')
+
+    def login(self, password, email='login@example.com'):
+        return APIClient().post(self.url, {'email': email, 'password': password}, format='json')
+
+    def test_failures_lock_the_account_with_retry_after(self):
+        self.assertEqual(self.login('wrong').status_code, 400)
+        self.assertEqual(self.login('wrong').status_code, 400)
+        response = self.login('Right-password-1')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        # Other accounts are not locked
+        self.assertEqual(self.login('wrong', 'someone@example.com').status_code, 400)
+
+    def test_success_clears_the_account_failures(self):
+        self.assertEqual(self.login('wrong').status_code, 400)
+        self.assertEqual(self.login('Right-password-1').status_code, 200)
+        self.assertEqual(self.login('wrong').status_code, 400)
+        self.assertEqual(self.login('Right-password-1').status_code, 200)
+
+    def test_attempts_are_limited_per_ip(self):
+        for i in range(5):
+            self.assertEqual(self.login('wrong', f'user{i}@example.com').status_code, 400)
+        response = self.login('Right-password-1')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    @override_settings(
+        LOGIN_THROTTLE_IP_LIMIT=5, LOGIN_THROTTLE_IP_WINDOW=60,
+        LOGIN_THROTTLE_ACCOUNT_LIMIT=5, LOGIN_THROTTLE_ACCOUNT_WINDOW=60,
+    )
+    def test_both_limits_refuse_at_the_same_boundary(self):
+        store = login_throttle.get_store()
+        # Halfway through a window, so the previous one counts for half
+        now = 6030
+
+        def earlier_rate(key, rate):
+            with store.transaction() as connection:
+                for _ in range(int(rate * 2)):
+                    store.hit(connection, key, 60, now - 60)
+
+        earlier_rate('ip:10.0.0.1', 4.5)
+        earlier_rate('ip:10.0.0.2', 5)
+        earlier_rate('account:under@example.com', 4.5)
+        earlier_rate('account:at@example.com', 5)
+
+        with mock.patch('accounts.login_throttle.time.time', return_value=now):
+            login_throttle.check_login('a@example.com', '10.0.0.1')
+            with self.assertRaises(login_throttle.LoginThrottled):
+                login_throttle.check_login('b@example.com', '10.0.0.2')
+            login_throttle.check_login('under@example.com', '10.0.0.3')
+            with self.assertRaises(login_throttle.LoginThrottled):
+                login_throttle.check_login('at@example.com', '10.0.0.4')
+
+
+class LoginHashingPoolTests(ThrottleStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        User.objects.create_user(username='pool', email='pool@example.com', password='Right-password-1')
+
+    def login(self, url):
+        return APIClient().post(url, {'email': 'pool@example.com', 'password': 'Right-password-1'}, format='json')
+
+    @override_settings(PASSWORD_HASHING_QUEUE_LIMIT=1)
+    def test_full_pool_answers_503_on_every_sync_login(self):
+        release = threading.Event()
+        busy = hashing_pool.submit(release.wait)
+        try:
+            for url in ('/api/auth/login/', '/api/auth/login/user/', '/api/auth/login/superadmin/'):
+                response = self.login(url)
+                self.assertEqual(response.status_code, 503, url)
+                self.assertEqual(response['Retry-After'], str(hashing_pool.RETRY_AFTER))
+        finally:
+            release.set()
+            busy.result()
+        self.assertEqual(self.login('/api/auth/login/user/').status_code, 200)
+
+    @override_settings(PASSWORD_HASHING_QUEUE_LIMIT=1)
+    def test_slot_is_free_once_the_result_is_returned(self):
+        for _ in range(100):
+            self.assertEqual(hashing_pool.run_sync(sum, [1, 2]), 3)
+            self.assertEqual(hashing_pool.in_flight(), 0)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'accounts.hashers.TunedScryptPasswordHasher', 'accounts.hashers.TunedPBKDF2PasswordHasher',
+    ])
+    def test_outdated_hash_is_upgraded_on_login(self):
+        user = User.objects.get(email='pool@example.com')
+        with self.settings(PASSWORD_HASHERS=['accounts.hashers.TunedPBKDF2PasswordHasher'], PASSWORD_PBKDF2_ITERATIONS=1000):
+            user.set_password('Right-password-1')
+            user.save()
+        self.assertEqual(self.login('/api/auth/login/').status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$'))
+
+
+class PermissionTableTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='table', email='table@example.com', password='x')
+        self.page, _ = Page.objects.get_or_create(name='order_list')
+        self.permission = UserPagePermission.objects.create(user=self.user, page=self.page, can_view=True)
+
+    def test_table_is_reused_while_the_version_holds(self):
+        table = permission_table.load_permission_table(self.user.pk)
+        self.assertTrue(table.has(self.page.id, 'view'))
+        self.assertFalse(table.has(self.page.id, 'edit'))
+        with self.assertNumQueries(0):
+            self.assertIs(permission_table.load_permission_table(self.user.pk), table)
+
+    def test_table_is_recompiled_when_the_version_changes(self):
+        table = permission_table.load_permission_table(self.user.pk)
+        # Changed without signals; only the version moves
+        UserPagePermission.objects.filter(pk=self.permission.pk).update(can_edit=True)
+        permission_cache.bump_permission_version(self.user.pk)
+
+        reloaded = permission_table.load_permission_table(self.user.pk)
+        self.assertIsNot(reloaded, table)
+        self.assertTrue(reloaded.has(self.page.id, 'edit'))
+
+    def test_saving_a_permission_marks_the_pinned_table_stale(self):
+        table = permission_table.get_permission_table(self.user)
+        self.permission.can_delete = True
+        self.permission.save()
+        self.assertTrue(table.stale)
+        self.assertTrue(permission_table.get_permission_table(self.user).has(self.page.id, 'delete'))
+
+
+class BatchPermissionCheckTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='checker', email='checker@example.com', password='x')
+        self.page, _ = Page.objects.get_or_create(name='order_list')
+        UserPagePermission.objects.create(user=self.user, page=self.page, can_view=True, can_edit=True)
+        self.url = '/api/auth/permissions/check/'
+
+    def test_checks_are_answered_in_order(self):
+        checks = [
+            {'page': 'order_list', 'action': 'view'},
+            {'page': 'order_list', 'action': 'delete'},
+            {'page': 'no_such_page', 'action': 'view'},
+            {'page': 'order_list', 'action': 'edit'},
+        ]
+        response = self.client_for(self.user).post(self.url, {'checks': checks}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(result['page'], result['action'], result['has_permission']) for result in response.data['results']],
+            [('order_list', 'view', True), ('order_list', 'delete', False),
+             ('no_such_page', 'view', False), ('order_list', 'edit', True)],
+        )
+
+    def test_superadmin_has_every_permission(self):
+        admin = User.objects.create_user(username='root', email='root@example.com', password='x', role='superadmin')
+        admin.is_superuser = True
+        admin.save()
+        checks = [{'page': 'order_list', 'action': 'delete'}, {'page': 'no_such_page', 'action': 'create'}]
+        response = self.client_for(admin).post(self.url, {'checks': checks}, format='json')
+        self.assertEqual([result['has_permission'] for result in response.data['results']], [True, True])
+
+    def test_unknown_action_is_rejected(self):
+        checks = [{'page': 'order_list', 'action': 'approve'}]
+        response = self.client_for(self.user).post(self.url, {'checks': checks}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkPermissionUpsertTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='superadmin',
+        )
+        self.viewer = User.objects.create_user(username='viewer', email='viewer@example.com', password='x')
+        self.editor = User.objects.create_user(username='editor', email='editor@example.com', password='x')
+        self.orders, _ = Page.objects.get_or_create(name='order_list')
+        self.invoices, _ = Page.objects.get_or_create(name='invoices')
+        UserPagePermission.objects.create(user=self.viewer, page=self.orders, can_view=True)
+        self.url = '/api/auth/permissions/bulk/'
+
+    def test_cells_are_created_or_updated(self):
+        response = self.client_for(self.admin).post(self.url, {
+            'user_ids': [self.viewer.pk, self.admin.pk, 0],
+            'page_ids': [self.orders.pk, self.invoices.pk],
+            'can_view': True, 'can_edit': True,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        statuses = {(result['user_id'], result['page_id']): result['status'] for result in response.data['results']}
+        self.assertEqual(statuses, {
+            (self.viewer.pk, self.orders.pk): 'updated',
+            (self.viewer.pk, self.invoices.pk): 'created',
+            (self.admin.pk, self.orders.pk): 'skipped',
+            (self.admin.pk, self.invoices.pk): 'skipped',
+            (0, self.orders.pk): 'error',
+            (0, self.invoices.pk): 'error',
+        })
+        rows = UserPagePermission.objects.filter(user=self.viewer).values_list(
+            'page_id', 'can_view', 'can_edit', 'can_delete',
+        )
+        self.assertEqual(
+            sorted(rows), sorted([(self.orders.pk, True, True, False), (self.invoices.pk, True, True, False)]),
+        )
+        self.assertFalse(UserPagePermission.objects.filter(user=self.admin).exists())
+
+    def test_affected_users_tables_are_invalidated(self):
+        viewer_table = permission_table.load_permission_table(self.viewer.pk)
+        editor_table = permission_table.load_permission_table(self.editor.pk)
+        self.assertFalse(viewer_table.has(self.orders.pk, 'edit'))
+        self.assertFalse(editor_table.has(self.invoices.pk, 'view'))
+
+        self.client_for(self.admin).post(self.url, {
+            'user_ids': [self.viewer.pk, self.editor.pk],
+            'page_ids': [self.orders.pk, self.invoices.pk],
+            'can_view': True, 'can_edit': True,
+        }, format='json')
+
+        reloaded = permission_table.load_permission_table(self.viewer.pk)
+        self.assertIsNot(reloaded, viewer_table)
+        self.assertTrue(reloaded.has(self.orders.pk, 'edit'))
+        self.assertTrue(permission_table.load_permission_table(self.editor.pk).has(self.invoices.pk, 'view'))
+
+    def test_unaffected_users_keep_their_tables(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='x')
+        table = permission_table.load_permission_table(other.pk)
+        self.client_for(self.admin).post(self.url, {
+            'user_ids': [self.viewer.pk], 'page_ids': [self.invoices.pk], 'can_view': True,
+        }, format='json')
+        self.assertIs(permission_table.load_permission_table(other.pk), table)
+
+
+class PermissionMatrixStreamTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='superadmin',
+        )
+        self.client = self.client_for(admin)
+        self.orders, _ = Page.objects.get_or_create(name='order_list')
+        self.invoices, _ = Page.objects.get_or_create(name='invoices')
+        flags = dict.fromkeys(('can_view', 'can_edit', 'can_create', 'can_delete'), False)
+        self.expected = []
+        for i in range(5):
+            user = User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='x')
+            UserPagePermission.objects.create(user=user, page=self.orders, can_view=True, can_edit=i % 2 == 0)
+            UserPagePermission.objects.create(user=user, page=self.invoices, can_delete=True)
+            self.expected.append({
+                'user_id': user.pk, 'email': user.email, 'role': 'user', 'permissions': {
+                    str(self.orders.pk): {**flags, 'can_view': True, 'can_edit': i % 2 == 0},
+                    str(self.invoices.pk): {**flags, 'can_delete': True},
+                },
+            })
+        self.url = '/api/auth/permissions/matrix/'
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response['Content-Type'], b''.join(response.streaming_content).decode()
+
+    def test_chunked_json_is_continued_with_next_after(self):
+        content_type, body = self.get()
+        self.assertEqual(content_type, 'application/json')
+        self.assertEqual(json.loads(body), {'results': self.expected, 'next_after': None})
+
+        users, after, chunks = [], 0, 0
+        while after is not None:
+            chunk = json.loads(self.get(after=after, limit=2)[1])
+            self.assertLessEqual(len(chunk['results']), 2)
+            users += chunk['results']
+            after = chunk['next_after']
+            chunks += 1
+        self.assertEqual(users, self.expected)
+        self.assertEqual(chunks, 3)
+
+    def test_ndjson_ends_with_a_continuation_marker(self):
+        content_type, body = self.get(output='ndjson')
+        self.assertEqual(content_type, 'application/x-ndjson')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], self.expected)
+
+        lines = [json.loads(line) for line in self.get(output='ndjson', limit=3)[1].splitlines()]
+        self.assertEqual(lines[:3], self.expected[:3])
+        self.assertEqual(lines[3], {'next_after': self.expected[2]['user_id']})
+        rest = [json.loads(line) for line in self.get(output='ndjson', after=lines[3]['next_after'])[1].splitlines()]
+        self.assertEqual(rest, self.expected[3:])
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'after': 'x'}).status_code, 400)
+
+
+class CommentCursorPaginationTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user(username='reader', email='reader@example.com', password='x')
+        page, _ = Page.objects.get_or_create(name='order_list')
+        UserPagePermission.objects.create(user=user, page=page, can_view=True)
+        self.client = self.client_for(user)
+        self.url = '/api/auth/pages/order_list/comments/'
+        for i in range(7):
+            Comment.objects.create(user=user, page_name='order_list', content=f'Comment {i}')
+        # Several comments share a timestamp; id breaks the tie
+        now = timezone.now()
+        tied = ['Comment 1', 'Comment 2', 'Comment 3', 'Comment 4']
+        Comment.objects.filter(content__in=tied).update(created_at=now)
+        Comment.objects.filter(content__in=['Comment 5', 'Comment 6']).update(created_at=now + timedelta(seconds=1))
+        Comment.objects.filter(content='Comment 0').update(created_at=now - timedelta(seconds=1))
+        self.newest_first = [f'Comment {i}' for i in (6, 5, 4, 3, 2, 1, 0)]
+
+    def get(self, cursor=None):
+        params = {'page_size': 3}
+        if cursor:
+            params['cursor'] = cursor
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_round_trip_over_tied_timestamps(self):
+        pages, cursor = [], None
+        while True:
+            data = self.get(cursor)
+            pages.append([comment['content'] for comment in data['results']])
+            cursor = data['next']
+            if cursor is None:
+                break
+        self.assertEqual(pages, [self.newest_first[:3], self.newest_first[3:6], self.newest_first[6:]])
+
+        # Walking back with the previous cursors returns the same pages
+        back = []
+        while data['previous'] is not None:
+            data = self.get(data['previous'])
+            back.append([comment['content'] for comment in data['results']])
+        self.assertEqual(back, [pages[1], pages[0]])
+
+    def test_invalid_cursor_is_rejected(self):
+        for cursor in ('not-a-cursor', 'WzEsMl0'):
+            response = self.client.get(self.url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+
+
+class CommentRowSerializationTests(TestCase):
+    def setUp(self):
+        author = User.objects.create_user(username='author', email='author@example.com', password='x')
+        editor = User.objects.create_user(username='editor', email='editor@example.com', password='x')
+        Comment.objects.create(user=author, page_name='order_list', content='Never edited')
+        Comment.objects.create(user=author, page_name='media_plans', content='Edited', modified_by=editor)
+        Comment.objects.create(user=editor, page_name='unlisted_page', content='Deleted', is_deleted=True)
+        # Whole seconds drop the microseconds from isoformat()
+        Comment.objects.filter(content='Edited').update(created_at=timezone.now().replace(microsecond=0))
+
+    def assertMatchesCommentSerializer(self):
+        comments = Comment.objects.order_by('id')
+        expected = [dict(item) for item in CommentSerializer(comments, many=True).data]
+        fast = serialize_comment_rows(comment_list_values(comments))
+        self.assertEqual(fast, expected)
+        self.assertEqual([list(item) for item in fast], [list(item) for item in expected])
+
+    def test_rows_match_comment_serializer(self):
+        self.assertMatchesCommentSerializer()
+
+    @override_settings(TIME_ZONE='Asia/Kolkata')
+    def test_rows_match_comment_serializer_outside_utc(self):
+        self.assertMatchesCommentSerializer()
+
+
+class CommentStatsTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', email='writer@example.com', password='x')
+        page, _ = Page.objects.get_or_create(name='order_list')
+        UserPagePermission.objects.create(
+            user=self.user, page=page, can_view=True, can_edit=True, can_create=True, can_delete=True,
+        )
+        self.client = self.client_for(self.user)
+
+    def counters(self):
+        stats = PageCommentStats.objects.get(page_name='order_list')
+        return stats.live_count, stats.deleted_count, stats.last_activity_at
+
+    def test_counters_follow_create_edit_and_delete(self):
+        url = '/api/auth/pages/order_list/comments/'
+        first = self.client.post(url, {'page_name': 'order_list', 'content': 'First'}, format='json').data['id']
+        second = self.client.post(url, {'page_name': 'order_list', 'content': 'Second'}, format='json').data['id']
+        live, deleted, created_at = self.counters()
+        self.assertEqual((live, deleted), (2, 0))
+        self.assertEqual(created_at, Comment.objects.get(pk=second).created_at)
+
+        self.client.put(f'/api/auth/comments/{first}/', {'content': 'First, edited'}, format='json')
+        live, deleted, edited_at = self.counters()
+        self.assertEqual((live, deleted), (2, 0))
+        self.assertEqual(edited_at, Comment.objects.get(pk=first).modified_at)
+
+        self.client.delete(f'/api/auth/comments/{second}/')
+        live, deleted, deleted_at = self.counters()
+        self.assertEqual((live, deleted), (1, 1))
+        self.assertGreaterEqual(deleted_at, edited_at)
+
+        response = self.client.get('/api/auth/comments/stats/')
+        self.assertEqual(
+            (response.data['order_list']['live_count'], response.data['order_list']['deleted_count']), (1, 1),
+        )
+
+    def test_rebuild_recomputes_drifted_counters(self):
+        for content in ('One', 'Two', 'Three'):
+            Comment.objects.create(user=self.user, page_name='order_list', content=content)
+        Comment.objects.filter(content='Three').update(is_deleted=True)
+        PageCommentStats.objects.create(page_name='media_plans', live_count=5, deleted_count=0)
+
+        call_command('rebuild_comment_stats', stdout=mock.MagicMock())
+
+        live, deleted, last_activity = self.counters()
+        self.assertEqual((live, deleted), (2, 1))
+        self.assertEqual(last_activity, Comment.objects.latest('modified_at').modified_at)
+        self.assertFalse(PageCommentStats.objects.filter(page_name='media_plans').exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Full-text search uses SQLite FTS5')
+class CommentSearchTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='searcher', email='searcher@example.com', password='x')
+        page, _ = Page.objects.get_or_create(name='order_list')
+        UserPagePermission.objects.create(
+            user=self.user, page=page, can_view=True, can_edit=True, can_delete=True,
+        )
+        self.client = self.client_for(self.user)
+        self.comment = Comment.objects.create(
+            user=self.user, page_name='order_list', content='Shipping delayed by fog',
+        )
+        Comment.objects.create(user=self.user, page_name='order_list', content='Invoice sent')
+
+    def search(self, query):
+        response = self.client.get('/api/auth/comments/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_edit_replaces_the_indexed_text(self):
+        self.assertEqual(self.search('fog'), [self.comment.pk])
+        url = f'/api/auth/comments/{self.comment.pk}/'
+        self.client.put(url, {'content': 'Shipping delayed by snow'}, format='json')
+        self.assertEqual(self.search('fog'), [])
+        self.assertEqual(self.search('snow'), [self.comment.pk])
+
+        # Writes that bypass the views are indexed by the same triggers
+        Comment.objects.filter(pk=self.comment.pk).update(content='Shipping on time')
+        self.assertEqual(self.search('snow'), [])
+        self.assertEqual(self.search('time'), [self.comment.pk])
+
+    def test_soft_deleted_comment_leaves_the_index(self):
+        self.client.delete(f'/api/auth/comments/{self.comment.pk}/')
+        self.assertEqual(self.search('shipping'), [])
+
+        Comment.objects.filter(pk=self.comment.pk).update(is_deleted=False)
+        self.assertEqual(self.search('shipping'), [self.comment.pk])
+
+
+class CommentEventStreamTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='listener', email='listener@example.com', password='x')
+        page, _ = Page.objects.get_or_create(name='order_list')
+        UserPagePermission.objects.create(user=self.user, page=page, can_view=True)
+
+    def event(self, event_id, page_name='order_list'):
+        # Explicit ids stand in for rows whose transactions commit out of id order
+        return CommentEvent.objects.create(
+            id=event_id, comment_id=event_id, page_name=page_name, event_type=comment_events.CREATED, payload={},
+        )
+
+    def read(self, steps, cursor=None):
+        """
+        Read one chunk after each step (a callable run in the stream's
+        thread, or None) and return their (SSE id, event id) pairs.
+        """
+        async def run():
+            stream = comment_events.stream_comment_events(self.user.pk, cursor=cursor)
+            chunks = []
+            try:
+                self.assertTrue((await stream.__anext__()).startswith('retry:'))
+                for step in steps:
+                    if step is not None:
+                        await sync_to_async(step)()
+                    chunks.append(await stream.__anext__())
+            finally:
+                await stream.aclose()
+            return chunks
+
+        pairs = []
+        for chunk in async_to_sync(run)():
+            fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            pairs.append((fields['id'], json.loads(fields['data']).get('id')))
+        return pairs
+
+    def test_event_committed_out_of_order_is_delivered_live(self):
+        self.event(10)
+
+        def publish():
+            # 12 commits before 11, and 12 is then published again. The rows
+            # are not saved, so only the broker can deliver them.
+            broker = comment_events.get_broker()
+            for event_id in (12, 11, 12, 13):
+                event = CommentEvent(
+                    id=event_id, comment_id=event_id, page_name='order_list',
+                    event_type=comment_events.CREATED, payload={},
+                )
+                broker.publish_many([comment_events.event_message(event)])
+
+        self.assertEqual(self.read([publish, None, None]), [('12.11', 12), ('12', 11), ('13', 13)])
+
+    @override_settings(COMMENT_EVENTS_BROKER='database', COMMENT_EVENTS_POLL_INTERVAL=0.01)
+    def test_polling_picks_up_an_event_committed_out_of_order(self):
+        self.event(10)
+        steps = [lambda: self.event(12), lambda: self.event(11)]
+        self.assertEqual(self.read(steps), [('12.11', 12), ('12', 11)])
+
+    def test_last_event_id_replays_the_gaps_it_carries(self):
+        for event_id in (5, 7, 8):
+            self.event(event_id)
+        self.event(9, page_name='media_plans')
+
+        # A client that saw 7 while 6 was still in flight
+        self.assertEqual(self.read([None], comment_events.EventCursor.parse('7.6')), [('8.6', 8)])
+
+        self.event(6)
+        self.assertEqual(self.read([None], comment_events.EventCursor.parse('8.6')), [('8', 6)])
+
+    def test_pruned_cursor_gets_a_reset(self):
+        self.event(20)
+        self.assertEqual(self.read([None], comment_events.EventCursor(3)), [('20', None)])
+
+    def test_malformed_cursor_is_rejected(self):
+        for value in ('', 'abc', '7.x'):
+            with self.assertRaises(ValueError):
+                comment_events.EventCursor.parse(value)
+
+
+@override_settings(COMMENT_HISTORY_STORAGE=DELTA, COMMENT_HISTORY_SNAPSHOT_INTERVAL=3)
+class CommentArchiveTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='superadmin',
+        )
+        self.client = self.client_for(self.admin)
+        page, _ = Page.objects.get_or_create(name='order_list')
+        UserPagePermission.objects.create(user=self.admin, page=page, can_view=True, can_delete=True)
+
+        # Long texts with small edits are stored as diffs
+        text = 'The order was shipped to the warehouse on Monday. Version '
+        self.comment = Comment.objects.create(user=self.admin, page_name='order_list', content=f'{text}0')
+        comment_created(self.comment)
+        for i in range(1, 5):
+            CommentHistory.objects.create(
+                comment=self.comment, user=self.admin, action='EDIT', old_content=f'{text}{i - 1}',
+                new_content=f'{text}{i}',
+            )
+        self.final_content = f'{text}4'
+        Comment.objects.filter(pk=self.comment.pk).update(content=self.final_content)
+        self.client.delete(f'/api/auth/comments/{self.comment.pk}/')
+        self.history = self.history_of(self.comment.pk)
+        self.created_at = Comment.objects.get(pk=self.comment.pk).created_at
+
+        # Deleted long enough ago to be archived
+        Comment.objects.filter(pk=self.comment.pk).update(modified_at=timezone.now() - timedelta(days=40))
+        call_command('archive_deleted_comments', days=30, stdout=mock.MagicMock())
+
+    def history_of(self, comment_id):
+        response = self.client.get(f'/api/auth/comments/{comment_id}/history/')
+        self.assertEqual(response.status_code, 200)
+        return [(entry['action'], entry['old_content'], entry['new_content'], entry['timestamp'])
+                for entry in response.data]
+
+    def test_archived_comment_history_is_still_readable(self):
+        self.assertFalse(Comment.objects.filter(pk=self.comment.pk).exists())
+        self.assertTrue(ArchivedComment.objects.filter(pk=self.comment.pk).exists())
+        self.assertIn(DELTA, ArchivedCommentHistory.objects.values_list('storage', flat=True))
+        self.assertEqual(self.history_of(self.comment.pk), self.history)
+        self.assertEqual(sorted(entry[0] for entry in self.history), ['DELETE', 'EDIT', 'EDIT', 'EDIT', 'EDIT'])
+        self.assertIn(self.final_content, [entry[2] for entry in self.history])
+
+        stats = PageCommentStats.objects.get(page_name='order_list')
+        self.assertEqual((stats.live_count, stats.deleted_count), (0, 0))
+
+    def test_restore_round_trip(self):
+        response = self.client.post(f'/api/auth/comments/{self.comment.pk}/restore/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.comment.pk)
+        self.assertEqual(response.data['content'], self.final_content)
+
+        restored = Comment.objects.get(pk=self.comment.pk)
+        self.assertFalse(restored.is_deleted)
+        self.assertEqual(restored.created_at, self.created_at)
+        self.assertFalse(ArchivedComment.objects.exists())
+        self.assertFalse(ArchivedCommentHistory.objects.exists())
+
+        history = self.history_of(self.comment.pk)
+        self.assertEqual(history[1:], self.history)
+        self.assertEqual(history[0][:3], ('RESTORE', None, self.final_content))
+        stats = PageCommentStats.objects.get(page_name='order_list')
+        self.assertEqual((stats.live_count, stats.deleted_count), (1, 0))
@@ -0,0 +1,203 @@
+"""
+Revocation of refresh tokens (logout and rotation).
+
+Revoked token ids (the "jti" claim) are stored in the RevokedToken table,
+whose unique index on jti makes revoking a token an atomic claim: a token
+can be rotated or logged out only once, even by concurrent requests.
+
+Checking whether a presented refresh token is revoked does not query the
+table. Each process keeps a bloom filter of the revoked ids, so unrevoked
+tokens (nearly every refresh) are accepted from memory; only ids the filter
+reports as present, revoked ones and the rare false positive, are looked up.
+The filter follows the table through two cache versions (see
+accounts/versioning.py):
+
+- REVOKED_VERSION_KEY is bumped whenever tokens are revoked; processes then
+  add the rows after the last id they loaded, re-reading the OVERLAP_IDS
+  ids before it. Ids are handed out before commit, so a revocation can
+  become visible after rows with higher ids; its own bump on commit makes
+  processes look again, and the overlap lets them find it.
+- REVOKED_GENERATION_KEY is bumped by prune_revoked_tokens; processes then
+  rebuild the filter from the rows that are left, so it stays sized to the
+  tokens that have not expired yet.
+
+A process checks those versions at most once per SYNC_INTERVAL, so with
+rotation on, where every refresh is itself a revocation, refreshes still
+do not each reload the filter. A token revoked elsewhere within that
+window is still refused if it is rotated, by the unique index.
+
+Rows are only needed until the token's own expiry, after which its
+signature check fails anyway; the prune_revoked_tokens command removes them.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import RevokedToken
+from .versioning import bump_version, get_versions
+
+REVOKED_VERSION_KEY = 'revoked_tokens_version'
+REVOKED_GENERATION_KEY = 'revoked_tokens_generation'
+
+# Seconds a process trusts its filter before checking the versions again
+SYNC_INTERVAL = 1
+
+# Ids below the last one loaded that are read again on every sync
+OVERLAP_IDS = 1000
+
+
+def filter_capacity():
+    return getattr(settings, 'TOKEN_REVOCATION_CAPACITY', 100000)
+
+
+def filter_error_rate():
+    return getattr(settings, 'TOKEN_REVOCATION_ERROR_RATE', 0.001)
+
+
+class BloomFilter:
+    """A fixed-size bloom filter of strings"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        """Add a value; values already present are not counted again"""
+        added = False
+        for position in self._positions(value):
+            bit = 1 << (position & 7)
+            if not self.bits[position >> 3] & bit:
+                self.bits[position >> 3] |= bit
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class _RevokedSet:
+    """This process's view of the RevokedToken table"""
+
+    def __init__(self, version, generation):
+        self.version = version
+        self.generation = generation
+        self.last_id = 0
+        self.filter = None
+        self.synced_at = time.monotonic()
+
+    def rebuild(self):
+        rows = RevokedToken.objects.filter(expires_at__gte=timezone.now()).values_list('id', 'jti')
+        live = rows.count()
+        # Leave room for the revocations that arrive before the next prune
+        self.filter = BloomFilter(max(filter_capacity(), 2 * live), filter_error_rate())
+        self._add(rows.iterator(chunk_size=2000))
+
+    def load_new(self):
+        rows = RevokedToken.objects.filter(id__gt=self.last_id - OVERLAP_IDS).values_list('id', 'jti')
+        self._add(rows)
+        if self.filter.count > self.filter.capacity:
+            self.rebuild()
+
+    def _add(self, rows):
+        for row_id, jti in rows:
+            self.filter.add(jti)
+            self.last_id = max(self.last_id, row_id)
+
+
+_lock = threading.Lock()
+_revoked = None
+
+
+def _revoked_set():
+    """The process's revoked set, brought up to date with the table if it changed"""
+    global _revoked
+    revoked = _revoked
+    if revoked is not None and time.monotonic() < revoked.synced_at + SYNC_INTERVAL:
+        return revoked
+
+    versions = get_versions([REVOKED_VERSION_KEY, REVOKED_GENERATION_KEY])
+    version, generation = versions[REVOKED_VERSION_KEY], versions[REVOKED_GENERATION_KEY]
+    if revoked is not None and revoked.version == version and revoked.generation == generation:
+        revoked.synced_at = time.monotonic()
+        return revoked
+
+    with _lock:
+        revoked = _revoked
+        if revoked is None or revoked.generation != generation:
+            revoked = _RevokedSet(version, generation)
+            revoked.rebuild()
+        elif revoked.version != version:
+            revoked.load_new()
+            revoked.version = version
+        revoked.synced_at = time.monotonic()
+        _revoked = revoked
+    return revoked
+
+
+def is_revoked(jti):
+    if jti not in _revoked_set().filter:
+        return False
+    return RevokedToken.objects.filter(jti=jti).exists()
+
+
+def _bump_now_and_on_commit(key):
+    bump_version(key)
+    transaction.on_commit(lambda: bump_version(key))
+
+
+def revoke(jti, expires_at):
+    """Revoke a token id; returns False if it was already revoked"""
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+    except IntegrityError:
+        return False
+    revoked = _revoked
+    if revoked is not None:
+        with _lock:
+            revoked.filter.add(jti)
+    _bump_now_and_on_commit(REVOKED_VERSION_KEY)
+    return True
+
+
+def prune_revoked_tokens(now=None):
+    """Delete rows of tokens that have expired; returns the number deleted"""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lt=now or timezone.now()).delete()
+    if deleted:
+        _bump_now_and_on_commit(REVOKED_GENERATION_KEY)
+    return deleted
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    A refresh token checked against the revocation store. blacklist() is
+    the name simplejwt's refresh serializer calls after rotating a token.
+    """
+
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if is_revoked(self[api_settings.JTI_CLAIM]):
+            raise TokenError('Token is blacklisted')
+
+    def blacklist(self):
+        expires_at = datetime.fromtimestamp(self['exp'], tz=dt_timezone.utc)
+        if not revoke(self[api_settings.JTI_CLAIM], expires_at):
+            raise TokenError('Token is blacklisted')
@@ -16,6 +16,9 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('login/superadmin/', views.login_superadmin, name='login_superadmin'),
     path('login/user/', views.login_user, name='login_user'),
+    path('login/async/', views.async_login_view, name='async_login'),
+    path('logout/', views.logout_view, name='logout'),
+    path('login/throttle/stats/', views.login_throttle_stats_view, name='login_throttle_stats'),
     path('profile/', views.profile_view, name='profile'),
     
     # User management endpoints
@@ -26,10 +29,14 @@ urlpatterns = [
     
     # Permission management endpoints
     path('permissions/update/', views.update_user_permissions, name='update_permissions'),
+    path('permissions/bulk/', views.bulk_update_user_permissions, name='bulk_update_permissions'),
+    path('permissions/matrix/', views.permission_matrix_view, name='permission_matrix'),
+    path('permissions/check/', views.batch_permission_check_view, name='batch_permission_check'),
     path('users/<int:user_id>/permissions/', views.get_user_permissions, name='get_user_permissions'),
     path('user-accessible-pages/', views.user_accessible_pages, name='user_accessible_pages'),
     
     # Password management endpoints
+    path('password/change/', views.change_password_view, name='change_password'),
     path('password/reset/request/', views.password_reset_request_view, name='password_reset_request'),
     path('password/reset/verify/', views.verify_otp_view, name='verify_otp'),
     path('password/reset/confirm/', views.password_reset_confirm_view, name='password_reset_confirm'),
@@ -39,7 +46,13 @@ urlpatterns = [
     
     # Comment-related endpoints
     path('pages/<str:page_name>/comments/', views.page_comments, name='page-comments'),
+    path('comments/events/', views.comment_events_view, name='comment-events'),
+    path('comments/moderate/', views.bulk_moderate_comments, name='bulk-moderate-comments'),
+    path('comments/history/', views.batch_comment_history, name='batch-comment-history'),
+    path('comments/search/', views.comment_search_view, name='comment-search'),
+    path('comments/stats/', views.comment_stats_view, name='comment-stats'),
     path('comments/<int:comment_id>/', views.comment_detail, name='comment-detail'),
     path('comments/<int:comment_id>/history/', views.comment_history, name='comment-history'),
+    path('comments/<int:comment_id>/restore/', views.restore_comment_view, name='comment-restore'),
     path('pages/<str:page_name>/permissions/', views.check_page_permission_view, name='page-permissions'),
 ]
\ No newline at end of file
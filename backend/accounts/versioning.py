@@ -0,0 +1,61 @@
+"""
+Version counters stored in the Django cache.
+
+A version is the time (in nanoseconds) of the last change to whatever the
+key describes. It is used both as a cache-busting token (snapshot keys,
+ETags) and as the Last-Modified time of HTTP responses. Versions never
+expire; an evicted key comes back with the current time, which can only
+make clients and caches refetch, never serve stale data.
+
+Every worker must read the same versions, so with several workers the
+default cache has to be Redis or Memcached; check_shared_cache() refuses
+anything else at startup.
+"""
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+
+SHARED_BACKENDS = (RedisCache, BaseMemcachedCache)
+
+
+def check_shared_cache():
+    """Called at startup; a bump in one worker would go unseen by the others"""
+    workers = getattr(settings, 'WEB_CONCURRENCY', 1)
+    backend = caches['default']
+    if workers > 1 and not isinstance(backend, SHARED_BACKENDS):
+        raise ImproperlyConfigured(
+            f'WEB_CONCURRENCY is {workers} but the default cache is {type(backend).__name__}, which '
+            'the workers do not share fast enough: use Redis or Memcached (see CACHES in config/settings.py)'
+        )
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(keys):
+    """Fetch several versions with one cache round trip"""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if versions.get(key) is None:
+            versions[key] = get_version(key)
+    return versions
+
+
+def bump_version(key):
+    version = time.time_ns()
+    cache.set(key, version, None)
+    return version
+
+
+def version_datetime(version):
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
@@ -3,10 +3,14 @@ from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework.exceptions import AuthenticationFailed
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import check_password, make_password
 from django.shortcuts import get_object_or_404
-from django.db import transaction
-from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from .models import (
@@ -15,6 +19,7 @@ from .models import (
     UserPagePermission,
     CommentHistory,
     Comment,
+    PageCommentStats,
 )
 from .serializers import (
     UserRegistrationSerializer,
@@ -27,6 +32,10 @@ from .serializers import (
     UserPagePermissionSerializer,
     UserWithPermissionsSerializer,
     BulkPermissionUpdateSerializer,
+    BatchPermissionCheckSerializer,
+    BulkPermissionMatrixSerializer,
+    BatchCommentHistorySerializer,
+    BulkCommentModerationSerializer,
     UserCreationSerializer,
     UserTableSerializer,
     CommentHistorySerializer,
@@ -34,11 +43,35 @@ from .serializers import (
     UserSerializer,
     LoginSerializer,
     PasswordResetSerializer,
+    comment_list_values,
+    serialize_comment_rows,
 )
-from django.core.mail import send_mail
-from django.conf import settings
-import random
-import string
+from .history_storage import encode_history_entries
+from .conditional import (
+    accessible_pages_validators,
+    comment_list_validators,
+    not_modified,
+    pages_validators,
+    set_validators,
+)
+from .authentication import CachedJWTAuthentication
+from .token_revocation import RevocableRefreshToken
+from .comment_archive import comment_pages, history_entries, latest_history_entries, restore_comment
+from .comment_events import EventCursor, stream_comment_events
+from .comment_stats import comment_created, comment_edited, comment_deleted, comments_deleted, forget_comments
+from .email_outbox import enqueue_email
+from . import hashing_pool, login_throttle, otp_store
+from .hashers import needs_rehash
+from .hashing_pool import HashingPoolSaturated
+from .page_registry import get_page_registry
+from .pagination import InvalidCursor, get_page_size, paginate_comments
+from .permission_cache import get_permission_snapshot
+from .search import InvalidSearchCursor, SearchUnavailable, search_comment_ids
+from .permission_table import get_permission_table, get_page_id, unpack_flags
+from .signals import invalidate_user_permissions
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+import json
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.utils.crypto import get_random_string
@@ -47,15 +80,8 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 User = get_user_model()
 
 def get_user_permissions_cached(user_id):
-    """Cache user permissions for 5 minutes to improve performance"""
-    cache_key = f"user_permissions_{user_id}"
-    permissions = cache.get(cache_key)
-    
-    if permissions is None:
-        permissions = UserPagePermission.objects.filter(user_id=user_id).select_related('user', 'page')
-        cache.set(cache_key, permissions, 300)  # 5 minutes
-    
-    return permissions
+    """Materialized permission snapshot for the user's current permission version"""
+    return get_permission_snapshot(user_id)
 
 # Enhanced permission validation
 def validate_permission_edge_cases(user, page, action):
@@ -69,23 +95,22 @@ def validate_permission_edge_cases(user, page, action):
         return False
     
     # Case 3: Permission exists but user role changed
-    permission = UserPagePermission.objects.filter(
-        user=user, 
-        page=page
-    ).first()
+    table = get_permission_table(user)
+    nibble = table.nibble(page.id)
     
-    if not permission:
+    if not nibble:
         return False
     
     # Case 4: Hierarchical permissions (Edit includes View, Delete includes Edit)
+    permission = unpack_flags(nibble)
     if action == 'view':
-        return permission.can_view or permission.can_edit or permission.can_create or permission.can_delete
+        return True
     elif action == 'create':
-        return permission.can_create
+        return permission['can_create']
     elif action == 'edit':
-        return permission.can_edit or permission.can_delete
+        return permission['can_edit'] or permission['can_delete']
     elif action == 'delete':
-        return permission.can_delete
+        return permission['can_delete']
     
     return False
 
@@ -97,22 +122,8 @@ def user_has_permission(user, page_name, permission_type):
     if user.is_superuser:
         return True  # Super admin can do everything
 
-    try:
-        page = Page.objects.get(name=page_name)
-        permission = UserPagePermission.objects.get(user=user, page=page)
-        
-        if permission_type == 'view':
-            return permission.can_view
-        elif permission_type == 'edit':
-            return permission.can_edit
-        elif permission_type == 'create':
-            return permission.can_create
-        elif permission_type == 'delete':
-            return permission.can_delete
-            
-        return False
-    except (Page.DoesNotExist, UserPagePermission.DoesNotExist):
-        return False
+    # One compiled bitmask per user; no queries once it is loaded
+    return get_permission_table(user).has(get_page_id(page_name), permission_type)
 
 
 
@@ -121,10 +132,14 @@ def user_has_permission(user, page_name, permission_type):
 @permission_classes([permissions.IsAuthenticated])
 def page_comments(request, page_name):
     """
-    GET: Get all comments for a page (if user has view permission)
+    GET: Get a page of comments, newest first (if user has view permission)
     POST: Create a new comment (if user has create permission)
     """
 
+    if request.method == "GET":
+        # Also loads the permission table used by the check below
+        etag, last_modified = comment_list_validators(request, page_name, get_page_size(request))
+
     # Check if user can view this page
     if not user_has_permission(request.user, page_name, "view"):
         return Response(
@@ -133,10 +148,22 @@ def page_comments(request, page_name):
         )
 
     if request.method == "GET":
-        # Get all non-deleted comments for this page
+        cached = not_modified(request, etag, last_modified)
+        if cached is not None:
+            return cached
+
+        # Get one keyset page of non-deleted comments for this page
         comments = Comment.objects.filter(page_name=page_name, is_deleted=False)
-        serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        try:
+            comments, next_cursor, previous_cursor = paginate_comments(comment_list_values(comments), request)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        response = Response({
+            "next": next_cursor,
+            "previous": previous_cursor,
+            "results": serialize_comment_rows(comments),
+        })
+        return set_validators(response, etag, last_modified)
 
     elif request.method == "POST":
         # Check if user can create comments
@@ -148,7 +175,9 @@ def page_comments(request, page_name):
 
         serializer = CommentSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user, page_name=page_name)
+            with transaction.atomic():
+                comment = serializer.save(user=request.user, page_name=page_name)
+                comment_created(comment)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -172,7 +201,9 @@ def comment_detail(request, comment_id):
 
         serializer = CommentSerializer(comment, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save(modified_by=request.user)
+            with transaction.atomic():
+                comment = serializer.save(modified_by=request.user)
+                comment_edited(comment)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -184,19 +215,156 @@ def comment_detail(request, comment_id):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        # Soft delete - mark as deleted but keep in database
-        comment.is_deleted = True
-        comment.save()
+        with transaction.atomic():
+            # Soft delete - mark as deleted but keep in database
+            comment.is_deleted = True
+            comment.save()
+
+            # Track deletion in history
+            CommentHistory.objects.create(
+                comment=comment,
+                user=request.user,
+                action="DELETE",
+                old_content=comment.content,
+            )
+            comment_deleted(comment)
+
+        return Response({"message": "Comment deleted successfully"})
+
 
-        # Track deletion in history
-        CommentHistory.objects.create(
-            comment=comment,
-            user=request.user,
-            action="DELETE",
-            old_content=comment.content,
+def _soft_delete_comments(ids, now):
+    """
+    Soft-delete the comments among `ids` that are still live and return the
+    ids this request changed, so only those get history and move the counters.
+    """
+    if not ids:
+        return set()
+    if connection.vendor in ("postgresql", "sqlite") and connection.features.can_return_columns_from_insert:
+        # UPDATE ... RETURNING reports exactly the rows it changed
+        qn = connection.ops.quote_name
+        modified_at = Comment._meta.get_field("modified_at").get_db_prep_value(now, connection)
+        placeholders = ", ".join(["%s"] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {qn(Comment._meta.db_table)} SET {qn('is_deleted')} = %s, {qn('modified_at')} = %s "
+                f"WHERE {qn('id')} IN ({placeholders}) AND {qn('is_deleted')} = %s RETURNING {qn('id')}",
+                [True, modified_at, *ids, False],
+            )
+            return {row[0] for row in cursor.fetchall()}
+    if connection.features.has_select_for_update:
+        # The caller read them as live under row locks, so none has changed since
+        Comment.objects.filter(id__in=ids).update(is_deleted=True, modified_at=now)
+        return set(ids)
+    # No locks and no RETURNING: one UPDATE per row, each telling whether it changed its row
+    return {
+        comment_id for comment_id in ids
+        if Comment.objects.filter(id=comment_id, is_deleted=False).update(is_deleted=True, modified_at=now)
+    }
+
+
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_moderate_comments(request):
+    """
+    POST: Soft-delete many comments at once, picked by "comment_ids" and/or a
+    filter ("page_name", "user_id", "created_after", "created_before").
+    Delete permission is checked once per page; comments on pages the user
+    cannot delete on are left alone and those pages listed under "forbidden".
+    At most MAX_COMMENTS are deleted per request and "has_more" tells the
+    client to send the same request again.
+    """
+    serializer = BulkCommentModerationSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    criteria = serializer.validated_data
+
+    comments = Comment.objects.filter(is_deleted=False)
+    if "comment_ids" in criteria:
+        comments = comments.filter(id__in=criteria["comment_ids"])
+    if "page_name" in criteria:
+        comments = comments.filter(page_name=criteria["page_name"])
+    if "user_id" in criteria:
+        comments = comments.filter(user_id=criteria["user_id"])
+    if "created_after" in criteria:
+        comments = comments.filter(created_at__gte=criteria["created_after"])
+    if "created_before" in criteria:
+        comments = comments.filter(created_at__lt=criteria["created_before"])
+
+    # One permission check per distinct page
+    page_names = set(comments.order_by().values_list("page_name", flat=True).distinct())
+    allowed_pages = {
+        page_name for page_name in page_names
+        if user_has_permission(request.user, page_name, "delete")
+    }
+
+    limit = BulkCommentModerationSerializer.MAX_COMMENTS
+    with transaction.atomic():
+        # Locked where the database supports it, so a concurrent request waits
+        # and then no longer sees these comments as live
+        targets = list(
+            comments.filter(page_name__in=allowed_pages)
+            .select_for_update()
+            .order_by("id")
+            .values_list("id", "page_name", "content")[:limit + 1]
+        )
+        has_more = len(targets) > limit
+        targets = targets[:limit]
+
+        # Soft delete; modified_at moves like it does in save(). A concurrent
+        # request may have deleted some targets first where rows are not locked.
+        changed = _soft_delete_comments([comment_id for comment_id, _, _ in targets], timezone.now())
+        targets = [target for target in targets if target[0] in changed]
+
+        # Track deletions in history
+        history = encode_history_entries(
+            CommentHistory(comment_id=comment_id, user=request.user, action="DELETE", old_content=content)
+            for comment_id, _, content in targets
         )
+        CommentHistory.objects.bulk_create(history, batch_size=500)
+        comments_deleted(Comment(id=comment_id, page_name=page_name) for comment_id, page_name, _ in targets)
 
-        return Response({"message": "Comment deleted successfully"})
+    deleted_per_page = {}
+    for _, page_name, _ in targets:
+        deleted_per_page[page_name] = deleted_per_page.get(page_name, 0) + 1
+    return Response({
+        "deleted": len(targets),
+        "pages": deleted_per_page,
+        "forbidden": sorted(page_names - allowed_pages),
+        "has_more": has_more,
+    })
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def comment_search_view(request):
+    """
+    GET: Full-text search over live comments on the pages the user can view,
+    ranked by bm25. ?page=<page_name> narrows the search to one page.
+    """
+    query = request.query_params.get("q", "").strip()
+    if not query:
+        return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    page_names = [page.name for page in get_page_registry().pages]
+    if request.query_params.get("page"):
+        page_names = [name for name in page_names if name == request.query_params["page"]]
+    page_names = [name for name in page_names if user_has_permission(request.user, name, "view")]
+
+    try:
+        matches, next_cursor = search_comment_ids(
+            query, page_names, get_page_size(request), request.query_params.get("cursor")
+        )
+    except InvalidSearchCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except SearchUnavailable as e:
+        return Response({"error": str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    ranks = dict(matches)
+    rows = {row["id"]: row for row in comment_list_values(Comment.objects.filter(id__in=ranks))}
+    results = serialize_comment_rows(rows[comment_id] for comment_id, _ in matches if comment_id in rows)
+    for item in results:
+        item["rank"] = ranks[item["id"]]
+    return Response({"next": next_cursor, "results": results})
 
 
 @api_view(["GET"])
@@ -205,29 +373,149 @@ def comment_history(request, comment_id):
     """
     GET: Get the history of a comment (if user has view permission or is superadmin)
     """
-    comment = get_object_or_404(Comment, id=comment_id)
+    # Archived comments keep their history in the archive tables
+    pages, archived = comment_pages([comment_id])
+    if comment_id not in pages:
+        raise Http404
 
     # Check if user can view this page or is superadmin
-    if not (user_has_permission(request.user, comment.page_name, "view") or request.user.is_superadmin):
+    if not (user_has_permission(request.user, pages[comment_id], "view") or request.user.is_superadmin):
         return Response(
             {"error": "You do not have permission to view this comment's history"},
             status=status.HTTP_403_FORBIDDEN,
         )
 
-    history = CommentHistory.objects.filter(comment=comment).select_related('user')
+    history = history_entries(comment_id, archived=comment_id in archived)
     serializer = CommentHistorySerializer(history, many=True)
     return Response(serializer.data)
 
 
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+def batch_comment_history(request):
+    """
+    POST: Get the latest history entries of many comments at once, grouped by
+    comment id. Comments on pages the user cannot view are listed under
+    "forbidden" and ids that do not exist under "missing".
+    """
+    serializer = BatchCommentHistorySerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    comment_ids = set(serializer.validated_data["comment_ids"])
+    limit = serializer.validated_data["limit"]
+
+    pages, archived = comment_pages(comment_ids)
+
+    # One permission check per distinct page
+    allowed_pages = {
+        page_name for page_name in set(pages.values())
+        if user_has_permission(request.user, page_name, "view") or request.user.is_superadmin
+    }
+    allowed = [comment_id for comment_id, page_name in pages.items() if page_name in allowed_pages]
+
+    entries = latest_history_entries(allowed, limit, archived)
+    data = CommentHistorySerializer(entries, many=True).data
+
+    results = {comment_id: [] for comment_id in sorted(allowed)}
+    for entry, item in zip(entries, data):
+        results[entry.comment_id].append(item)
+
+    return Response({
+        "results": results,
+        "forbidden": sorted(set(pages) - set(allowed)),
+        "missing": sorted(comment_ids - set(pages)),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def comment_stats_view(request):
+    """Comment counts and last activity for every page the user can view"""
+    stats = PageCommentStats.objects.all()
+    data = {}
+    for row in stats:
+        if not user_has_permission(request.user, row.page_name, "view"):
+            continue
+        data[row.page_name] = {
+            'live_count': row.live_count,
+            'deleted_count': row.deleted_count,
+            'last_activity_at': row.last_activity_at,
+        }
+    return Response(data)
+
+
+def _authenticate_event_stream(request):
+    """
+    Resolve the user of an event stream request from its JWT.
+
+    EventSource cannot send headers, so the access token may also be passed
+    as ?token=.
+    """
+    authenticator = CachedJWTAuthentication()
+    header = authenticator.get_header(request)
+    if header is not None:
+        raw_token = authenticator.get_raw_token(header)
+    else:
+        raw_token = request.GET.get('token', '').encode() or None
+    if raw_token is None:
+        raise AuthenticationFailed('Authentication credentials were not provided.')
+    return authenticator.get_user(authenticator.get_validated_token(raw_token))
+
+
+async def comment_events_view(request):
+    """
+    GET: Server-sent events for comments created, edited or deleted on the
+    pages the user can view. Optional ?pages=a,b narrows the pages; the
+    Last-Event-ID header (or ?last_event_id=) resumes after a disconnect.
+    Must be served by the ASGI application in config/asgi.py.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'The event stream is only available through the ASGI server'},
+            status=status.HTTP_501_NOT_IMPLEMENTED,
+        )
+
+    try:
+        user = await sync_to_async(_authenticate_event_stream)(request)
+    except (AuthenticationFailed, InvalidToken) as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    cursor = None
+    if last_event_id is not None:
+        try:
+            cursor = EventCursor.parse(last_event_id)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid Last-Event-ID'}, status=status.HTTP_400_BAD_REQUEST)
+
+    pages = [name for name in request.GET.get('pages', '').split(',') if name] or None
+    response = StreamingHttpResponse(
+        stream_comment_events(user.pk, pages, cursor),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def user_accessible_pages(request):
     """Get all pages accessible to the current user with their permissions"""
     user = request.user
     
+    registry = get_page_registry()
+    etag, last_modified, permission_version = accessible_pages_validators(user, registry)
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+    
     # If superadmin, return all pages with full access
     if user.role == 'superadmin':
-        pages = Page.objects.all()
+        pages = registry.pages
         data = []
         for page in pages:
             data.append({
@@ -241,43 +529,59 @@ def user_accessible_pages(request):
                     'can_delete': True
                 }
             })
-        return Response(data)
+        return set_validators(Response(data), etag, last_modified)
     
     # For regular users, get their specific permissions
-    user_permissions = UserPagePermission.objects.filter(user=user).select_related('page')
+    snapshot = get_permission_snapshot(user.pk, permission_version)
+    user_permissions = {row[0]: row[1:] for row in snapshot['permissions']} if snapshot else {}
     data = []
     
-    for permission in user_permissions:
+    for page in registry.pages:
+        if page.id not in user_permissions:
+            continue
+        can_view, can_edit, can_create, can_delete = user_permissions[page.id]
         data.append({
-            'id': permission.page.id,
-            'name': permission.page.name,
-            'url': permission.page.url,
+            'id': page.id,
+            'name': page.name,
+            'url': page.url,
             'permissions': {
-                'can_view': permission.can_view,
-                'can_edit': permission.can_edit,
-                'can_create': permission.can_create,
-                'can_delete': permission.can_delete
+                'can_view': can_view,
+                'can_edit': can_edit,
+                'can_create': can_create,
+                'can_delete': can_delete
             }
         })
     
-    return Response(data)
+    return set_validators(Response(data), etag, last_modified)
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def pages_list(request):
     """Get all available pages"""
-    pages = Page.objects.all()
+    pages = get_page_registry().pages
     serializer = PageSerializer(pages, many=True)
     return Response(serializer.data)
 
 
+def _too_many_requests(error):
+    response = Response({"error": str(error)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response["Retry-After"] = str(error.retry_after)
+    return response
+
+
 @api_view(["POST"])
 @permission_classes([permissions.AllowAny])
 def login_view(request):
+    email = request.data.get("email")
+    try:
+        login_throttle.check_login(email, otp_store.client_ip(request))
+    except login_throttle.LoginThrottled as e:
+        return _too_many_requests(e)
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data["user"]
+        login_throttle.login_succeeded(email)
         refresh = RefreshToken.for_user(user)
         return Response(
             {
@@ -286,18 +590,91 @@ def login_view(request):
                 "user": UserProfileSerializer(user).data,
             }
         )
+    login_throttle.login_failed(email)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _json_body(request):
+    """The request's JSON object body, or None if it is not one"""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _hashing_busy():
+    response = JsonResponse({'error': HashingPoolSaturated.default_detail}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(hashing_pool.RETRY_AFTER)
+    return response
+
+
+async def async_login_view(request):
+    """
+    POST: Log in with email and password like login_view, with the password
+    check run in the bounded hashing pool (accounts/hashing_pool.py).
+    Answers 503 when the pool is saturated.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    data = _json_body(request)
+    if data is None or not data.get('email') or not data.get('password'):
+        return JsonResponse({'error': 'Email and password are required.'}, status=status.HTTP_400_BAD_REQUEST)
+    email, password = str(data['email']), str(data['password'])
+
+    try:
+        await sync_to_async(login_throttle.check_login)(email, otp_store.client_ip(request))
+    except login_throttle.LoginThrottled as e:
+        response = JsonResponse({'error': str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+
+    user = await User.objects.filter(email=email).afirst()
+    try:
+        if user is None:
+            # Hash anyway so unknown emails take as long as wrong passwords
+            await hashing_pool.run(make_password, password)
+            valid = False
+        else:
+            valid = await hashing_pool.run(check_password, password, user.password)
+    except HashingPoolSaturated:
+        return _hashing_busy()
+
+    if not valid or not user.is_active:
+        await sync_to_async(login_throttle.login_failed)(email)
+        return JsonResponse({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
+    await sync_to_async(login_throttle.login_succeeded)(email)
+    if needs_rehash(user.password):
+        try:
+            user.password = await hashing_pool.run(make_password, password)
+        except HashingPoolSaturated:
+            # The hash is upgraded on a later login instead
+            pass
+        else:
+            await user.asave(update_fields=['password'])
+    refresh = RefreshToken.for_user(user)
+    return JsonResponse({
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+        'user': UserProfileSerializer(user).data,
+    })
+
+
+# Plain Django views; in Django 4.2 @csrf_exempt cannot wrap async views
+async_login_view.csrf_exempt = True
+
+
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated])
 def logout_view(request):
     try:
         refresh_token = request.data.get("refresh_token")
-        token = RefreshToken(refresh_token)
+        if not refresh_token:
+            raise TokenError("No refresh token given")
+        token = RevocableRefreshToken(refresh_token)
         token.blacklist()
         return Response({"message": "Logout successful"}, status=status.HTTP_200_OK)
-    except Exception as e:
+    except TokenError:
         return Response({"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -318,15 +695,64 @@ def profile_update_view(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+async def change_password_view(request):
+    """
+    POST {old_password, new_password}: Change the authenticated user's
+    password, hashing in the bounded pool. Answers 503 when it is saturated.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    try:
+        authenticated = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except (AuthenticationFailed, InvalidToken) as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+    if authenticated is None:
+        return JsonResponse(
+            {'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED
+        )
+    user = authenticated[0]
+
+    data = _json_body(request)
+    if data is None or not data.get('old_password') or not data.get('new_password'):
+        return JsonResponse(
+            {'error': 'old_password and new_password are required.'}, status=status.HTTP_400_BAD_REQUEST
+        )
+    new_password = str(data['new_password'])
+    try:
+        await sync_to_async(validate_password)(new_password, user)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        if not await hashing_pool.run(check_password, str(data['old_password']), user.password):
+            return JsonResponse({'error': 'Invalid old password'}, status=status.HTTP_400_BAD_REQUEST)
+        user.password = await hashing_pool.run(make_password, new_password)
+    except HashingPoolSaturated:
+        return _hashing_busy()
+    await user.asave(update_fields=['password'])
+    return JsonResponse({'message': 'Password changed successfully'})
+
+
+change_password_view.csrf_exempt = True
+
+
 @api_view(["POST"])
 @permission_classes([permissions.AllowAny])
 def password_reset_request_view(request):
+    try:
+        otp_store.hit_request_limits(str(request.data.get("email", "")), otp_store.client_ip(request))
+    except otp_store.OTPRateLimited as e:
+        return _too_many_requests(e)
     serializer = PasswordResetRequestSerializer(data=request.data)
     if serializer.is_valid():
         email = serializer.validated_data["email"]
         user = User.objects.get(email=email)
-        otp_code = user.generate_otp()
-        # In a real app, send email with OTP
+        otp_code = otp_store.issue_otp(user)
+        enqueue_email(
+            'Password Reset OTP',
+            f'Your OTP for password reset is: {otp_code}',
+            [email],
+        )
         return Response(
             {
                 "message": "OTP sent to email",
@@ -339,13 +765,17 @@ def password_reset_request_view(request):
 @api_view(["POST"])
 @permission_classes([permissions.AllowAny])
 def verify_otp_view(request):
+    try:
+        otp_store.hit_check_limit(otp_store.client_ip(request))
+    except otp_store.OTPRateLimited as e:
+        return _too_many_requests(e)
     serializer = OTPVerificationSerializer(data=request.data)
     if serializer.is_valid():
         email = serializer.validated_data["email"]
         otp = serializer.validated_data["otp"]
         user = User.objects.get(email=email)
 
-        if user.verify_otp(otp):
+        if otp_store.verify_otp(user, otp):
             return Response({"message": "OTP verified successfully"})
         else:
             return Response(
@@ -357,6 +787,10 @@ def verify_otp_view(request):
 @api_view(["POST"])
 @permission_classes([permissions.AllowAny])
 def password_reset_confirm_view(request):
+    try:
+        otp_store.hit_check_limit(otp_store.client_ip(request))
+    except otp_store.OTPRateLimited as e:
+        return _too_many_requests(e)
     serializer = PasswordResetConfirmSerializer(data=request.data)
     if serializer.is_valid():
         email = serializer.validated_data["email"]
@@ -364,11 +798,9 @@ def password_reset_confirm_view(request):
         new_password = serializer.validated_data["new_password"]
 
         user = User.objects.get(email=email)
-        if user.otp_verified and user.verify_otp(otp):
-            user.set_password(new_password)
-            user.otp_code = None
-            user.otp_verified = False
-            user.save()
+        if otp_store.consume_otp(user, otp):
+            user.password = hashing_pool.run_sync(make_password, new_password)
+            user.save(update_fields=["password"])
             return Response({"message": "Password reset successful"})
         else:
             return Response(
@@ -436,6 +868,8 @@ def create_user(request):
                 'details': serializer.errors
             }, status=status.HTTP_400_BAD_REQUEST)
             
+    except HashingPoolSaturated:
+        raise
     except Exception as e:
         # Log the error for debugging
         print(f"Error creating user: {str(e)}")
@@ -458,6 +892,23 @@ def update_user(request, user_id):
         return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['POST'])
+@permission_classes([IsSuperAdminPermission])
+def restore_comment_view(request, comment_id):
+    """Bring back a deleted comment, including one already moved to the archive"""
+    comment = restore_comment(comment_id, request.user)
+    if comment is None:
+        raise Http404
+    return Response(CommentSerializer(comment).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsSuperAdminPermission])
+def login_throttle_stats_view(request):
+    """Login throttling totals shared by all workers, for monitoring"""
+    return Response(login_throttle.throttle_stats())
+
+
 @api_view(['DELETE'])
 @permission_classes([IsSuperAdminPermission])
 def delete_user(request, user_id):
@@ -476,6 +927,7 @@ def delete_user(request, user_id):
             UserPagePermission.objects.filter(user=user).delete()
             
             # Delete any comments by the user (if they exist)
+            forget_comments(Comment.objects.filter(user=user))
             Comment.objects.filter(user=user).delete()
             
             # Delete the user
@@ -552,6 +1004,70 @@ def update_user_permissions(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsSuperAdminPermission])
+def bulk_update_user_permissions(request):
+    """Upsert the same permission flags for every cell of a users x pages matrix"""
+    serializer = BulkPermissionMatrixSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    flags = {
+        'can_view': data['can_view'],
+        'can_edit': data['can_edit'],
+        'can_create': data['can_create'],
+        'can_delete': data['can_delete'],
+    }
+    user_roles = dict(User.objects.filter(id__in=data['user_ids']).values_list('id', 'role'))
+    page_ids = set(Page.objects.filter(id__in=data['page_ids']).values_list('id', flat=True))
+
+    results = []
+    cells = []
+    for user_id in data['user_ids']:
+        for page_id in data['page_ids']:
+            result = {'user_id': user_id, 'page_id': page_id}
+            if user_id not in user_roles:
+                result.update(status='error', error='User not found')
+            elif page_id not in page_ids:
+                result.update(status='error', error='Page not found')
+            elif user_roles[user_id] == 'superadmin':
+                # Don't update permissions for superadmin
+                result.update(status='skipped', error='Super admin permissions cannot be modified')
+            else:
+                cells.append((user_id, page_id))
+            results.append(result)
+
+    with transaction.atomic():
+        changed_users = {user_id for user_id, _ in cells}
+        existing = set(
+            UserPagePermission.objects.filter(
+                user_id__in=changed_users, page_id__in=page_ids
+            ).values_list('user_id', 'page_id')
+        )
+        UserPagePermission.objects.bulk_create(
+            [UserPagePermission(user_id=user_id, page_id=page_id, **flags) for user_id, page_id in cells],
+            update_conflicts=True,
+            unique_fields=['user', 'page'],
+            update_fields=['can_view', 'can_edit', 'can_create', 'can_delete', 'updated_at'],
+        )
+        # bulk_create does not send post_save, so invalidate the snapshots here
+        for user_id in changed_users:
+            invalidate_user_permissions(user_id)
+
+    for result in results:
+        if 'status' not in result:
+            cell = (result['user_id'], result['page_id'])
+            result['status'] = 'updated' if cell in existing else 'created'
+            result['permissions'] = flags
+
+    return Response({
+        'message': 'Permissions updated successfully',
+        'updated': len(cells),
+        'results': results,
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsSuperAdminPermission])
 def get_user_permissions(request, user_id):
@@ -571,6 +1087,88 @@ def get_user_permissions(request, user_id):
         return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+PERMISSION_MATRIX_DEFAULT_LIMIT = 1000
+PERMISSION_MATRIX_MAX_LIMIT = 10000
+
+
+def iter_permission_matrix(after, limit):
+    """
+    Yield one dict per user, ordered by user id, from a single streamed query.
+
+    Yields at most `limit` users; if more remain, a final {'next_after': id}
+    marker is yielded so the client can continue from there.
+    """
+    rows = (
+        UserPagePermission.objects.filter(user_id__gt=after)
+        .order_by('user_id', 'page_id')
+        .values_list(
+            'user_id', 'user__email', 'user__role', 'page_id',
+            'can_view', 'can_edit', 'can_create', 'can_delete',
+        )
+        .iterator(chunk_size=2000)
+    )
+    current = None
+    count = 0
+    for user_id, email, role, page_id, can_view, can_edit, can_create, can_delete in rows:
+        if current is None or current['user_id'] != user_id:
+            if current is not None:
+                yield current
+            if count == limit:
+                yield {'next_after': current['user_id']}
+                return
+            count += 1
+            current = {'user_id': user_id, 'email': email, 'role': role, 'permissions': {}}
+        current['permissions'][page_id] = {
+            'can_view': can_view,
+            'can_edit': can_edit,
+            'can_create': can_create,
+            'can_delete': can_delete,
+        }
+    if current is not None:
+        yield current
+
+
+def _ndjson_stream(items):
+    for item in items:
+        yield json.dumps(item) + '\n'
+
+
+def _chunked_json_stream(items):
+    yield '{"results": ['
+    next_after = None
+    first = True
+    for item in items:
+        if 'next_after' in item:
+            next_after = item['next_after']
+            continue
+        yield ('' if first else ',') + json.dumps(item)
+        first = False
+    yield '], "next_after": %s}' % json.dumps(next_after)
+
+
+@api_view(['GET'])
+@permission_classes([IsSuperAdminPermission])
+def permission_matrix_view(request):
+    """
+    Stream the whole users x pages permission matrix.
+
+    ?after=<user_id> continues from a previous chunk, ?limit caps the number of
+    users per response, and ?output=ndjson switches from chunked JSON to one
+    JSON object per line.
+    """
+    try:
+        after = int(request.query_params.get('after', 0))
+        limit = int(request.query_params.get('limit', PERMISSION_MATRIX_DEFAULT_LIMIT))
+    except ValueError:
+        return Response({'error': 'after and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, PERMISSION_MATRIX_MAX_LIMIT))
+
+    items = iter_permission_matrix(after, limit)
+    if request.query_params.get('output') == 'ndjson':
+        return StreamingHttpResponse(_ndjson_stream(items), content_type='application/x-ndjson')
+    return StreamingHttpResponse(_chunked_json_stream(items), content_type='application/json')
+
+
 # NEW VIEWS FOR SECTION 3 - PERMISSION MANAGEMENT
 
 
@@ -578,7 +1176,7 @@ def get_user_permissions(request, user_id):
 @permission_classes([permissions.IsAuthenticated])
 def pages_list_view(request):
     """List all available pages"""
-    pages = Page.objects.all()
+    pages = get_page_registry().pages
     serializer = PageSerializer(pages, many=True)
     return Response(serializer.data)
 
@@ -608,7 +1206,7 @@ def my_permissions_view(request):
     """Get current user's permissions"""
     if request.user.is_superadmin:
         # Super admin has all permissions
-        pages = Page.objects.all()
+        pages = get_page_registry().pages
         permissions_data = []
         for page in pages:
             permissions_data.append(
@@ -638,8 +1236,8 @@ def reset_user_password_view(request, user_id):
     serializer = UserCreationSerializer()
     new_password = serializer.generate_strong_password()
 
-    user.set_password(new_password)
-    user.save()
+    user.password = hashing_pool.run_sync(make_password, new_password)
+    user.save(update_fields=["password"])
 
     return Response(
         {"message": "Password reset successfully", "new_password": new_password}
@@ -663,6 +1261,24 @@ def check_page_permission_view(request, page_id, permission_type):
         return Response({"has_permission": False})
 
 
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+def batch_permission_check_view(request):
+    """Answer many (page, action) checks in one round trip from one permission snapshot"""
+    serializer = BatchPermissionCheckSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    results = []
+    for check in serializer.validated_data['checks']:
+        results.append({
+            'page': check['page'],
+            'action': check['action'],
+            'has_permission': user_has_permission(request.user, check['page'], check['action']),
+        })
+    return Response({'results': results})
+
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserCreationSerializer
@@ -681,6 +1297,8 @@ class UserViewSet(viewsets.ModelViewSet):
                     'user': UserProfileSerializer(user).data,
                     'password': request.data.get('password')  # Return the password for display
                 }, status=status.HTTP_201_CREATED)
+            except HashingPoolSaturated:
+                raise
             except Exception as e:
                 print(f"Error creating user: {str(e)}")
                 return Response({
@@ -715,6 +1333,7 @@ class UserViewSet(viewsets.ModelViewSet):
             UserPagePermission.objects.filter(user=user).delete()
             
             # Delete any comments by the user
+            forget_comments(Comment.objects.filter(user=user))
             Comment.objects.filter(user=user).delete()
             
             # Delete the user
@@ -736,14 +1355,19 @@ class PageViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def list(self, request):
-        pages = self.get_queryset()
+        # The router serves /pages/ from here, ahead of pages_list_view
+        registry = get_page_registry()
+        etag, last_modified = pages_validators(registry)
+        cached = not_modified(request, etag, last_modified)
+        if cached is not None:
+            return cached
         data = [{
             'id': page.id,
             'name': page.name,
             'description': page.description,
             'url': page.url
-        } for page in pages]
-        return Response(data)
+        } for page in registry.pages]
+        return set_validators(Response(data), etag, last_modified)
 
 @api_view(['POST'])
 @permission_classes([])
@@ -752,20 +1376,23 @@ def login_superadmin(request):
     password = request.data.get('password')
     
     try:
-        user = User.objects.get(email=email)
-        if not user.check_password(password):
-            return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
-        if user.role != 'superadmin':
-            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
-        
-        refresh = RefreshToken.for_user(user)
-        return Response({
-            'access': str(refresh.access_token),
-            'refresh': str(refresh),
-            'user': UserSerializer(user).data
-        })
-    except User.DoesNotExist:
+        login_throttle.check_login(email, otp_store.client_ip(request))
+    except login_throttle.LoginThrottled as e:
+        return _too_many_requests(e)
+    user = User.objects.filter(email=email).first()
+    if not hashing_pool.verify_password(user, password):
+        login_throttle.login_failed(email)
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
+    login_throttle.login_succeeded(email)
+    if user.role != 'superadmin':
+        return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    refresh = RefreshToken.for_user(user)
+    return Response({
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+        'user': UserSerializer(user).data
+    })
 
 @api_view(['POST'])
 @permission_classes([])
@@ -774,42 +1401,42 @@ def login_user(request):
     password = request.data.get('password')
     
     try:
-        user = User.objects.get(email=email)
-        if not user.check_password(password):
-            return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
-        if user.role == 'superadmin':
-            return Response({'error': 'Please use super admin login'}, status=status.HTTP_403_FORBIDDEN)
-        
-        refresh = RefreshToken.for_user(user)
-        return Response({
-            'access': str(refresh.access_token),
-            'refresh': str(refresh),
-            'user': UserSerializer(user).data
-        })
-    except User.DoesNotExist:
+        login_throttle.check_login(email, otp_store.client_ip(request))
+    except login_throttle.LoginThrottled as e:
+        return _too_many_requests(e)
+    user = User.objects.filter(email=email).first()
+    if not hashing_pool.verify_password(user, password):
+        login_throttle.login_failed(email)
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
-
-def generate_otp():
-    return ''.join(random.choices(string.digits, k=6))
+    login_throttle.login_succeeded(email)
+    if user.role == 'superadmin':
+        return Response({'error': 'Please use super admin login'}, status=status.HTTP_403_FORBIDDEN)
+    
+    refresh = RefreshToken.for_user(user)
+    return Response({
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+        'user': UserSerializer(user).data
+    })
 
 @api_view(['POST'])
 @permission_classes([])
 def request_password_reset(request):
     email = request.data.get('email')
     
+    try:
+        otp_store.hit_request_limits(str(email or ''), otp_store.client_ip(request))
+    except otp_store.OTPRateLimited as e:
+        return _too_many_requests(e)
     try:
         user = User.objects.get(email=email)
-        otp = generate_otp()
-        user.otp = otp
-        user.save()
+        otp = otp_store.issue_otp(user)
         
-        # Send OTP via email
-        send_mail(
+        # Sent by the outbox worker, see accounts/email_outbox.py
+        enqueue_email(
             'Password Reset OTP',
             f'Your OTP for password reset is: {otp}',
-            settings.DEFAULT_FROM_EMAIL,
             [email],
-            fail_silently=False,
         )
         
         return Response({'message': 'OTP sent successfully'})
@@ -822,9 +1449,13 @@ def verify_otp(request):
     email = request.data.get('email')
     otp = request.data.get('otp')
     
+    try:
+        otp_store.hit_check_limit(otp_store.client_ip(request))
+    except otp_store.OTPRateLimited as e:
+        return _too_many_requests(e)
     try:
         user = User.objects.get(email=email)
-        if user.otp != otp:
+        if not otp_store.verify_otp(user, otp):
             return Response({'error': 'Invalid OTP'}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'message': 'OTP verified successfully'})
     except User.DoesNotExist:
@@ -837,14 +1468,17 @@ def reset_password(request):
     otp = request.data.get('otp')
     new_password = request.data.get('new_password')
     
+    try:
+        otp_store.hit_check_limit(otp_store.client_ip(request))
+    except otp_store.OTPRateLimited as e:
+        return _too_many_requests(e)
     try:
         user = User.objects.get(email=email)
-        if user.otp != otp:
+        if not otp_store.consume_otp(user, otp, require_verified=False):
             return Response({'error': 'Invalid OTP'}, status=status.HTTP_400_BAD_REQUEST)
         
-        user.set_password(new_password)
-        user.otp = None  # Clear OTP after successful reset
-        user.save()
+        user.password = hashing_pool.run_sync(make_password, new_password)
+        user.save(update_fields=['password'])
         
         return Response({'message': 'Password reset successfully'})
     except User.DoesNotExist:
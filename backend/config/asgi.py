@@ -3,6 +3,11 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live comment event stream (accounts.views.comment_events_view) is an
+async streaming view and is only served through this application, e.g.
+``uvicorn config.asgi:application``. Run several workers with
+COMMENT_EVENTS_BROKER = 'database' so streams see every worker's events.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -66,6 +66,27 @@ DATABASES = {
     }
 }
 
+# The version keys in accounts/versioning.py tell workers that permissions,
+# pages, comment lists and revoked tokens changed, so a bump made by one
+# worker must be seen by all of them. A single worker (runserver, or
+# WEB_CONCURRENCY=1) uses the per-process LocMem cache. With more workers
+# (WEB_CONCURRENCY is the gunicorn/uvicorn worker count) set REDIS_URL, or
+# configure Memcached; startup fails with any other cache.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -82,6 +103,33 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# New passwords are hashed with the first hasher; the others verify older
+# hashes, which are upgraded on the user's next login. To hash with Argon2,
+# install argon2-cffi and move its hasher first. Costs are tuned below;
+# compare them with `manage.py bench_login`.
+#
+# Deployment cost: with scrypt first, every account still on PBKDF2 is
+# rehashed on its next login. That login hashes twice (the PBKDF2 check,
+# then scrypt) and saves the user row, so logins cost about double until
+# most active users have signed in once. Each scrypt hash also takes
+# 128 * N * r bytes, 16 MB at these settings, per pool thread. Upgrades
+# are skipped while the hashing pool is full and retried on a later login.
+# To spread the cost, deploy with the PBKDF2 hasher first and move scrypt
+# up at a quiet time.
+PASSWORD_HASHERS = [
+    'accounts.hashers.TunedScryptPasswordHasher',
+    'accounts.hashers.TunedPBKDF2PasswordHasher',
+    'accounts.hashers.TunedArgon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+PASSWORD_SCRYPT_WORK_FACTOR = 2**14
+PASSWORD_SCRYPT_BLOCK_SIZE = 8
+PASSWORD_SCRYPT_PARALLELISM = 1
+PASSWORD_PBKDF2_ITERATIONS = 600000
+PASSWORD_ARGON2_TIME_COST = 2
+PASSWORD_ARGON2_MEMORY_COST = 102400
+PASSWORD_ARGON2_PARALLELISM = 8
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -95,7 +143,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -120,7 +168,20 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    # Refresh tokens are checked against accounts/token_revocation.py
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.RevocableTokenRefreshSerializer',
 }
+
+# Seconds a worker reuses a user's row for JWT-authenticated requests
+# before reading it again (saves in the same worker take effect at once)
+JWT_USER_CACHE_TTL = 30
+
+# Sizing of each worker's bloom filter of revoked refresh tokens: the
+# number of unexpired revocations it is built for and its false positive
+# rate (each false positive costs one query on refresh)
+TOKEN_REVOCATION_CAPACITY = 100000
+TOKEN_REVOCATION_ERROR_RATE = 0.001
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -132,6 +193,16 @@ CORS_ALLOW_CREDENTIALS = True
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
 
+# Comment history storage: 'full' keeps the whole text on every row, 'delta'
+# stores diffs with a full snapshot every COMMENT_HISTORY_SNAPSHOT_INTERVAL rows
+COMMENT_HISTORY_STORAGE = 'delta'
+COMMENT_HISTORY_SNAPSHOT_INTERVAL = 10
+
+# Live comment events: 'local' fans out in memory within one ASGI worker,
+# 'database' polls the event table so several workers can serve streams
+COMMENT_EVENTS_BROKER = 'local'
+COMMENT_EVENTS_POLL_INTERVAL = 2
+
 # Email Configuration (for OTP sending - configure based on your email provider)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development
 # EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'  # For production
@@ -140,4 +211,37 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For developm
 # EMAIL_USE_TLS = True
 # EMAIL_HOST_USER = 'your-email@gmail.com'
 # EMAIL_HOST_PASSWORD = 'your-app-password'
-DEFAULT_FROM_EMAIL = 'noreply@yourdomain.com'
\ No newline at end of file
+DEFAULT_FROM_EMAIL = 'noreply@yourdomain.com'
+
+# Email is queued by the views and sent by `manage.py send_outbox_email`.
+# A failed message is retried after EMAIL_OUTBOX_RETRY_DELAY seconds,
+# doubling each time up to EMAIL_OUTBOX_MAX_RETRY_DELAY, and is given up
+# after EMAIL_OUTBOX_MAX_ATTEMPTS tries.
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 30
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 3600
+
+# Password reset codes (accounts/otp_store.py): lifetime in seconds, wrong
+# guesses allowed per code, and requests/checks allowed per email or IP
+# address in each OTP_RATE_WINDOW seconds
+OTP_TTL = 600
+OTP_MAX_FAILED_ATTEMPTS = 5
+OTP_RATE_WINDOW = 3600
+OTP_MAX_REQUESTS_PER_EMAIL = 5
+OTP_MAX_REQUESTS_PER_IP = 20
+OTP_MAX_CHECKS_PER_IP = 50
+
+# Login throttling (accounts/login_throttle.py). Counters are kept in a
+# SQLite file shared by the workers on this host; attempts are allowed
+# per IP address and failures per account, per sliding window in seconds.
+LOGIN_THROTTLE_STORE = BASE_DIR / 'login_throttle.sqlite3'
+LOGIN_THROTTLE_IP_LIMIT = 30
+LOGIN_THROTTLE_IP_WINDOW = 60
+LOGIN_THROTTLE_ACCOUNT_LIMIT = 10
+LOGIN_THROTTLE_ACCOUNT_WINDOW = 900
+
+# Password hashing runs in a bounded thread pool (accounts/hashing_pool.py).
+# None sizes it from the CPU count; jobs beyond the queue limit (running
+# plus waiting) are answered with 503.
+PASSWORD_HASHING_WORKERS = None
+PASSWORD_HASHING_QUEUE_LIMIT = None
@@ -3,23 +3,16 @@ from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from accounts.models import User, Page, UserPagePermission, Comment
-from accounts.serializers import CommentSerializer
+from django.db import transaction
+from accounts.models import User, UserPagePermission, Comment
+from accounts.serializers import CommentSerializer, comment_list_values, serialize_comment_rows
+from accounts.comment_stats import comment_created, comment_edited, comment_deleted
+from accounts.page_registry import get_page_registry
+from accounts.pagination import InvalidCursor, paginate_comments
 from accounts.views import user_has_permission
 
 # List of the 10 predefined pages
-PAGE_NAMES = [
-    'products_list',
-    'marketing_list', 
-    'order_list',
-    'media_plans',
-    'offer_pricing_skus',
-    'clients',
-    'suppliers',
-    'customer_support',
-    'sales_reports',
-    'finance_accounting'
-]
+PAGE_NAMES = [name for name, _ in Comment.PAGE_CHOICES]
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -41,19 +34,19 @@ def page_detail(request, page_name):
         )
     
     # Get page details
-    try:
-        page = Page.objects.get(name=page_name)
-    except Page.DoesNotExist:
-        # Create the page if it doesn't exist
-        page = Page.objects.create(
-            name=page_name,
-            description=f"Page for {page_name.replace('_', ' ').title()}",
-            url=f"/{page_name.replace('_', '-')}"
+    page = get_page_registry().get(page_name)
+    if page is None:
+        return Response(
+            {"error": "Page not found"}, 
+            status=status.HTTP_404_NOT_FOUND
         )
     
-    # Get comments for this page
+    # Get the first page of comments (or the one ?cursor points at)
     comments = Comment.objects.filter(page_name=page_name, is_deleted=False)
-    comment_serializer = CommentSerializer(comments, many=True)
+    try:
+        comments, next_cursor, previous_cursor = paginate_comments(comment_list_values(comments), request)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
     return Response({
         "page": {
@@ -62,7 +55,11 @@ def page_detail(request, page_name):
             "description": page.description,
             "url": page.url
         },
-        "comments": comment_serializer.data,
+        "comments": serialize_comment_rows(comments),
+        "comments_cursor": {
+            "next": next_cursor,
+            "previous": previous_cursor,
+        },
         "user_permissions": {
             "can_view": user_has_permission(request.user, page_name, "view"),
             "can_edit": user_has_permission(request.user, page_name, "edit"),
@@ -78,17 +75,12 @@ def pages_list(request):
     Get list of all pages with user permissions
     """
     pages_data = []
+    registry = get_page_registry()
     
     for page_name in PAGE_NAMES:
-        try:
-            page = Page.objects.get(name=page_name)
-        except Page.DoesNotExist:
-            # Create the page if it doesn't exist
-            page = Page.objects.create(
-                name=page_name,
-                description=f"Page for {page_name.replace('_', ' ').title()}",
-                url=f"/{page_name.replace('_', '-')}"
-            )
+        page = registry.get(page_name)
+        if page is None:
+            continue
         
         pages_data.append({
             "id": page.id,
@@ -126,7 +118,9 @@ def add_comment(request, page_name):
     
     serializer = CommentSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save(user=request.user, page_name=page_name)
+        with transaction.atomic():
+            comment = serializer.save(user=request.user, page_name=page_name)
+            comment_created(comment)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -154,7 +148,9 @@ def comment_detail(request, page_name, comment_id):
         
         serializer = CommentSerializer(comment, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save(modified_by=request.user)
+            with transaction.atomic():
+                comment = serializer.save(modified_by=request.user)
+                comment_edited(comment)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -167,7 +163,9 @@ def comment_detail(request, page_name, comment_id):
             )
         
         # Soft delete
-        comment.is_deleted = True
-        comment.save()
+        with transaction.atomic():
+            comment.is_deleted = True
+            comment.save()
+            comment_deleted(comment)
         
         return Response({"message": "Comment deleted successfully"})
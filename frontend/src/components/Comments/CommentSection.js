@@ -3,11 +3,14 @@ import { Form, Button, Card, Spinner, Alert, OverlayTrigger, Tooltip } from 'rea
 import { FaEdit, FaTrash, FaHistory } from 'react-icons/fa';
 import axios from 'axios';
 import { useAuth } from '../../contexts/AuthContext';
+import { commentAPI } from '../../services/api';
 import moment from 'moment';
 import './CommentSection.css';
 
 const CommentSection = ({ pageName }) => {
     const [comments, setComments] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [newComment, setNewComment] = useState('');
     const [editingComment, setEditingComment] = useState(null);
     const [editText, setEditText] = useState('');
@@ -25,7 +28,8 @@ const CommentSection = ({ pageName }) => {
     const fetchComments = useCallback(async () => {
         try {
             const response = await axios.get(`/api/auth/pages/${pageName}/comments`);
-            setComments(response.data);
+            setComments(response.data.results);
+            setNextCursor(response.data.next);
             setLoading(false);
         } catch (err) {
             console.error('Error fetching comments:', err);
@@ -34,6 +38,25 @@ const CommentSection = ({ pageName }) => {
         }
     }, [pageName]);
 
+    // Older comments come in keyset pages; "next" is the cursor of the following one
+    const fetchMoreComments = async () => {
+        setLoadingMore(true);
+        try {
+            const response = await axios.get(`/api/auth/pages/${pageName}/comments`, {
+                params: { cursor: nextCursor }
+            });
+            setComments(current => {
+                const seen = new Set(current.map(comment => comment.id));
+                return [...current, ...response.data.results.filter(comment => !seen.has(comment.id))];
+            });
+            setNextCursor(response.data.next);
+        } catch (err) {
+            console.error('Error fetching more comments:', err);
+            setError('Failed to load comments');
+        }
+        setLoadingMore(false);
+    };
+
     const fetchPermissions = useCallback(async () => {
         try {
             const response = await axios.get(`/api/auth/pages/${pageName}/permissions`);
@@ -54,6 +77,25 @@ const CommentSection = ({ pageName }) => {
         fetchPermissions();
     }, [fetchComments, fetchPermissions]);
 
+    // Apply live changes instead of refetching the whole list
+    useEffect(() => {
+        const source = commentAPI.subscribe([pageName], (type, event) => {
+            if (type === 'reset') {
+                fetchComments();
+            } else if (type === 'deleted') {
+                setComments(current => current.filter(comment => comment.id !== event.comment_id));
+            } else {
+                setComments(current => {
+                    const rest = current.filter(comment => comment.id !== event.comment_id);
+                    return type === 'created' && rest.length === current.length
+                        ? [event.comment, ...current]
+                        : current.map(comment => comment.id === event.comment_id ? event.comment : comment);
+                });
+            }
+        });
+        return () => source.close();
+    }, [pageName, fetchComments]);
+
     const fetchCommentHistory = async (commentId) => {
         try {
             const response = await axios.get(`/api/auth/comments/${commentId}/history`);
@@ -247,6 +289,18 @@ const CommentSection = ({ pageName }) => {
                     </Card>
                 ))}
             </div>
+
+            {nextCursor && (
+                <div className="text-center">
+                    <Button
+                        variant="outline-secondary"
+                        onClick={fetchMoreComments}
+                        disabled={loadingMore}
+                    >
+                        {loadingMore ? <Spinner animation="border" size="sm" /> : 'Load more comments'}
+                    </Button>
+                </div>
+            )}
         </div>
     );
 };
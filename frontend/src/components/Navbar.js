@@ -52,6 +52,11 @@ const Navbar = () => {
     }, []);
 
     const handleLogout = () => {
+        const refreshToken = localStorage.getItem('refresh_token');
+        if (refreshToken) {
+            // Revoke the refresh token; the local session ends either way
+            authAPI.logout(refreshToken).catch(() => {});
+        }
         localStorage.removeItem('token');
         localStorage.removeItem('refresh_token');
         localStorage.removeItem('user');
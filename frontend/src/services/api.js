@@ -35,6 +35,10 @@ api.interceptors.response.use(
             refresh: refreshToken
           });
           localStorage.setItem('token', response.data.access);
+          // Refresh tokens are single-use; keep the rotated one
+          if (response.data.refresh) {
+            localStorage.setItem('refresh_token', response.data.refresh);
+          }
           // Retry the original request
           error.config.headers.Authorization = `Bearer ${response.data.access}`;
           return api.request(error.config);
@@ -61,6 +65,9 @@ export const authAPI = {
   login: (email, password) => api.post('/accounts/login/', { email, password }),
   loginSuperAdmin: (email, password) => api.post('/accounts/login/superadmin/', { email, password }),
   loginUser: (email, password) => api.post('/accounts/login/user/', { email, password }),
+  logout: (refresh_token) => api.post('/accounts/logout/', { refresh_token }),
+  changePassword: (old_password, new_password) =>
+    api.post('/accounts/password/change/', { old_password, new_password }),
   getProfile: () => api.get('/accounts/profile/'),
   resetPassword: (email) => api.post('/accounts/password/reset/request/', { email }),
   verifyOTP: (email, otp) => api.post('/accounts/password/reset/verify/', { email, otp }),
@@ -80,6 +87,29 @@ export const userAPI = {
 export const permissionAPI = {
   getPages: () => api.get('/accounts/pages/'),
   updatePermissions: (data) => api.post('/accounts/permissions/update/', data),
+  getPermissionMatrix: (after = 0, limit = 1000) =>
+    api.get('/accounts/permissions/matrix/', { params: { after, limit } }),
+  checkPermissions: (checks) => api.post('/accounts/permissions/check/', { checks }),
+};
+
+export const commentAPI = {
+  getHistories: (commentIds, limit = 10) =>
+    api.post('/accounts/comments/history/', { comment_ids: commentIds, limit }),
+  // Soft-delete by ids and/or a filter: { comment_ids, page_name, user_id, created_after, created_before }
+  moderate: (criteria) => api.post('/accounts/comments/moderate/', criteria),
+  // Superadmin only; also brings back comments moved to the archive
+  restore: (commentId) => api.post(`/accounts/comments/${commentId}/restore/`),
+  // Live comment events; EventSource cannot send headers, so the token goes in the query.
+  // The browser reconnects on its own and resumes with Last-Event-ID. Call close() when done.
+  subscribe: (pages, onEvent) => {
+    const params = new URLSearchParams({ token: localStorage.getItem('token') || '' });
+    if (pages && pages.length) params.set('pages', pages.join(','));
+    const source = new EventSource(`${api.defaults.baseURL}/accounts/comments/events/?${params}`);
+    ['created', 'edited', 'deleted', 'reset'].forEach((type) =>
+      source.addEventListener(type, (event) => onEvent(type, JSON.parse(event.data)))
+    );
+    return source;
+  },
 };
 
 export default api;
\ No newline at end of file
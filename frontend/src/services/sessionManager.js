@@ -42,6 +42,9 @@ class SessionManager {
             refresh: refreshToken
           });
           localStorage.setItem('token', response.data.access);
+          if (response.data.refresh) {
+            localStorage.setItem('refresh_token', response.data.refresh);
+          }
         }
       } catch (error) {
         console.error('Token refresh failed:', error);